@@ -4,9 +4,21 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from fastapi import Request
-from src.api.router import router
+from src.api.router import router, v1_router, ws_router, health_router
 from src.pool import session_pool
+from src.cluster import cluster_router
+from src.service import job_manager, delete_queue, loop_monitor, image_cache, lifecycle
+from src.api.middleware import LoadShedMiddleware, TracingMiddleware
+from src.tracing import tracing
+from src.service.request_builder import get_builder
+from src.config import settings
+from loguru import logger
+from uvicorn.supervisors import Multiprocess
+from typing import Optional
+import asyncio
 import uvicorn
+import socket
+import os
 
 
 app = FastAPI(
@@ -23,6 +35,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(LoadShedMiddleware)
+# 最外层，减载与排空返回的 503 同样记录在链路中
+app.add_middleware(TracingMiddleware)
 
 app.mount("/static", StaticFiles(directory="src/static"), name="static")
 templates = Jinja2Templates(directory="src/templates")
@@ -36,9 +51,93 @@ async def index(request: Request):
 async def startup():
     # 暂时跳过自动获取游客Session，避免网络超时
     # await session_pool.fetch_guest_session(1)
+    # 预先构造各会话的上游请求参数与请求头
+    for session in session_pool.auth_sessions + session_pool.guest_sessions:
+        get_builder(session)
     print("服务启动成功，请配置 session.json 文件以使用登录模式")
+    tracing.setup()
+    cluster_router.start()
+    job_manager.start()
+    delete_queue.start()
+    if settings.loop_monitor_enabled:
+        loop_monitor.start()
+    lifecycle.install()
+    lifecycle.ready = True
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    lifecycle.ready = False
+    # 经过排空时在剩余时间内完成后台任务与待保存的数据，直接关闭时立即中断
+    timeout = lifecycle.remaining()
+    await asyncio.gather(job_manager.stop(timeout), delete_queue.stop(timeout), image_cache.flush(timeout))
+    await session_pool.flush()
+    await loop_monitor.stop()
+    await cluster_router.close()
+    tracing.shutdown()
+    # uvicorn 收到信号退出时不会删除传入的套接字文件
+    remove_uds()
 
 app.include_router(router, prefix="/api")
+app.include_router(v1_router, prefix="/v1")
+app.include_router(ws_router, prefix="/ws")
+app.include_router(health_router)
+
+
+# 本进程绑定的 Unix 域套接字文件 (路径, inode)
+bound_uds: Optional[tuple[str, int]] = None
+
+
+def bind_tcp(config: uvicorn.Config) -> socket.socket:
+    """绑定 TCP 端口，reuse_port 时新进程可以在本进程排空期间绑定同一端口并接管新连接"""
+    if not settings.reuse_port or not hasattr(socket, "SO_REUSEPORT"):
+        return config.bind_socket()
+    sock = socket.socket(socket.AF_INET6 if ":" in settings.host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((settings.host, settings.port))
+    sock.set_inheritable(True)
+    logger.info(f"监听 {settings.host}:{settings.port} (SO_REUSEPORT)")
+    return sock
+
+
+def bind_uds() -> socket.socket:
+    global bound_uds
+    os.makedirs(os.path.dirname(settings.uds) or ".", exist_ok=True)
+    # 清理上次异常退出遗留的套接字文件；旧进程仍在排空时由本进程接管该路径
+    if os.path.exists(settings.uds):
+        os.remove(settings.uds)
+    sock = uvicorn.Config(app, uds=settings.uds).bind_socket()
+    bound_uds = (settings.uds, os.stat(settings.uds).st_ino)
+    return sock
+
+
+def remove_uds():
+    """删除本进程创建的套接字文件，路径已被新进程接管时保留"""
+    if bound_uds and os.path.exists(bound_uds[0]) and os.stat(bound_uds[0]).st_ino == bound_uds[1]:
+        os.remove(bound_uds[0])
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=False)
+    if settings.workers > 1 and settings.store_url.startswith("memory://"):
+        # 多 worker 时进程内存储无法共享对话与会话的对应关系，改用 SQLite，子进程通过环境变量继承
+        os.environ["DOUBAO_STORE_URL"] = "sqlite:///data/session_state.db"
+        logger.warning("多 worker 模式下会话状态改用 SQLite 存储: data/session_state.db")
+    # 停止监听后等待进行中的响应(包括 SSE 流)最多 drain_timeout 秒
+    config = uvicorn.Config(
+        "app:app" if settings.workers > 1 else app,
+        host=settings.host,
+        port=settings.port,
+        workers=settings.workers,
+        timeout_graceful_shutdown=settings.drain_timeout
+    )
+    sockets = [bind_tcp(config)]
+    if settings.uds and hasattr(socket, "AF_UNIX"):
+        # 同时监听 TCP 端口与 Unix 域套接字
+        sockets.append(bind_uds())
+    if config.workers > 1:
+        # 各 worker 共享监听套接字；向主进程发送 SIGHUP 时逐个重启 worker: 旧 worker 排空退出后才启动新 worker，
+        # 期间由其余 worker 处理请求
+        Multiprocess(config, target=uvicorn.Server(config).run, sockets=sockets).run()
+        remove_uds()
+    else:
+        uvicorn.Server(config).run(sockets=sockets)
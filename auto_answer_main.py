@@ -3,10 +3,10 @@
 """
 
 import asyncio
+import threading
 import sys
 import os
 import subprocess
-import time
 from tkinter import messagebox
 from loguru import logger
 
@@ -72,46 +72,70 @@ class AutoAnswerApp:
     
     def on_start_api(self):
         """启动API服务"""
+        if self.controller.ai_service.embedded:
+            # 嵌入模式在本进程内直接调用，无需启动API服务
+            self.window.set_api_buttons_state(running=True)
+            self.window.append_log("✓ 使用嵌入模式，无需启动豆包API服务")
+            logger.info("使用嵌入模式调用豆包API")
+            return
+        
+        self.window.set_api_starting()
+        self.window.append_log("正在检查豆包API服务...")
+        # 检查与等待就绪最长需要几十秒，放到后台线程中执行，避免界面卡住
+        threading.Thread(target=self.start_api_service, daemon=True).start()
+    
+    def start_api_service(self):
+        """在后台线程中启动API服务并等待就绪，界面更新通过 root.after 交回界面线程执行"""
+        ui = self.window.root.after
         try:
-            self.window.append_log("正在检查豆包API服务...")
-            
             # 先检查API服务是否已经在运行
-            try:
-                import requests
-                response = requests.get("http://localhost:8000/docs", timeout=2)
-                if response.status_code == 200:
-                    self.window.set_api_buttons_state(running=True)
-                    self.window.append_log("✓ 豆包API服务已在运行")
-                    logger.info("豆包API服务已在运行")
-                    return
-            except:
-                pass  # API服务未运行，继续启动
+            if asyncio.run(self.controller.ai_service.is_ready()):
+                ui(0, self.on_api_started, "✓ 豆包API服务已在运行")
+                return
             
-            self.window.append_log("正在启动豆包API服务...")
+            ui(0, self.window.append_log, "正在启动豆包API服务...")
             
-            # 启动API服务进程
+            # 启动API服务进程，使用Unix域套接字时让服务同时监听该套接字
+            # 输出不会被读取，使用管道时日志写满缓冲区后服务会被阻塞
+            env = dict(os.environ)
+            if self.controller.ai_service.uds:
+                env["DOUBAO_UDS"] = self.controller.ai_service.uds
             self.api_process = subprocess.Popen(
                 [sys.executable, "app.py"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=os.path.dirname(__file__)
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                cwd=os.path.dirname(__file__),
+                env=env
             )
             
-            # 等待服务启动
-            time.sleep(3)
-            
-            # 检查进程是否还在运行
-            if self.api_process.poll() is None:
-                self.window.set_api_buttons_state(running=True)
-                self.window.append_log("✓ 豆包API服务已启动")
-                logger.info("豆包API服务已启动")
-            else:
+            # 轮询就绪检查，服务加载完会话后即可使用
+            process = self.api_process
+            ready = asyncio.run(self.controller.ai_service.wait_ready(
+                timeout=30, alive=lambda: process.poll() is None
+            ))
+            if ready:
+                ui(0, self.on_api_started, "✓ 豆包API服务已启动")
+                return
+            # 启动失败或超时时结束进程，避免遗留无法通过按钮停止的服务
+            self.api_process = None
+            if process.poll() is not None:
                 raise Exception("API服务启动失败")
+            process.terminate()
+            raise Exception("API服务启动超时")
                 
         except Exception as e:
-            self.window.append_log(f"✗ API服务启动失败: {e}")
-            messagebox.showerror("错误", f"API服务启动失败: {e}")
-            logger.error(f"API服务启动失败: {e}")
+            ui(0, self.on_api_start_failed, e)
+    
+    def on_api_started(self, message: str):
+        self.window.set_api_buttons_state(running=True)
+        self.window.append_log(message)
+        logger.info(message.lstrip("✓ "))
+    
+    def on_api_start_failed(self, e: Exception):
+        self.window.set_api_buttons_state(running=False)
+        self.window.append_log(f"✗ API服务启动失败: {e}")
+        messagebox.showerror("错误", f"API服务启动失败: {e}")
+        logger.error(f"API服务启动失败: {e}")
     
     def on_stop_api(self):
         """停止API服务"""
@@ -149,14 +173,8 @@ class AutoAnswerApp:
     
     def on_start_answering(self):
         """开始答题"""
-        # 检查API服务是否运行（通过实际请求检测）
-        try:
-            import requests
-            response = requests.get("http://localhost:8000/docs", timeout=2)
-            if response.status_code != 200:
-                messagebox.showerror("错误", "请先启动豆包API服务")
-                return
-        except:
+        # 检查API服务是否运行（通过实际请求检测，嵌入模式始终可用）
+        if not asyncio.run(self.controller.ai_service.is_ready()):
             messagebox.showerror("错误", "请先启动豆包API服务")
             return
         
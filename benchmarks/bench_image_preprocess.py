@@ -0,0 +1,54 @@
+"""
+上传图片预处理的基准：对比原图与预处理后的字节数，以及不同上行带宽下的总上传耗时(预处理 + 传输)
+运行: python -m benchmarks.bench_image_preprocess (需安装 Pillow)
+"""
+import io
+import random
+import timeit
+from PIL import Image, ImageDraw, ImageFont
+from src.service.imaging import preprocess_image
+
+# 上行带宽(Mbit/s)
+BANDWIDTHS = (5, 20, 100)
+
+
+def screenshot() -> bytes:
+    """2560x1440 的题目截图: 渐变背景上的抗锯齿文字、选项框与配图"""
+    image = Image.linear_gradient("L").resize((2560, 1440)).point(lambda v: 225 + v // 10).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=26)
+    rng = random.Random(0)
+    words = ["function", "数据", "select", "对象", "return", "题目", "value", "选项"]
+    for row in range(28):
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(8, 18)))
+        draw.text((60, 40 + row * 34), line, fill=(30, 30, 30), font=font)
+    for i in range(4):
+        draw.rectangle((80, 1000 + i * 100, 1200, 1070 + i * 100), outline=(60, 120, 220), width=3)
+        draw.text((100, 1020 + i * 100), f"{'ABCD'[i]}. " + " ".join(rng.choice(words) for _ in range(6)), fill=(30, 30, 30), font=font)
+    image.paste(Image.effect_noise((800, 600), 60).convert("RGB"), (1600, 800))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def photo() -> bytes:
+    """4032x3024 的照片: 平滑渐变叠加噪声，带 EXIF"""
+    base = Image.linear_gradient("L").resize((4032, 3024)).convert("RGB")
+    noise = Image.effect_noise((4032, 3024), 40).convert("RGB")
+    image = Image.blend(base, noise, 0.3)
+    exif = Image.Exif()
+    exif[0x0110] = "Phone Camera"
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95, exif=exif)
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    for name, data in (("screenshot.png", screenshot()), ("photo.jpg", photo())):
+        seconds = min(timeit.repeat(lambda: preprocess_image(name, data), number=3, repeat=3)) / 3
+        new_name, output = preprocess_image(name, data)
+        print(f"{name}: {len(data) / 1024:8.0f} KiB -> {new_name}: {len(output) / 1024:6.0f} KiB, 预处理 {seconds * 1000:6.1f} ms")
+        for mbps in BANDWIDTHS:
+            before = len(data) * 8 / (mbps * 1e6)
+            after = seconds + len(output) * 8 / (mbps * 1e6)
+            print(f"    {mbps:4d} Mbit/s 上传耗时 {before * 1000:8.1f} ms -> {after * 1000:8.1f} ms")
@@ -0,0 +1,84 @@
+"""
+上游请求构造的微基准：对比每次请求重新拼接参数/请求头/请求体与使用预构造的 SessionRequestBuilder
+运行: python -m benchmarks.bench_request_builder
+两者耗时在测量误差之内，预构造减少的是每次请求的内存分配(约 7.0 KB -> 3.2 KB)
+"""
+import json
+import uuid
+import timeit
+import tracemalloc
+from src.pool.session_pool import DoubaoSession
+from src.service.request_builder import get_builder
+
+SESSION = DoubaoSession(
+    cookie="sessionid=" + "x" * 600,
+    device_id="7400000000000000000",
+    tea_uuid="7400000000000000001",
+    web_id="7400000000000000001",
+    room_id="1234567890",
+    x_flow_trace="04-0000000000000000-0000000000000000-01"
+)
+PROMPT = "请识别图片中的选择题，并直接回答选项字母（A/B/C/D），只需要回答字母，不要解释。"
+ATTACHMENTS = [{"key": "tos-cn-i-a9rns2rl98/abc.png", "name": "question.png", "type": "vlm_image",
+                "file_review_state": 3, "file_parse_state": 3, "identifier": "abc",
+                "option": {"height": 600, "width": 800}}]
+
+
+def legacy():
+    """重构前 chat_completion 中每次请求的构造过程"""
+    session = SESSION
+    params = "&".join([
+        "aid=497858", f"device_id={session.device_id}", "device_platform=web", "language=zh",
+        "pc_version=3.3.5", "pkg_type=release_version", "real_aid=497858", "region=CN",
+        "samantha_web=1", "sys_region=CN", f"tea_uuid={session.tea_uuid}",
+        "use-olympus-account=1", "version_code=20800", f"web_id={session.web_id}"
+    ])
+    url = "https://www.doubao.com/samantha/chat/completion?" + params
+    body = {
+        "completion_option": {
+            "is_regen": False, "with_suggest": False, "need_create_conversation": False,
+            "launch_stage": 1, "use_auto_cot": False, "use_deep_think": False
+        },
+        "conversation_id": "123456789",
+        "messages": [{"content": json.dumps({"text": PROMPT}), "content_type": 2001,
+                      "attachments": ATTACHMENTS, "references": []}],
+        "section_id": "987654321",
+        "local_conversation_id": f"local_{int(uuid.uuid4().int % 10000000000000000)}",
+        "local_message_id": str(uuid.uuid4()),
+    }
+    headers = {
+        'content-type': 'application/json', 'accept': 'text/event-stream', 'agw-js-conv': 'str',
+        'cookie': session.cookie, 'origin': "https://www.doubao.com",
+        'referer': f"https://www.doubao.com/chat/{session.room_id}",
+        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36',
+        "x-flow-trace": session.x_flow_trace
+    }
+    # aiohttp 的 json= 参数最终同样会序列化为 bytes
+    return url, headers, json.dumps(body).encode('utf-8')
+
+
+def builder():
+    b = get_builder(SESSION)
+    body = b.completion_body(PROMPT, False, "123456789", "987654321", ATTACHMENTS)
+    return b.completion_url, b.completion_headers, body
+
+
+def peak_allocated(func, n: int = 5000) -> float:
+    """单次调用过程中的峰值内存分配(字节)"""
+    tracemalloc.start()
+    total = 0
+    for _ in range(n):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = func()
+        total += tracemalloc.get_traced_memory()[1] - base
+        del result
+    tracemalloc.stop()
+    return total / n
+
+
+if __name__ == "__main__":
+    assert json.loads(legacy()[2])["completion_option"] == json.loads(builder()[2])["completion_option"]
+    for name, func in (("legacy", legacy), ("builder", builder)):
+        seconds = min(timeit.repeat(func, number=20000, repeat=5)) / 20000
+        print(f"{name:8s} {seconds * 1e6:8.2f} us/req  {peak_allocated(func):8.0f} B/req peak allocation")
@@ -0,0 +1,63 @@
+"""
+响应序列化的微基准：对比 FastAPI 默认流程(按 response_model 校验 + 转换 + 标准库 json)与 FastJSONResponse
+运行: python -m benchmarks.bench_response_serialization
+"""
+import json
+import timeit
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from src.api.responses import FastJSONResponse
+from src.api.endpoints.chat import router
+from src.model.response import CompletionResponse, DeleteResponse
+
+RESPONSES = {
+    "/completions": CompletionResponse(
+        text="B",
+        img_urls=[],
+        conversation_id="node1:7412345678901234567",
+        messageg_id="7412345678901234568",
+        section_id="7412345678901234569"
+    ),
+    "/completions (long)": CompletionResponse(
+        text="深度思考的长回答，包含多段中文与代码。" * 200,
+        img_urls=[f"https://p3-flow-imagex-sign.byteimg.com/image/{i}.png~tplv-a9rns2rl98-image.png?x-signature=abc" for i in range(4)],
+        conversation_id="node1:7412345678901234567",
+        messageg_id="7412345678901234568",
+        section_id="7412345678901234569"
+    ),
+    "/delete": DeleteResponse(ok=True, msg=""),
+}
+
+
+def run(coroutine):
+    """is_coroutine=True 时 serialize_response 不会真正挂起，直接驱动协程，避免事件循环调度开销干扰计时"""
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("协程意外挂起")
+
+
+def response_field(path: str):
+    path = path.split(" ")[0]
+    return next(r.response_field for r in router.routes if isinstance(r, APIRoute) and r.path.endswith(path))
+
+
+if __name__ == "__main__":
+    for path, content in RESPONSES.items():
+        field = response_field(path)
+
+        def default():
+            value = run(serialize_response(field=field, response_content=content, is_coroutine=True))
+            return JSONResponse(value).body
+
+        def fast():
+            return FastJSONResponse(content).body
+
+        assert json.loads(default()) == json.loads(fast())
+        results = []
+        for name, func in (("default", default), ("fast", fast)):
+            seconds = min(timeit.repeat(func, number=5000, repeat=5)) / 5000
+            results.append(seconds)
+            print(f"{path:26s} {name:8s} {seconds * 1e6:8.2f} us/resp")
+        print(f"{'':26s} 加速 {results[0] / results[1]:.2f}x")
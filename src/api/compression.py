@@ -0,0 +1,152 @@
+import zlib
+import asyncio
+from contextlib import aclosing
+from typing import Optional, Dict, AsyncIterator, Union
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from src.config import settings
+from src.metrics import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 各编码的压缩级别，兼顾压缩率与 CPU 开销
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+def available_encodings() -> list[str]:
+    """配置中启用且依赖已安装的编码，按优先顺序"""
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    encodings = (e.strip().lower() for e in settings.compression_encodings.split(","))
+    return [e for e in encodings if installed.get(e)]
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """解析 Accept-Encoding，返回 编码 -> q 值"""
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def negotiate(request: Request) -> Optional[str]:
+    """选择客户端接受的 q 值最高的编码，q 值相同时按配置顺序，不压缩时返回 None"""
+    accepted = parse_accept_encoding(request.headers.get("accept-encoding", ""))
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class StreamCompressor:
+    """
+    流式压缩，每个分块压缩后立即刷新输出
+    分块之间共享压缩窗口，重复的事件结构仍能被压缩，同时客户端收到分块后就能解出对应的事件
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == "zstd":
+            self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.flush()
+        if self.encoding == "zstd":
+            return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+async def compress_response(request: Request, response: Response) -> Response:
+    """
+    按 Accept-Encoding 压缩完整响应
+    1. 小于 compression_min_size 的响应不压缩，压缩收益抵不过开销
+    2. 大于 compression_thread_size 的响应在线程中压缩，避免阻塞事件循环
+    """
+    if not settings.compression_encodings or "content-encoding" in response.headers:
+        return response
+    response.headers.append("vary", "Accept-Encoding")
+    encoding = negotiate(request)
+    if encoding is None or len(response.body) < settings.compression_min_size:
+        return response
+    if len(response.body) > settings.compression_thread_size:
+        body = await asyncio.to_thread(compress, encoding, response.body)
+    else:
+        body = compress(encoding, response.body)
+    metrics.inc("response_bytes_total", len(response.body), stage="raw", encoding=encoding)
+    metrics.inc("response_bytes_total", len(body), stage="compressed", encoding=encoding)
+    response.body = body
+    response.headers["content-encoding"] = encoding
+    response.headers["content-length"] = str(len(body))
+    return response
+
+
+def compress_stream(request: Request, response: StreamingResponse) -> StreamingResponse:
+    """按 Accept-Encoding 压缩流式响应，每个事件单独刷新，不增加逐字输出的延迟"""
+    if not settings.compression_encodings:
+        return response
+    response.headers.append("vary", "Accept-Encoding")
+    if (encoding := negotiate(request)) is None:
+        return response
+
+    async def compressed(iterator: AsyncIterator[Union[str, bytes]]) -> AsyncIterator[bytes]:
+        compressor = StreamCompressor(encoding)
+        async with aclosing(iterator):
+            async for chunk in iterator:
+                data = chunk.encode(response.charset) if isinstance(chunk, str) else chunk
+                output = compressor.compress(data)
+                metrics.inc("response_bytes_total", len(data), stage="raw", encoding=encoding)
+                metrics.inc("response_bytes_total", len(output), stage="compressed", encoding=encoding)
+                yield output
+        yield compressor.finish()
+
+    response.body_iterator = compressed(response.body_iterator)
+    response.headers["content-encoding"] = encoding
+    return response
+
+
+__all__ = [
+    "negotiate",
+    "compress_response",
+    "compress_stream"
+]
@@ -0,0 +1,61 @@
+import asyncio
+from typing import Awaitable, Optional, TypeVar
+from fastapi import Request, Response, HTTPException
+from loguru import logger
+from src.cluster import cluster_router
+from src.metrics import metrics
+
+T = TypeVar("T")
+
+
+async def wait_disconnect(request: Request):
+    """请求体读取完毕后，下一条 ASGI 消息只会是 http.disconnect"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    等待非流式请求完成，客户端提前断开时立即取消
+    取消会中断正在读取的上游流并释放会话槽位，避免为已离开的客户端继续占用资源
+    """
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        watcher.cancel()
+        raise
+    watcher.cancel()
+    if task in done:
+        return task.result()
+    task.cancel()
+    # 等待上游连接关闭、会话槽位释放
+    await asyncio.gather(task, return_exceptions=True)
+    metrics.inc("client_disconnect_total", mode="buffered")
+    logger.info(f"客户端已断开，取消请求: {request.url.path}")
+    # 499 Client Closed Request，客户端已经收不到该响应
+    raise HTTPException(status_code=499, detail="客户端已断开连接")
+
+
+async def route_or_cancel(
+    request: Request,
+    conversation_id: Optional[str],
+    params: Optional[dict] = None,
+    json: Optional[dict] = None
+) -> Optional[Response]:
+    """
+    对话属于其他节点时转发请求，否则返回 None 由本节点处理
+    等待目标节点响应期间客户端断开时取消转发，关闭到目标节点的连接，目标节点随之取消上游请求；
+    流式响应在客户端断开时由 StreamingResponse 取消读取并关闭连接
+    """
+    if not cluster_router.forward_target(request, conversation_id):
+        return None
+    return await cancel_on_disconnect(request, cluster_router.route(request, conversation_id, params=params, json=json))
+
+
+__all__ = [
+    "cancel_on_disconnect",
+    "route_or_cancel"
+]
@@ -1,54 +1,170 @@
-from fastapi import APIRouter, Body, Query, HTTPException
-from src.service import chat_completion, delete_conversation
+import json
+import base64
+import asyncio
+from typing import List
+from fastapi import APIRouter, Body, Query, HTTPException, Request, Depends
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.datastructures import UploadFile
+from src.config import settings
+from src.service import (
+    complete, stream_complete, batch_completion, delete_conversation, delete_queue, upload_file, upload_attachments
+)
+from src.cluster import cluster_router
+from src.metrics import metrics
+from src.api.disconnect import cancel_on_disconnect, route_or_cancel
+from src.api.responses import FastJSONResponse
+from src.api.compression import compress_response, compress_stream
 from src.model.response import CompletionResponse, DeleteResponse
-from src.model.request import CompletionRequest
+from src.model.request import CompletionRequest, InlineFile
 
 
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
 
+# /completions 同时接受 JSON 与 multipart 请求体，在文档中分别说明
+COMPLETION_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"$ref": "#/components/schemas/CompletionRequest"}},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["request"],
+                    "properties": {
+                        "request": {"type": "string", "description": "CompletionRequest 的 JSON"},
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+}
 
-@router.post("/completions", response_model=CompletionResponse)
-async def api_completions(completion: CompletionRequest = Body()):
+
+async def completion_body(request: Request) -> CompletionRequest:
+    """
+    解析补全请求体
+    1. application/json: CompletionRequest，内联文件放在 files 中(base64)
+    2. multipart/form-data: request 字段为 CompletionRequest 的 JSON，files 字段为文件，image/* 按图片上传
+    3. 对话属于其他节点时 multipart 文件不在本节点上传，转为内联文件随请求转发，由对话所属节点的会话上传
+    """
+    try:
+        if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+            return CompletionRequest.model_validate_json(await request.body())
+        form = await request.form()
+        completion = CompletionRequest.model_validate_json(form.get("request") or "{}")
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    files = [file for file in form.getlist("files") if isinstance(file, UploadFile)]
+    if files and cluster_router.forward_target(request, completion.conversation_id):
+        inline = [
+            InlineFile(
+                file_type=2 if (file.content_type or "").startswith("image/") else 1,
+                file_name=file.filename,
+                data=(await asyncio.to_thread(base64.b64encode, await file.read())).decode("ascii")
+            )
+            for file in files
+        ]
+        return completion.model_copy(update={"files": completion.files + inline})
+    uploads = []
+    for file in files:
+        file_type = 2 if (file.content_type or "").startswith("image/") else 1
+        uploads.append(upload_file(file_type, file.filename, await file.read()))
+    if not uploads:
+        return completion
+    try:
+        attachments = await upload_attachments(uploads)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成文件失败：{str(e)}")
+    return completion.model_copy(update={"attachments": completion.attachments + attachments})
+
+
+@router.post("/completions", response_model=CompletionResponse, openapi_extra=COMPLETION_BODY)
+async def api_completions(request: Request, completion: CompletionRequest = Depends(completion_body)):
     """
     豆包聊天补全接口(目前仅支持文字消息e和图片消息)
     1. 如果是新聊天 conversation_id, section_id**不填**
     2. 如果沿用之前的聊天, 则沿用**第一次对话**返回的 conversation_id 和 section_id, 会话池会使用之前的参数
     3. 目前如果使用未登录账号，那么不支持上下文
+    4. 客户端断开连接时立即取消上游请求
+    5. stream 为 true 时以 SSE 返回 meta / text / image 增量事件，最后的 end 事件包含完整响应
+    6. 文件可随请求一起提交(JSON 的 files 字段或 multipart)，并发上传完成后再开始补全
+    7. 按 Accept-Encoding 以 zstd / br / gzip 压缩响应，流式响应逐个事件刷新
     """
+    # 多节点部署时，沿用的对话转发到创建它的节点
+    if response := await route_or_cancel(request, completion.conversation_id, json=completion.model_dump()):
+        if isinstance(response, StreamingResponse):
+            return compress_stream(request, response)
+        return await compress_response(request, response)
+    if completion.stream:
+        return compress_stream(request, StreamingResponse(sse_stream(completion), media_type="text/event-stream"))
     try:
-        text, imgs, conv_id, msg_id, sec_id = await chat_completion(
-            prompt=completion.prompt,
-            guest=completion.guest,
-            conversation_id=completion.conversation_id,
-            section_id=completion.section_id,
-            attachments=completion.attachments,
-            use_auto_cot=completion.use_auto_cot,
-            use_deep_think=completion.use_deep_think
-        )
-        return CompletionResponse(
-            text=text, 
-            img_urls=imgs, 
-            conversation_id=conv_id, 
-            messageg_id=msg_id, 
-            section_id=sec_id
-            )
+        response = FastJSONResponse(await cancel_on_disconnect(request, complete(completion)))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return await compress_response(request, response)
+
+
+
+async def sse_stream(completion: CompletionRequest):
+    try:
+        async for delta in stream_complete(completion):
+            yield f"data: {json.dumps(delta, ensure_ascii=False)}\n\n"
+    except asyncio.CancelledError:
+        metrics.inc("client_disconnect_total", mode="stream")
+        raise
+    except HTTPException as e:
+        yield f"event: error\ndata: {json.dumps({'status': e.status_code, 'detail': e.detail}, ensure_ascii=False)}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'status': 500, 'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+
+@router.post("/completions/batch")
+async def api_completions_batch(completions: List[CompletionRequest] = Body()):
+    """
+    批量聊天补全，请求体为 CompletionRequest 数组
+    1. 以 NDJSON 逐行返回，按完成先后顺序而非请求顺序，index 为对应请求的下标
+    2. 单条失败不影响其他请求，失败项 ok 为 false 并附带 status 与 error
+    """
+    if len(completions) > settings.batch_max_size:
+        raise HTTPException(status_code=413, detail=f"单次批量请求最多 {settings.batch_max_size} 条")
+
+    async def ndjson():
+        try:
+            async for item in batch_completion(completions):
+                yield item.model_dump_json() + "\n"
+        except asyncio.CancelledError:
+            metrics.inc("client_disconnect_total", mode="batch")
+            raise
 
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 @router.post("/delete", response_model=DeleteResponse)
-async def api_delete(conversation_id: str = Query()):
+async def api_delete(request: Request, conversation_id: str = Query(), background: bool = Query(False)):
     """
     删除聊天
     1. conversation_id 不存在也会提示成功
     2. 建议在聊天结束时都调用函数，避免创建过多对话
+    3. background 为 true 时加入后台删除队列后立即返回
     """
+    params = {"conversation_id": conversation_id, "background": background}
+    if response := await route_or_cancel(request, conversation_id, params=params):
+        return response
+    if background:
+        queued = await delete_queue.enqueue(cluster_router.decode(conversation_id)[1])
+        return FastJSONResponse(DeleteResponse(ok=True, msg="已加入删除队列" if queued else "对话不存在"))
     try:
-        ok, msg = await delete_conversation(conversation_id)
-        return DeleteResponse(
+        ok, msg = await delete_conversation(cluster_router.decode(conversation_id)[1])
+        return FastJSONResponse(DeleteResponse(
             ok=ok,
             msg=msg
-        )
+        ))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Body, Depends, HTTPException
+from src.cluster import cluster_router
+from src.service import lifecycle
+from src.model.request import ClusterMembersRequest
+from src.model.response import ClusterMembersResponse
+from src.api.responses import FastJSONResponse
+from .debug import require_admin
+
+
+router = APIRouter(default_response_class=FastJSONResponse)
+
+
+@router.get("/ping")
+async def api_ping():
+    """节点存活探测，排空期间返回 503，其他节点不再把新对话转发到本节点"""
+    if lifecycle.draining:
+        raise HTTPException(status_code=503, detail="节点正在退出")
+    return {"node_id": cluster_router.node_id}
+
+
+@router.get("/members", response_model=ClusterMembersResponse)
+async def api_members():
+    """查看集群成员"""
+    return FastJSONResponse(ClusterMembersResponse(
+        node_id=cluster_router.node_id,
+        members=cluster_router.members,
+        alive=list(cluster_router.nodes)
+    ))
+
+
+@router.put("/members", response_model=ClusterMembersResponse, dependencies=[Depends(require_admin)])
+async def api_set_members(members: ClusterMembersRequest = Body()):
+    """
+    更新集群成员，需要管理令牌(未配置 admin_token 时不可用)
+    1. 各节点需要提交相同的成员列表，一致性哈希环随之重新平衡
+    2. 已带节点标识的对话仍然路由到原节点
+    """
+    cluster_router.set_members(members.nodes)
+    cluster_router.start()
+    return await api_members()
@@ -0,0 +1,67 @@
+import hmac
+import asyncio
+import threading
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response
+from src.config import settings
+from src.service import cpu_profiler, memory_profiler, collapsed, flamegraph
+from src.model.response import MemorySnapshotResponse
+from src.api.responses import FastJSONResponse
+
+
+def require_admin(authorization: str = Header("")):
+    """管理接口需要 Authorization: Bearer <admin_token>，未配置令牌时视为不存在"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode('utf-8'), settings.admin_token.encode('utf-8')):
+        raise HTTPException(status_code=401, detail="管理令牌无效", headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(
+    default_response_class=FastJSONResponse,
+    dependencies=[Depends(require_admin)],
+    include_in_schema=bool(settings.admin_token)
+)
+
+
+@router.get("/profile/cpu")
+async def api_profile_cpu(
+    seconds: float = Query(10, gt=0),
+    format: str = Query("collapsed", pattern="^(collapsed|svg)$"),
+    all_threads: bool = Query(False)
+):
+    """
+    对运行中的进程做统计采样 CPU 分析
+    1. 采样 seconds 秒(不超过 profile_max_seconds)，默认只采样事件循环线程，all_threads 为 true 时包含线程池
+    2. format=collapsed 返回 flamegraph.pl / speedscope 可读取的折叠堆栈，format=svg 返回火焰图
+    """
+    # 接口在事件循环线程中执行，采样在线程池中进行，不阻塞事件循环
+    thread_ids = None if all_threads else [threading.get_ident()]
+    stacks = await asyncio.to_thread(cpu_profiler.run, seconds, thread_ids)
+    if format == "svg":
+        return Response(flamegraph(stacks, f"CPU {seconds}s"), media_type="image/svg+xml")
+    return PlainTextResponse(collapsed(stacks))
+
+
+@router.post("/tracemalloc/start")
+async def api_tracemalloc_start(frames: int = Query(10, ge=1, le=100)):
+    """开启 tracemalloc，frames 为记录的调用栈深度；开启期间所有内存分配都有额外开销"""
+    memory_profiler.start(frames)
+    return {"tracing": True}
+
+
+@router.post("/tracemalloc/stop")
+async def api_tracemalloc_stop():
+    """关闭 tracemalloc 并释放已记录的快照"""
+    memory_profiler.stop()
+    return {"tracing": False}
+
+
+@router.get("/tracemalloc/snapshot", response_model=MemorySnapshotResponse)
+async def api_tracemalloc_snapshot(
+    key: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """获取内存快照，返回占用最多的 limit 个位置，以及与上一次快照相比增长最多的位置"""
+    return FastJSONResponse(await asyncio.to_thread(memory_profiler.snapshot, key, limit))
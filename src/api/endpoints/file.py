@@ -1,15 +1,32 @@
 from fastapi import APIRouter, Body, Query, HTTPException
-from src.service import upload_file
+from src.service import upload_file, upload_from_url
+from src.model.request import UploadUrlRequest
 from src.model.response import UploadResponse
+from src.api.responses import FastJSONResponse
 
 
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
 
 
 @router.post("/upload", response_model=UploadResponse)
 async def api_upload(file_type: int = Query(), file_name: str = Query(), file_bytes: bytes = Body()):
     """上传图片或文件到豆包服务器"""
     try:
-        return await upload_file(file_type, file_name, file_bytes)
+        return FastJSONResponse(await upload_file(file_type, file_name, file_bytes))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成文件失败：{str(e)}")
+
+
+@router.post("/upload_url", response_model=UploadResponse)
+async def api_upload_url(upload: UploadUrlRequest = Body()):
+    """
+    从 URL 或服务器本地路径转存文件到豆包服务器，无需客户端先下载再上传
+    1. 远程文件边下载边计算校验值，超过内存阈值的部分写入临时文件
+    2. 本地路径需位于 DOUBAO_UPLOAD_LOCAL_DIRS 配置的目录之下
+    """
+    try:
+        return FastJSONResponse(await upload_from_url(upload.file_type, upload.url, upload.file_name))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成文件失败：{str(e)}")
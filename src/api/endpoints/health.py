@@ -0,0 +1,71 @@
+from fastapi import APIRouter
+from src.pool import session_pool
+from src.service import lifecycle, loop_monitor, job_manager, delete_queue, adaptive_limiter
+from src.model.response import HealthResponse, ReadyResponse, SessionHealth
+from src.api.responses import FastJSONResponse
+
+
+router = APIRouter(default_response_class=FastJSONResponse)
+
+
+def readiness() -> ReadyResponse:
+    """只读取进程内状态，不访问会话存储"""
+    if lifecycle.draining:
+        status = "draining"
+    elif not lifecycle.ready:
+        status = "starting"
+    elif loop_monitor.overloaded:
+        status = "overloaded"
+    else:
+        status = "ok"
+    return ReadyResponse(status=status, ready=status == "ok")
+
+
+async def health_report() -> HealthResponse:
+    inflight = await session_pool.store.inflight([s.key for s in session_pool.auth_sessions + session_pool.guest_sessions])
+    sessions = [
+        SessionHealth(
+            key=session.key,
+            guest=guest,
+            circuit=session_pool.circuit_state(session),
+            failures=session_pool.health.get(session.key, (0, 0))[0],
+            inflight=inflight[session.key]
+        )
+        for guest, group in ((False, session_pool.auth_sessions), (True, session_pool.guest_sessions))
+        for session in group
+    ]
+    healthy = sum(1 for s in sessions if s.circuit != "open")
+    ready = readiness()
+    return HealthResponse(
+        status="degraded" if ready.status == "ok" and not healthy else ready.status,
+        ready=ready.ready,
+        healthy_sessions=healthy,
+        sessions=sessions,
+        queues={
+            "jobs": job_manager.queue.qsize() if job_manager.queue else 0,
+            "jobs_running": len(job_manager.running),
+            "delete": await delete_queue.size(),
+            "limiter": len(adaptive_limiter.waiters)
+        },
+        loop_lag=loop_monitor.lag,
+        loop_lag_ewma=loop_monitor.lag_ewma,
+        loop_stalled=loop_monitor.stalled
+    )
+
+
+@router.get("/healthz", response_model=HealthResponse)
+async def api_healthz():
+    """存活检查，能够响应即返回 200，响应中包含会话熔断状态、队列长度与事件循环延迟"""
+    return FastJSONResponse(await health_report())
+
+
+@router.get("/readyz", response_model=ReadyResponse)
+async def api_readyz():
+    """
+    就绪检查，只读取进程内状态，可以高频调用；详细状态见 /healthz
+    1. 会话加载完成、后台任务启动后返回 200
+    2. 启动完成前、排空(准备退出)期间以及事件循环过载减载时返回 503，负载均衡据此摘除本节点
+    3. 没有可用会话时仍视为就绪(全部会话暂停时请求会退回使用暂停中的会话)
+    """
+    ready = readiness()
+    return FastJSONResponse(ready, status_code=200 if ready.ready else 503)
@@ -0,0 +1,29 @@
+import mimetypes
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from src.service import image_cache
+from src.cluster import cluster_router
+from src.api.disconnect import route_or_cancel
+
+
+router = APIRouter()
+
+
+@router.get("/{image_id}")
+async def api_image(request: Request, image_id: str):
+    """
+    获取生成的图片
+    1. 图片在生成时已于后台缓存到磁盘，不再访问上游 CDN
+    2. 支持 ETag 条件请求与 Range 分段请求
+    3. 多节点部署时图片 ID 带有节点标识，请求转发到缓存该图片的节点
+    """
+    etag = f'"{image_id}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"etag": etag})
+    if response := await route_or_cancel(request, image_id):
+        return response
+    if not (path := await image_cache.get(cluster_router.decode(image_id)[1])):
+        raise HTTPException(status_code=404, detail=f"图片不存在: {image_id}")
+    # 同一 ID 的图片内容不会变化
+    headers = {"etag": etag, "cache-control": "public, max-age=31536000, immutable"}
+    return FileResponse(path, media_type=mimetypes.guess_type(path)[0], headers=headers)
@@ -0,0 +1,73 @@
+from fastapi import APIRouter, Body, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from src.cluster import cluster_router
+from src.api.disconnect import route_or_cancel
+from src.service import job_manager, FINISHED_STATUS
+from src.model.request import CompletionRequest
+from src.model.response import JobResponse
+from src.api.responses import FastJSONResponse
+
+
+router = APIRouter(default_response_class=FastJSONResponse)
+
+
+def encode_job(job: JobResponse) -> JobResponse:
+    return job.model_copy(update={"job_id": cluster_router.encode(job.job_id)})
+
+
+@router.post("/completions", response_model=JobResponse)
+async def api_job_completions(request: Request, completion: CompletionRequest = Body()):
+    """
+    提交后台补全任务，参数与 /api/chat/completions 相同
+    1. 立即返回 job_id，适用于耗时较长的深度思考
+    2. 通过 /api/job/{job_id} 轮询(可带 wait 参数长轮询)或 /api/job/{job_id}/events 订阅结果
+    3. 任务结果在服务端保留一段时间后自动过期
+    """
+    if response := await route_or_cancel(request, completion.conversation_id, json=completion.model_dump()):
+        return response
+    return FastJSONResponse(encode_job(await job_manager.submit(completion)))
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def api_job(request: Request, job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """查询任务状态，wait > 0 时最多等待 wait 秒直到任务结束"""
+    if response := await route_or_cancel(request, job_id, params={"wait": wait}):
+        return response
+    if not (job := await job_manager.wait(cluster_router.decode(job_id)[1], wait)):
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+    return FastJSONResponse(encode_job(job))
+
+
+@router.get("/{job_id}/events")
+async def api_job_events(request: Request, job_id: str):
+    """以 SSE 订阅任务状态变化，任务结束后推送结果并关闭连接"""
+    if response := await route_or_cancel(request, job_id):
+        return response
+    raw_id = cluster_router.decode(job_id)[1]
+    if not await job_manager.get(raw_id):
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+
+    async def event_stream():
+        status = None
+        while job := await job_manager.get(raw_id):
+            if job.status != status:
+                status = job.status
+                yield f"event: {status}\ndata: {encode_job(job).model_dump_json()}\n\n"
+            if status in FINISHED_STATUS:
+                break
+            # 定期发送注释行保持连接
+            if (job := await job_manager.wait(raw_id, 15, until_finished=False)) and job.status == status:
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@router.post("/cancel", response_model=JobResponse)
+async def api_job_cancel(request: Request, job_id: str = Query()):
+    """取消任务，执行中的任务会立即中断上游请求"""
+    if response := await route_or_cancel(request, job_id, params={"job_id": job_id}):
+        return response
+    if not (job := await job_manager.cancel(cluster_router.decode(job_id)[1])):
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+    # 等待执行中的任务完成取消
+    return FastJSONResponse(encode_job(await job_manager.wait(job.job_id, 1) or job))
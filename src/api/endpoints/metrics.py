@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from src.metrics import metrics
+
+
+router = APIRouter()
+
+
+@router.get("", response_class=PlainTextResponse)
+async def api_metrics():
+    """Prometheus 格式的运行指标"""
+    return metrics.render()
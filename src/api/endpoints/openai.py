@@ -0,0 +1,52 @@
+import asyncio
+from fastapi import APIRouter, Body, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from src.service import MODELS, openai_completion, openai_completion_stream, openai_route_key
+from src.metrics import metrics
+from src.api.disconnect import cancel_on_disconnect, route_or_cancel
+from src.api.responses import FastJSONResponse
+from src.model.request import OpenAIChatRequest
+from src.model.response import OpenAIModel, OpenAIModelList
+
+
+router = APIRouter(default_response_class=FastJSONResponse)
+
+
+@router.get("/models", response_model=OpenAIModelList)
+async def api_models():
+    """OpenAI 兼容的模型列表"""
+    return FastJSONResponse(OpenAIModelList(data=[OpenAIModel(id=model) for model in MODELS]))
+
+
+@router.post("/chat/completions")
+async def api_chat_completions(raw_request: Request, request: OpenAIChatRequest = Body()):
+    """
+    OpenAI 兼容的聊天补全接口
+    1. 模型: doubao / doubao-thinking(深度思考) / doubao-auto(自动选择深度思考)
+    2. 客户端带着完整历史继续提问时，会沿用之前创建的豆包对话，只发送最后一条消息
+    3. 也可以通过扩展字段 conversation_id / section_id 显式指定对话
+    4. 多节点部署时转发到对话所在的节点，见 openai_route_key
+    """
+    if response := await route_or_cancel(raw_request, openai_route_key(request), json=request.model_dump()):
+        return response
+    try:
+        if request.stream:
+            # 先校验请求，错误以 HTTP 状态码返回
+            stream = openai_completion_stream(request)
+            first = await stream.__anext__()
+
+            async def chunks():
+                try:
+                    yield first
+                    async for item in stream:
+                        yield item
+                except asyncio.CancelledError:
+                    metrics.inc("client_disconnect_total", mode="stream")
+                    raise
+
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+        return FastJSONResponse(await cancel_on_disconnect(raw_request, openai_completion(request)))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,189 @@
+import json
+import asyncio
+from typing import Optional, Tuple
+from fastapi import APIRouter, WebSocket, HTTPException, Query
+from pydantic import ValidationError
+from loguru import logger
+from src.config import settings
+from src.cluster import cluster_router
+from src.metrics import metrics
+from src.pool import session_pool, DoubaoSession
+from src.service import stream_complete, delete_queue, lifecycle
+from src.model.request import CompletionRequest, ChatTurnRequest
+
+
+router = APIRouter()
+
+
+class ChatSocket:
+    """
+    一个 WebSocket 连接上的多轮对话
+    1. 连接保存 conversation_id / section_id 与对话所属的 DoubaoSession，每轮只需发送 prompt
+    2. 消息经有界队列由单独的任务发送，队列满时暂停读取上游；单条消息超过 ws_send_timeout 未发出时断开
+    3. 定期发送 ping，超过 ws_idle_timeout 未收到客户端任何消息时断开
+    """
+    active = 0
+
+    def __init__(self, websocket: WebSocket, guest: bool, conversation_id: Optional[str], section_id: Optional[str], ephemeral: bool):
+        self.websocket = websocket
+        self.guest = guest
+        self.conversation_id = conversation_id
+        self.section_id = section_id
+        self.ephemeral = ephemeral
+        self.session: Optional[DoubaoSession] = None
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+        self.turn: Optional[asyncio.Task] = None
+        self.last_received = 0.0
+
+    async def send(self, message: dict):
+        await self.outbox.put(json.dumps(message, ensure_ascii=False))
+
+    async def error(self, status: int, detail):
+        await self.send({"type": "error", "status": status, "detail": detail})
+
+    async def sender(self) -> Tuple[int, str]:
+        while True:
+            message = await self.outbox.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(message), settings.ws_send_timeout)
+            except asyncio.TimeoutError:
+                metrics.inc("ws_closed_total", reason="slow_consumer")
+                return 1008, "客户端读取过慢"
+
+    async def heartbeat(self) -> Tuple[int, str]:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(settings.ws_heartbeat_interval)
+            if loop.time() - self.last_received > settings.ws_idle_timeout:
+                metrics.inc("ws_closed_total", reason="idle")
+                return 1001, "心跳超时"
+            await self.send({"type": "ping"})
+
+    async def receiver(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                metrics.inc("ws_closed_total", reason="client")
+                return None
+            self.last_received = loop.time()
+            try:
+                data = json.loads(message.get("text") or message.get("bytes") or "")
+            except ValueError:
+                await self.error(400, "消息不是有效的 JSON")
+                continue
+            kind = data.get("type", "turn") if isinstance(data, dict) else None
+            if kind == "pong":
+                continue
+            if kind == "ping":
+                await self.send({"type": "pong"})
+            elif kind == "cancel":
+                await self.cancel_turn()
+            elif kind != "turn":
+                await self.error(400, f"未知的消息类型: {kind}")
+            elif self.turn and not self.turn.done():
+                await self.error(409, "上一轮对话尚未结束")
+            elif lifecycle.draining:
+                await self.error(503, "服务正在重启，请重新连接")
+            else:
+                try:
+                    turn = ChatTurnRequest.model_validate(data)
+                except ValidationError as e:
+                    await self.error(422, e.errors(include_url=False, include_context=False))
+                    continue
+                self.turn = asyncio.create_task(self.run_turn(turn))
+
+    async def cancel_turn(self):
+        if self.turn and not self.turn.done():
+            self.turn.cancel()
+            await asyncio.gather(self.turn, return_exceptions=True)
+            await self.send({"type": "cancelled"})
+
+    async def run_turn(self, turn: ChatTurnRequest):
+        """执行一轮对话，增量事件与 /api/chat/completions 的 SSE 事件相同"""
+        completion = CompletionRequest(
+            prompt=turn.prompt,
+            guest=self.guest,
+            attachments=turn.attachments,
+            files=turn.files,
+            conversation_id=self.conversation_id,
+            section_id=self.section_id,
+            use_deep_think=turn.use_deep_think,
+            use_auto_cot=turn.use_auto_cot,
+            stream=True
+        )
+        try:
+            async for delta in stream_complete(completion, session=self.session):
+                if delta["type"] == "meta":
+                    self.conversation_id = delta["conversation_id"]
+                    self.section_id = delta["section_id"]
+                await self.send(delta)
+        except HTTPException as e:
+            await self.error(e.status_code, e.detail)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.error(500, str(e))
+        metrics.inc("ws_turns_total")
+        # 首轮结束后绑定对话所属会话，之后各轮不再按对话查找
+        if self.session is None and self.conversation_id:
+            self.session = await session_pool.get_session(cluster_router.decode(self.conversation_id)[1])
+
+    async def run(self):
+        if self.conversation_id:
+            self.session = await session_pool.get_session(cluster_router.decode(self.conversation_id)[1])
+        self.last_received = asyncio.get_running_loop().time()
+        ChatSocket.active += 1
+        metrics.set("ws_connections", ChatSocket.active)
+        tasks = [asyncio.create_task(coro) for coro in (self.receiver(), self.sender(), self.heartbeat())]
+        close = None
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    logger.info(f"WebSocket 连接异常结束: {task.exception()}")
+                else:
+                    close = close or task.result()
+        finally:
+            for task in tasks + [self.turn]:
+                if task:
+                    task.cancel()
+            await asyncio.gather(*(task for task in tasks + [self.turn] if task), return_exceptions=True)
+            ChatSocket.active -= 1
+            metrics.set("ws_connections", ChatSocket.active)
+            if self.ephemeral and self.conversation_id:
+                await delete_queue.enqueue(cluster_router.decode(self.conversation_id)[1])
+        if close:
+            try:
+                await self.websocket.close(*close)
+            except Exception:
+                pass
+
+
+@router.websocket("/chat")
+async def ws_chat(
+    websocket: WebSocket,
+    guest: bool = Query(False),
+    conversation_id: Optional[str] = Query(None),
+    section_id: Optional[str] = Query(None),
+    ephemeral: bool = Query(False)
+):
+    """
+    多轮对话 WebSocket，一个连接承载一个对话
+    1. 客户端每轮发送 {"prompt": ..., "attachments"/"files"/"use_deep_think"/"use_auto_cot" 可选}，对话参数由连接维持
+    2. 服务端推送 meta / text / image 增量事件，每轮以 end 事件结束，出错时推送 error 事件，连接保持
+    3. 发送 {"type": "cancel"} 中断当前轮；服务端定期推送 {"type": "ping"}，客户端回复 {"type": "pong"}
+    4. 沿用已有对话时在查询参数中带上 conversation_id 与 section_id；ephemeral 为 true 时断开后删除对话
+    """
+    # 多节点部署时对话只能在创建它的节点上继续
+    try:
+        owner = cluster_router.owner_of(conversation_id)
+    except HTTPException as e:
+        # 1013 Try Again Later
+        await websocket.close(code=1013, reason=e.detail)
+        return
+    if owner:
+        await websocket.close(code=1008, reason=f"对话属于节点 {owner}")
+        return
+    await websocket.accept()
+    await ChatSocket(websocket, guest, conversation_id, section_id, ephemeral).run()
@@ -0,0 +1,76 @@
+from starlette.types import ASGIApp, Message, Scope, Receive, Send
+from src.metrics import metrics
+from src.tracing import tracing
+from src.service import loop_monitor, lifecycle
+
+# 事件循环过载或服务排空时仍然处理的路径，便于观察与排查
+UNSHED_PATHS = ("/api/metrics", "/api/cluster", "/api/debug", "/healthz", "/readyz")
+
+
+class LoadShedMiddleware:
+    """
+    直接拒绝新的 HTTP 请求，避免已在处理的请求继续变慢或被中断
+    1. 事件循环延迟超过 loop_shed_lag 时返回 503
+    2. 服务排空(准备退出)时返回 503 并关闭连接，客户端重连后由其他节点或新进程处理
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith(UNSHED_PATHS):
+            return await self.app(scope, receive, send)
+        headers = [(b"content-type", b"application/json"), (b"retry-after", b"1")]
+        if lifecycle.draining:
+            metrics.inc("load_shed_total", reason="draining")
+            body = '{"detail":"服务正在重启，请稍后重试"}'.encode('utf-8')
+            headers.append((b"connection", b"close"))
+        elif loop_monitor.overloaded:
+            metrics.inc("load_shed_total", reason="overloaded")
+            body = '{"detail":"服务繁忙，请稍后重试"}'.encode('utf-8')
+        else:
+            return await self.app(scope, receive, send)
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": 503, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+
+class TracingMiddleware:
+    """
+    为每个 HTTP / WebSocket 请求创建入口 span
+    1. 继承请求头 traceparent 中调用方的链路，节点间转发的请求与原请求在同一条链路上
+    2. span 名称使用路由模板(如 POST /api/job/{job_id})，记录响应状态码，5xx 标记为错误
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket") or not tracing.enabled:
+            return await self.app(scope, receive, send)
+        method = scope.get("method", "WEBSOCKET")
+        headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope["headers"]}
+        attributes = {"http.request.method": method, "url.path": scope["path"]}
+        with tracing.server_span(f"{method} {scope['path']}", headers, **attributes) as span:
+
+            async def send_wrapper(message: Message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        tracing.mark_error(span, f"HTTP {message['status']}")
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # 路由匹配后 scope 中带有路由，用模板命名避免每个 ID 一个 span 名称
+                if route_path := getattr(scope.get("route"), "path", None):
+                    span.update_name(f"{method} {route_path}")
+                    span.set_attribute("http.route", route_path)
+
+
+__all__ = [
+    "LoadShedMiddleware",
+    "TracingMiddleware"
+]
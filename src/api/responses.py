@@ -0,0 +1,31 @@
+from typing import Any
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+from src.tracing import tracing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    高性能 JSON 响应
+    1. 接口直接返回该响应时，FastAPI 不再按 response_model 校验和转换返回值
+    2. pydantic 模型使用其自带的 Rust 序列化器，其他内容使用 orjson，未安装 orjson 时退回标准库
+    """
+
+    def render(self, content: Any) -> bytes:
+        with tracing.span("response.serialize"):
+            if isinstance(content, BaseModel):
+                return to_json(content)
+            if orjson is not None:
+                return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+            return super().render(content)
+
+
+__all__ = [
+    "FastJSONResponse"
+]
@@ -1,9 +1,34 @@
 from fastapi import APIRouter
 from .endpoints import chat
 from .endpoints import file
+from .endpoints import cluster
+from .endpoints import job
+from .endpoints import openai
+from .endpoints import metrics
+from .endpoints import image
+from .endpoints import ws
+from .endpoints import debug
+from .endpoints import health
 
 router = APIRouter()
 
 # 注册各个模块的路由
 router.include_router(chat.router, prefix="/chat", tags=["聊天"])
-router.include_router(file.router, prefix="/file", tags=["文件"])
\ No newline at end of file
+router.include_router(file.router, prefix="/file", tags=["文件"])
+router.include_router(image.router, prefix="/image", tags=["文件"])
+router.include_router(job.router, prefix="/job", tags=["后台任务"])
+router.include_router(cluster.router, prefix="/cluster", tags=["集群"])
+router.include_router(metrics.router, prefix="/metrics", tags=["监控"])
+router.include_router(debug.router, prefix="/debug", tags=["监控"])
+
+# OpenAI 兼容接口，挂载在 /v1 下
+v1_router = APIRouter()
+v1_router.include_router(openai.router, tags=["OpenAI兼容"])
+
+# WebSocket 接口，挂载在 /ws 下
+ws_router = APIRouter()
+ws_router.include_router(ws.router, tags=["WebSocket"])
+
+# 健康检查接口，挂载在根路径下
+health_router = APIRouter()
+health_router.include_router(health.router, tags=["监控"])
@@ -11,6 +11,7 @@ from ..services.ocr_service import OCRService, OCRError
 from ..services.ai_service import AIAnswerService, AIServiceError
 from ..services.auto_click import AutoClickService, AutoClickError
 from .config_manager import ConfigManager
+from ..models.config import AnswerConfig
 
 
 class AnswerController:
@@ -30,7 +31,8 @@ class AnswerController:
         
         # 初始化服务
         self.screen_capture = ScreenCaptureService()
-        self.ai_service = AIAnswerService(use_image=use_image_mode)
+        # 按配置的连接方式(TCP / Unix域套接字 / 嵌入)访问豆包API
+        self.ai_service = AIAnswerService.from_config(config_manager.config or AnswerConfig(), use_image=use_image_mode)
         self.auto_click = AutoClickService()
         
         # 只在文字模式下初始化OCR服务
@@ -229,6 +229,12 @@ class MainWindow:
             self.stop_api_button.config(state=tk.DISABLED)
             self.api_status_var.set("API: 未启动")
     
+    def set_api_starting(self):
+        """API服务启动中，两个按钮都不可用"""
+        self.start_api_button.config(state=tk.DISABLED)
+        self.stop_api_button.config(state=tk.DISABLED)
+        self.api_status_var.set("API: 启动中...")
+    
     def set_buttons_state(self, answering: bool):
         """设置按钮状态
         
@@ -28,6 +28,10 @@ class AnswerConfig:
     question_area: Optional[Region] = None
     options: Dict[str, Coordinate] = field(default_factory=dict)
     next_button: Optional[Coordinate] = None
+    # 与豆包API服务的连接方式: http(TCP)、uds(Unix域套接字)、embedded(进程内直接调用)
+    api_transport: str = "http"
+    api_url: str = "http://localhost:8000"
+    api_uds: str = "data/doubao.sock"
     
     def is_valid(self) -> bool:
         """检查配置是否完整"""
@@ -69,7 +73,10 @@ class AnswerConfig:
             "next_button": {
                 "x": self.next_button.x,
                 "y": self.next_button.y
-            } if self.next_button else None
+            } if self.next_button else None,
+            "api_transport": self.api_transport,
+            "api_url": self.api_url,
+            "api_uds": self.api_uds
         }
     
     @classmethod
@@ -95,5 +102,8 @@ class AnswerConfig:
         return cls(
             question_area=question_area,
             options=options,
-            next_button=next_button
+            next_button=next_button,
+            api_transport=data.get("api_transport", "http"),
+            api_url=data.get("api_url", "http://localhost:8000"),
+            api_uds=data.get("api_uds", "data/doubao.sock")
         )
@@ -2,35 +2,108 @@
 AI答题服务
 """
 
+import os
 import re
+import socket
 import asyncio
 import aiohttp
+import base64
 import io
 from PIL import Image
 from loguru import logger
 
 
+# 项目根目录(app.py 所在目录)，API服务以它为工作目录启动，相对的套接字路径统一按它解析
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+
 class AIServiceError(Exception):
     """AI服务错误"""
     pass
 
 
+class RateLimitedError(Exception):
+    """服务端过载保护，需要等待 retry_after 秒后重试"""
+
+    def __init__(self, retry_after: int, message: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class AIAnswerService:
     """AI答题服务"""
     
-    def __init__(self, base_url: str = "http://localhost:8000", use_image: bool = True):
+    def __init__(self, base_url: str = "http://localhost:8000", use_image: bool = True, uds: str = None, embedded: bool = False):
         """初始化AI答题服务
         
         Args:
             base_url: DoubaoFreeApi服务地址
             use_image: 是否使用图片识别（True=发送图片，False=发送文字）
+            uds: API服务监听的Unix域套接字路径，设置后不再经过TCP回环
+            embedded: 嵌入模式，在本进程内直接调用补全与上传，不需要启动API服务
         """
         self.base_url = base_url
         self.use_image = use_image
+        self.uds = uds
+        self.embedded = embedded
         self.timeout = aiohttp.ClientTimeout(total=30)  # 图片识别需要更长时间
         self.conversation_id = None  # 保存对话ID，复用同一个对话
         self.section_id = None  # 保存section_id
-        logger.info(f"AI答题服务初始化完成，服务地址: {base_url}, 图片模式: {use_image}")
+        transport = "嵌入模式" if embedded else f"Unix域套接字 {uds}" if uds else base_url
+        logger.info(f"AI答题服务初始化完成，服务地址: {transport}, 图片模式: {use_image}")
+    
+    @classmethod
+    def from_config(cls, config, use_image: bool = True) -> "AIAnswerService":
+        """按答题配置中的连接方式创建服务
+        
+        Unix域套接字路径在这里解析为绝对路径，客户端与它启动的API服务使用同一个文件；
+        系统不支持Unix域套接字(Windows)时改用 api_url 通过TCP连接
+        """
+        uds = None
+        if config.api_transport == "uds":
+            if hasattr(socket, "AF_UNIX"):
+                uds = os.path.abspath(os.path.join(PROJECT_ROOT, config.api_uds))
+            else:
+                logger.warning(f"当前系统不支持Unix域套接字，改用TCP连接: {config.api_url}")
+        return cls(
+            base_url=config.api_url,
+            use_image=use_image,
+            uds=uds,
+            embedded=config.api_transport == "embedded"
+        )
+    
+    def client_session(self) -> aiohttp.ClientSession:
+        """创建HTTP客户端，配置了Unix域套接字时通过套接字连接"""
+        connector = aiohttp.UnixConnector(path=self.uds) if self.uds else None
+        return aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+    
+    async def is_ready(self) -> bool:
+        """通过就绪检查接口判断API服务是否可用，嵌入模式始终可用"""
+        if self.embedded:
+            return True
+        try:
+            async with self.client_session() as session:
+                async with session.get(f"{self.base_url}/readyz", timeout=aiohttp.ClientTimeout(total=2)) as response:
+                    return response.status == 200
+        except Exception:
+            return False
+    
+    async def wait_ready(self, timeout: float = 30, alive=None) -> bool:
+        """轮询就绪检查直到服务就绪
+        
+        Args:
+            timeout: 最长等待时间(秒)
+            alive: 可选，返回服务进程是否仍在运行，进程已退出时立即返回
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            if await self.is_ready():
+                return True
+            if alive and not alive():
+                return False
+            await asyncio.sleep(0.2)
+        return False
     
     def reset_conversation(self):
         """重置对话ID，开始新对话"""
@@ -60,7 +133,13 @@ class AIAnswerService:
                 "file_name": "question.png"
             }
             
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            if self.embedded:
+                from src.service import upload_file
+                result = await upload_file(params["file_type"], params["file_name"], img_byte_arr)
+                logger.info("图片上传成功")
+                return result.model_dump()
+            
+            async with self.client_session() as session:
                 async with session.post(url, params=params, data=img_byte_arr, headers={'Content-Type': 'application/octet-stream'}) as response:
                     if response.status == 200:
                         data = await response.json()
@@ -112,13 +191,16 @@ class AIAnswerService:
         Raises:
             AIServiceError: API调用失败时抛出
         """
+        image_bytes = None
         if self.use_image:
             # 图片模式：直接发送图片
             if image is None:
                 raise AIServiceError("图片模式下必须提供图片")
             
-            # 上传图片
-            attachment = await self.upload_image(image)
+            # 图片随补全请求一起提交，由服务端上传，省去一次单独的上传请求
+            img_byte_arr = io.BytesIO()
+            image.save(img_byte_arr, format='PNG')
+            image_bytes = img_byte_arr.getvalue()
             
             # 构造请求payload
             payload = {
@@ -126,7 +208,6 @@ class AIAnswerService:
                 "guest": False,  # 使用登录模式（session.json中的配置）
                 "conversation_id": self.conversation_id,  # 复用同一个对话
                 "section_id": self.section_id,
-                "attachments": [attachment],
                 "use_deep_think": use_deep_think
             }
         else:
@@ -142,34 +223,32 @@ class AIAnswerService:
                 "use_deep_think": use_deep_think
             }
         
-        url = f"{self.base_url}/api/chat/completions"
-        
         # 实现指数退避重试
         for attempt in range(retry + 1):
             try:
-                async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                    async with session.post(url, json=payload) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            answer_text = data.get("text", "")
-                            
-                            # 保存conversation_id和section_id，用于下次请求
-                            if data.get("conversation_id"):
-                                self.conversation_id = data.get("conversation_id")
-                            if data.get("section_id"):
-                                self.section_id = data.get("section_id")
-                            
-                            if not answer_text:
-                                raise AIServiceError("AI返回空响应")
-                            
-                            # 解析答案
-                            answer = self.parse_answer(answer_text)
-                            logger.info(f"AI答题成功，答案: {answer}")
-                            return answer
-                        else:
-                            error_text = await response.text()
-                            raise AIServiceError(f"API请求失败，状态码: {response.status}, 错误: {error_text}")
+                data = await self.request_completion(payload, image_bytes)
+                answer_text = data.get("text", "")
+                
+                # 保存conversation_id和section_id，用于下次请求
+                if data.get("conversation_id"):
+                    self.conversation_id = data.get("conversation_id")
+                if data.get("section_id"):
+                    self.section_id = data.get("section_id")
+                
+                if not answer_text:
+                    raise AIServiceError("AI返回空响应")
+                
+                # 解析答案
+                answer = self.parse_answer(answer_text)
+                logger.info(f"AI答题成功，答案: {answer}")
+                return answer
             
+            except RateLimitedError as e:
+                # 服务端过载保护，按 Retry-After 等待后重试
+                if attempt >= retry:
+                    raise AIServiceError(f"API请求失败 (rate limited)，状态码: 429, 错误: {e}")
+                logger.warning(f"服务端繁忙 (尝试 {attempt + 1}/{retry + 1})，{e.retry_after}秒后重试")
+                await asyncio.sleep(e.retry_after)
             except AIServiceError:
                 raise
             except Exception as e:
@@ -181,3 +260,60 @@ class AIAnswerService:
                 else:
                     logger.error(f"AI请求失败，已达最大重试次数: {e}")
                     raise AIServiceError(f"AI请求失败: {e}")
+    
+    async def request_completion(self, payload: dict, image_bytes: bytes = None) -> dict:
+        """发送一次补全请求，返回响应内容
+        
+        Args:
+            payload: /api/chat/completions 的请求参数
+            image_bytes: 题目图片（PNG），随请求一起上传
+            
+        Returns:
+            补全响应字典（text、conversation_id、section_id 等）
+            
+        Raises:
+            RateLimitedError: 服务端过载保护
+            AIServiceError: 其他错误响应
+        """
+        if self.embedded:
+            return await self.embedded_completion(payload, image_bytes)
+        
+        if image_bytes is not None:
+            payload = {**payload, "files": [{
+                "file_type": 1,
+                "file_name": "question.png",
+                "data": base64.b64encode(image_bytes).decode('ascii')
+            }]}
+        
+        async with self.client_session() as session:
+            async with session.post(f"{self.base_url}/api/chat/completions", json=payload) as response:
+                if response.status == 200:
+                    return await response.json()
+                error_text = await response.text()
+                if response.status == 429:
+                    raise RateLimitedError(int(response.headers.get("Retry-After", 1)), error_text)
+                raise AIServiceError(f"API请求失败，状态码: {response.status}, 错误: {error_text}")
+    
+    async def embedded_completion(self, payload: dict, image_bytes: bytes = None) -> dict:
+        """嵌入模式：在本进程内直接上传图片并调用补全，省去HTTP与JSON往返"""
+        # 按需导入，非嵌入模式不加载代理服务
+        from fastapi import HTTPException
+        from src.service import chat_completion, upload_file
+        
+        try:
+            attachments = []
+            if image_bytes is not None:
+                attachments.append((await upload_file(1, "question.png", image_bytes)).model_dump())
+            text, _, conversation_id, _, section_id = await chat_completion(
+                prompt=payload["prompt"],
+                guest=payload["guest"],
+                conversation_id=payload["conversation_id"],
+                section_id=payload["section_id"],
+                attachments=attachments,
+                use_deep_think=payload["use_deep_think"]
+            )
+        except HTTPException as e:
+            if e.status_code == 429:
+                raise RateLimitedError(int((e.headers or {}).get("Retry-After", 1)), str(e.detail))
+            raise AIServiceError(f"API请求失败，状态码: {e.status_code}, 错误: {e.detail}")
+        return {"text": text, "conversation_id": conversation_id, "section_id": section_id}
@@ -0,0 +1,9 @@
+from .ring import HashRing
+from .router import ClusterRouter, FORWARDED_HEADER, cluster_router
+
+__all__ = [
+    "HashRing",
+    "ClusterRouter",
+    "FORWARDED_HEADER",
+    "cluster_router"
+]
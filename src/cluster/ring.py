@@ -0,0 +1,50 @@
+import bisect
+import hashlib
+from typing import Dict, List, Optional
+
+
+class HashRing:
+    """一致性哈希环，每个节点映射为多个虚拟节点，节点增删时只有少量 key 需要迁移"""
+
+    def __init__(self, nodes: Optional[List[str]] = None, replicas: int = 100):
+        self.replicas = replicas
+        self.hashes: List[int] = []
+        self.owners: Dict[int, str] = {}
+        for node in nodes or []:
+            self.add_node(node)
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+    def add_node(self, node: str):
+        """添加节点"""
+        for i in range(self.replicas):
+            h = self.hash(f"{node}#{i}")
+            if h not in self.owners:
+                bisect.insort(self.hashes, h)
+            self.owners[h] = node
+
+    def remove_node(self, node: str):
+        """移除节点"""
+        for i in range(self.replicas):
+            h = self.hash(f"{node}#{i}")
+            if self.owners.get(h) == node:
+                del self.owners[h]
+                self.hashes.remove(h)
+
+    def get_node(self, key: str) -> Optional[str]:
+        """获取 key 所属的节点"""
+        if not self.hashes:
+            return None
+        idx = bisect.bisect(self.hashes, self.hash(key)) % len(self.hashes)
+        return self.owners[self.hashes[idx]]
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self.owners.values()))
+
+
+__all__ = [
+    "HashRing"
+]
@@ -0,0 +1,220 @@
+import asyncio
+from typing import Dict, Optional, AsyncIterator
+import aiohttp
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from src.config import settings
+from src.tracing import tracing
+from .ring import HashRing
+
+# 转发请求携带该请求头，接收方直接本地处理，避免成员视图不一致时来回转发
+FORWARDED_HEADER = "x-doubao-forwarded"
+# 转发时原样传递的请求头与响应头(条件请求、分段请求与缓存控制)
+FORWARD_REQUEST_HEADERS = ("if-none-match", "range")
+FORWARD_RESPONSE_HEADERS = ("etag", "cache-control", "content-range", "accept-ranges", "retry-after")
+
+
+class ClusterRouter:
+    """
+    多节点部署时的对话路由
+    1. 本节点创建的对话，返回的 conversation_id 带上节点标识 "<node_id>:<conversation_id>"
+    2. 后续请求根据节点标识转发到创建对话的节点，该节点已下线时返回 503；没有标识时按一致性哈希环选择节点
+    3. 节点间通过复用连接的 aiohttp 会话转发，SSE 响应逐块转发
+    """
+
+    def __init__(self, node_id: str = "", nodes: Optional[Dict[str, str]] = None):
+        self.node_id = node_id
+        # 配置的全部成员 node_id -> 节点地址
+        self.members: Dict[str, str] = {}
+        # 当前存活、参与哈希环的成员
+        self.nodes: Dict[str, str] = {}
+        self.ring = HashRing()
+        self.client: Optional[aiohttp.ClientSession] = None
+        self.probe_task: Optional[asyncio.Task] = None
+        self.set_members(nodes or {})
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.node_id) and len(self.members) > 1
+
+    def set_members(self, members: Dict[str, str]):
+        """更新集群成员"""
+        self.members = dict(members)
+        self.set_alive(self.members)
+
+    def set_alive(self, nodes: Dict[str, str]):
+        """更新存活成员，一致性哈希环随之重新平衡"""
+        self.nodes = dict(nodes)
+        self.ring = HashRing(list(self.nodes))
+        if self.members:
+            logger.info(f"集群存活成员已更新: {list(self.nodes)}")
+
+    def encode(self, conversation_id: str) -> str:
+        """为本节点创建的对话附加节点标识"""
+        if not self.enabled or not conversation_id:
+            return conversation_id
+        return f"{self.node_id}:{conversation_id}"
+
+    @staticmethod
+    def decode(conversation_id: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+        """拆分节点标识与原始 conversation_id"""
+        if conversation_id and ":" in conversation_id:
+            node_id, raw_id = conversation_id.split(":", 1)
+            return node_id, raw_id
+        return None, conversation_id
+
+    def owner_of(self, conversation_id: Optional[str]) -> Optional[str]:
+        """获取对话所属节点，属于本节点或无需转发时返回 None，所属节点已下线时抛出 503"""
+        if not self.enabled or not conversation_id:
+            return None
+        node_id, raw_id = self.decode(conversation_id)
+        if node_id in self.members and node_id not in self.nodes:
+            # 对话只存在于创建它的节点上，转给其他节点也找不到
+            raise HTTPException(status_code=503, detail=f"对话所属节点不可用: {node_id}")
+        if node_id not in self.members:
+            node_id = self.ring.get_node(raw_id)
+        return None if node_id in (None, self.node_id) else node_id
+
+    def forward_target(self, request: Request, conversation_id: Optional[str]) -> Optional[str]:
+        """请求需要转发时返回目标节点，已经是转发来的请求不再转发"""
+        if FORWARDED_HEADER in request.headers:
+            return None
+        return self.owner_of(conversation_id)
+
+    async def get_client(self) -> aiohttp.ClientSession:
+        if self.client is None or self.client.closed:
+            connector = aiohttp.TCPConnector(limit=settings.cluster_pool_size, keepalive_timeout=60)
+            # 转发超时不能短于目标节点处理上游请求的最长时间，否则深度思考会在对方仍在生成时被中断
+            timeout = max(settings.cluster_forward_timeout, settings.deep_think_total_timeout + settings.upstream_connect_timeout)
+            self.client = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+        return self.client
+
+    async def open(
+        self,
+        node_id: str,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        json: Optional[dict] = None,
+        headers: Optional[dict] = None
+    ) -> aiohttp.ClientResponse:
+        """向指定节点发起请求并返回未读取的响应，由调用方读取后释放"""
+        client = await self.get_client()
+        url = self.nodes[node_id].rstrip("/") + path
+        headers = tracing.inject({**(headers or {}), FORWARDED_HEADER: self.node_id})
+        return await client.request(method, url, params=params, json=json, headers=headers)
+
+    async def forward(
+        self,
+        node_id: str,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        json: Optional[dict] = None,
+        headers: Optional[dict] = None
+    ) -> tuple[int, bytes, Dict[str, str]]:
+        """将请求转发到指定节点，返回 (状态码, 响应体, 响应头)"""
+        async with await self.open(node_id, method, path, params, json, headers) as response:
+            body = await response.read()
+            return response.status, body, {k.lower(): v for k, v in response.headers.items()}
+
+    @staticmethod
+    async def relay(node_id: str, response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        """
+        逐块转发流式响应
+        客户端断开时生成器被取消，随即关闭到目标节点的连接，目标节点检测到断开后取消上游请求
+        """
+        try:
+            async for chunk in response.content.iter_any():
+                yield chunk
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"节点 {node_id} 的流式响应中断: {e!r}")
+        finally:
+            response.close()
+
+    async def route(
+        self,
+        request: Request,
+        conversation_id: Optional[str],
+        params: Optional[dict] = None,
+        json: Optional[dict] = None
+    ) -> Optional[Response]:
+        """
+        对话属于其他节点时转发请求并返回响应，否则返回 None 由本节点处理
+        1. SSE 响应(流式补全、任务事件)以 StreamingResponse 逐块返回，其他响应读取完整后返回
+        2. 目标节点无法连接或转发超时时抛出 503，其他转发错误抛出 502
+        """
+        if not (owner := self.forward_target(request, conversation_id)):
+            return None
+        logger.debug(f"对话 {conversation_id} 转发到节点 {owner}")
+        headers = {name: request.headers[name] for name in FORWARD_REQUEST_HEADERS if name in request.headers}
+        try:
+            response = await self.open(owner, request.method, request.url.path, params, json, headers)
+            if response.content_type != "text/event-stream":
+                async with response:
+                    body = await response.read()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            logger.warning(f"转发到节点 {owner} 失败: {e!r}")
+            raise HTTPException(status_code=503, detail=f"对话所属节点不可用: {owner}")
+        except aiohttp.ClientError as e:
+            logger.warning(f"转发到节点 {owner} 失败: {e!r}")
+            raise HTTPException(status_code=502, detail=f"转发到节点 {owner} 失败: {e}")
+        response_headers = {name: response.headers[name] for name in FORWARD_RESPONSE_HEADERS if name in response.headers}
+        media_type = response.headers.get("content-type", "application/json")
+        if response.content_type == "text/event-stream":
+            return StreamingResponse(
+                self.relay(owner, response), status_code=response.status, media_type=media_type, headers=response_headers
+            )
+        return Response(content=body, status_code=response.status, media_type=media_type, headers=response_headers)
+
+    async def probe(self):
+        """周期性探测成员存活，下线节点移出哈希环，恢复后重新加入"""
+        while True:
+            await asyncio.sleep(settings.cluster_probe_interval)
+            client = await self.get_client()
+            alive = {}
+            for node_id, url in self.members.items():
+                if node_id == self.node_id:
+                    alive[node_id] = url
+                    continue
+                try:
+                    async with client.get(url.rstrip("/") + "/api/cluster/ping", timeout=aiohttp.ClientTimeout(total=3)) as response:
+                        if response.status == 200:
+                            alive[node_id] = url
+                except Exception as e:
+                    logger.warning(f"集群节点 {node_id} 探测失败: {e}")
+            if alive.keys() != self.nodes.keys():
+                self.set_alive(alive)
+
+    def start(self):
+        """启动成员探测"""
+        if self.enabled and self.probe_task is None:
+            self.probe_task = asyncio.create_task(self.probe())
+
+    async def close(self):
+        if self.probe_task:
+            self.probe_task.cancel()
+            self.probe_task = None
+        if self.client:
+            await self.client.close()
+            self.client = None
+
+
+def parse_nodes(value: str) -> Dict[str, str]:
+    """解析 "node1=http://host1:8000,node2=http://host2:8000" 格式的成员列表"""
+    nodes = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        node_id, url = item.split("=", 1)
+        nodes[node_id.strip()] = url.strip()
+    return nodes
+
+
+cluster_router = ClusterRouter(settings.node_id, parse_nodes(settings.cluster_nodes))
+
+__all__ = [
+    "ClusterRouter",
+    "FORWARDED_HEADER",
+    "cluster_router",
+    "parse_nodes"
+]
@@ -0,0 +1,146 @@
+import os
+from pydantic import BaseModel
+
+
+class Settings(BaseModel):
+    """服务配置，字段可通过环境变量 DOUBAO_<字段名大写> 覆盖"""
+    host: str = "0.0.0.0"
+    port: int = 8000
+    # 额外监听的 Unix 域套接字路径，供同机客户端绕过 TCP 回环，为空时不监听
+    uds: str = ""
+    # uvicorn worker 进程数，大于1时必须使用进程间共享的存储
+    workers: int = 1
+    # 以 SO_REUSEPORT 监听 TCP 端口，新进程可以在旧进程退出前绑定同一端口并接管新连接
+    reuse_port: bool = False
+    # 优雅退出: 收到 SIGTERM 后继续监听并报告未就绪的时长(秒，供负载均衡摘除本节点)、
+    # 之后停止监听并等待进行中的请求与后台任务完成的最长时间(秒)
+    drain_delay: float = 0.0
+    drain_timeout: float = 300.0
+    # 会话状态存储: memory:// 仅限单进程; sqlite:///path 可被同机多个 worker 共享
+    store_url: str = "memory://"
+    # 单个 DoubaoSession 允许同时进行的请求数，0 表示不限制
+    session_concurrency: int = 4
+    # 等待会话空闲槽位的最长时间(秒)
+    session_acquire_timeout: float = 30.0
+    # 槽位租约有效期(秒)，持有期间每隔三分之一有效期续期，worker 异常退出后遗留的槽位会在过期后自动回收
+    session_lease_ttl: float = 600.0
+    # 多节点部署: 本节点标识，以及全部节点 "node1=http://host1:8000,node2=http://host2:8000"
+    node_id: str = ""
+    cluster_nodes: str = ""
+    # 节点间转发的连接池大小、超时(秒，不短于深度思考总时长)与成员探测间隔(秒)
+    cluster_pool_size: int = 100
+    cluster_forward_timeout: float = 960.0
+    cluster_probe_interval: float = 5.0
+    # 后台任务: 并发执行数、排队上限与结果保留时间(秒)
+    job_workers: int = 8
+    job_queue_size: int = 1000
+    job_result_ttl: float = 600.0
+    # 批量补全: 全局并发上限与单次请求的最大条数
+    batch_concurrency: int = 32
+    batch_max_size: int = 1000
+    # OpenAI 兼容接口: 对话历史与豆包对话映射的保留时间(秒)
+    openai_conversation_ttl: float = 86400.0
+    # 后台删除对话: 队列存储(默认持久化到 SQLite)、并发、每秒删除数、每批领取数、
+    # 领取后未确认重新可见的时间(秒)、空闲轮询间隔(秒)与最大尝试次数
+    delete_queue_url: str = "sqlite:///data/delete_queue.db"
+    delete_concurrency: int = 4
+    delete_rate: float = 10.0
+    delete_batch_size: int = 50
+    delete_claim_ttl: float = 120.0
+    delete_poll_interval: float = 5.0
+    delete_max_attempts: int = 5
+    # 上传图片预处理(需安装 Pillow，默认关闭): 最长边像素、输出格式(jpeg/webp)、编码质量与线程池大小
+    image_preprocess: bool = False
+    image_max_dimension: int = 2048
+    image_format: str = "jpeg"
+    image_quality: int = 85
+    image_workers: int = 2
+    # 从 URL 转存文件: 大小上限(字节)、超过后写入临时文件的内存阈值(字节)、下载超时(秒)、
+    # 允许读取的服务器本地目录(逗号分隔，为空时禁止读取本地文件)、是否允许下载内网地址
+    upload_max_size: int = 100 * 1024 * 1024
+    upload_spool_size: int = 8 * 1024 * 1024
+    upload_url_timeout: float = 120.0
+    upload_local_dirs: str = ""
+    upload_url_allow_private: bool = False
+    # 生成图片缓存: 目录、总大小上限(字节)与记录的图片 URL 数上限，单张图片的大小上限同 upload_max_size
+    image_cache_enabled: bool = True
+    image_cache_dir: str = "data/images"
+    image_cache_max_bytes: int = 1024 * 1024 * 1024
+    image_cache_max_urls: int = 10000
+    # 聊天补全响应压缩: 按优先顺序可用的编码(br/zstd 需安装 brotli/zstandard，为空时关闭)、
+    # 非流式响应的最小压缩大小(字节)与超过后改在线程中压缩的大小(字节)
+    compression_encodings: str = "zstd,br,gzip"
+    compression_min_size: int = 1024
+    compression_thread_size: int = 256 * 1024
+    # WebSocket 聊天: 服务端心跳间隔(秒)、多久未收到客户端消息后断开(秒)、
+    # 待发送消息队列长度(满时暂停读取上游)与单条消息发送超时(秒，超时视为客户端不再读取)
+    ws_heartbeat_interval: float = 20.0
+    ws_idle_timeout: float = 60.0
+    ws_send_queue_size: int = 64
+    ws_send_timeout: float = 30.0
+    # 事件循环监控: 采样间隔(秒)、循环阻塞超过该时长(秒)时记录阻塞代码的堆栈、
+    # 延迟均值超过该值(秒)时新请求直接返回 503 减载(0 表示不减载)
+    loop_monitor_enabled: bool = True
+    loop_monitor_interval: float = 0.25
+    loop_slow_callback: float = 0.1
+    loop_shed_lag: float = 0.0
+    # 管理接口(性能分析)的访问令牌，请求头 Authorization: Bearer <令牌>，为空时管理接口关闭
+    admin_token: str = ""
+    # CPU 采样分析: 单次最长时长(秒)与采样间隔(秒)
+    profile_max_seconds: float = 60.0
+    profile_interval: float = 0.005
+    # 链路追踪(需安装 opentelemetry-sdk): 导出方式 otlp / console / file:<路径>，为空时关闭；
+    # OTLP(HTTP) 接收地址与上报的服务名
+    tracing_exporter: str = ""
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    tracing_service_name: str = "doubao-free-api"
+    # 上游分级超时(秒): 建立连接、首个事件(2002)、事件间隔、总时长；深度思考单独配置
+    upstream_connect_timeout: float = 10.0
+    upstream_first_event_timeout: float = 30.0
+    upstream_idle_timeout: float = 30.0
+    upstream_total_timeout: float = 300.0
+    deep_think_first_event_timeout: float = 60.0
+    deep_think_idle_timeout: float = 120.0
+    deep_think_total_timeout: float = 900.0
+    # 新对话在流开始前失败时换会话重试的次数，以及允许重试的已耗时上限(秒)
+    upstream_retries: int = 1
+    upstream_retry_budget: float = 15.0
+    # 对冲请求: 对冲占全部请求的比例上限，首个事件等待时间(样本不足时的默认值、下限)，
+    # 计算 p95 所需样本数与保留的最近样本数(普通对话与深度思考分别统计)
+    hedge_max_rate: float = 0.05
+    hedge_delay: float = 3.0
+    hedge_min_delay: float = 0.5
+    hedge_min_samples: int = 20
+    hedge_window: int = 200
+    # 上游全局并发自适应限制(AIMD): 初始/最小/最大并发、排队上限与排队超时(秒)、
+    # 过载时的缩减比例、判定延迟上升的倍数(相对首个事件耗时长期均值)、两次缩减的最小间隔(秒)
+    limiter_enabled: bool = True
+    limiter_initial: int = 32
+    limiter_min: int = 1
+    limiter_max: int = 256
+    limiter_queue_size: int = 256
+    limiter_queue_timeout: float = 5.0
+    limiter_backoff: float = 0.7
+    limiter_latency_tolerance: float = 2.0
+    limiter_decrease_interval: float = 1.0
+    # 会话连续失败达到阈值后暂停使用的时长(秒)，上游限流时立即暂停
+    session_failure_threshold: int = 3
+    session_cooldown: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> 'Settings':
+        """从环境变量读取配置"""
+        values = {}
+        for name in cls.model_fields:
+            env_value = os.environ.get(f"DOUBAO_{name.upper()}")
+            if env_value is not None:
+                values[name] = env_value
+        return cls(**values)
+
+
+settings = Settings.from_env()
+
+__all__ = [
+    "Settings",
+    "settings"
+]
@@ -1,6 +1,16 @@
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Union
 from pydantic import BaseModel
 
+class InlineFile(BaseModel):
+    # 文档类型 1; 图片类型 2
+    file_type: int = 2
+    file_name: str
+    # base64 编码的文件内容，与 url 二选一
+    data: Optional[str] = None
+    # 同 /api/file/upload_url 的 url
+    url: Optional[str] = None
+
+
 class CompletionRequest(BaseModel):
     prompt: str
     guest: bool
@@ -9,6 +19,23 @@ class CompletionRequest(BaseModel):
     section_id: Optional[str] = None
     use_deep_think: bool = False
     use_auto_cot: bool = False
+    # 以 SSE 流式返回
+    stream: bool = False
+    # 新对话首个事件迟迟未到时在另一个Session上对冲请求，降低尾延迟
+    hedge: bool = False
+    # 一次性对话: 返回结果后在后台删除，不可沿用
+    ephemeral: bool = False
+    # 内联文件，补全前并发上传并追加到 attachments
+    files: List[InlineFile] = []
+
+
+class ChatTurnRequest(BaseModel):
+    """WebSocket 聊天中的一轮消息，对话与会话由连接维持"""
+    prompt: str
+    attachments: List[dict] = []
+    files: List[InlineFile] = []
+    use_deep_think: bool = False
+    use_auto_cot: bool = False
 
 
 class AttachmentRequest(BaseModel):
@@ -26,4 +53,31 @@ class AttachmentRequest(BaseModel):
 class UploadRequest(BaseModel):
     file_type: int
     file_name: str
-    file_bytes: bytes
\ No newline at end of file
+    file_bytes: bytes
+
+
+class UploadUrlRequest(BaseModel):
+    file_type: int
+    # http(s) 地址、file:// 地址或服务器本地绝对路径
+    url: str
+    file_name: Optional[str] = None
+
+
+class ClusterMembersRequest(BaseModel):
+    # node_id -> 节点地址
+    nodes: Dict[str, str]
+
+
+class OpenAIMessage(BaseModel):
+    role: str
+    # 字符串，或 [{"type": "text", "text": ...}] 形式的内容数组
+    content: Union[str, List[dict], None] = None
+
+
+class OpenAIChatRequest(BaseModel):
+    model: str = "doubao"
+    messages: List[OpenAIMessage]
+    stream: bool = False
+    # 以下为扩展字段，显式沿用豆包对话
+    conversation_id: Optional[str] = None
+    section_id: Optional[str] = None
\ No newline at end of file
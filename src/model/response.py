@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel
 import uuid
 
@@ -9,6 +9,8 @@ class CompletionResponse(BaseModel):
     conversation_id: str
     messageg_id: str
     section_id: str
+    # 生成图片的缓存 ID，可通过 /api/image/{id} 访问
+    img_ids: List[str] = []
     
     
 class UploadResponse(BaseModel):
@@ -46,4 +48,89 @@ class FileResponse(BaseModel):
 
 class DeleteResponse(BaseModel):
     ok: bool
-    msg: str
\ No newline at end of file
+    msg: str
+
+
+class ClusterMembersResponse(BaseModel):
+    node_id: str
+    members: Dict[str, str]
+    alive: List[str]
+
+class JobResponse(BaseModel):
+    job_id: str
+    # queued / running / succeeded / failed / cancelled
+    status: str
+    result: Optional[CompletionResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
+
+
+class BatchCompletionResponse(BaseModel):
+    # 对应请求数组中的下标
+    index: int
+    ok: bool
+    result: Optional[CompletionResponse] = None
+    status: Optional[int] = None
+    error: Optional[str] = None
+
+
+
+class MemoryStat(BaseModel):
+    # 分配位置的调用栈，最内层在前
+    location: List[str]
+    size: int
+    count: int
+    # 相对上一次快照的变化
+    size_diff: int = 0
+    count_diff: int = 0
+
+
+class MemorySnapshotResponse(BaseModel):
+    # tracemalloc 当前跟踪的内存与峰值(字节)
+    traced: int
+    peak: int
+    top: List[MemoryStat]
+    diff: List[MemoryStat]
+
+
+class SessionHealth(BaseModel):
+    key: str
+    guest: bool
+    # closed: 正常 / open: 连续失败后暂停使用 / half_open: 暂停期已过，等待下一次请求验证
+    circuit: str
+    # 连续失败次数与占用的并发槽位数
+    failures: int
+    inflight: int
+
+
+class HealthResponse(BaseModel):
+    # ok / degraded(没有可用的会话) / overloaded / starting / draining
+    status: str
+    ready: bool
+    healthy_sessions: int
+    sessions: List[SessionHealth]
+    # 队列长度: jobs 排队中的后台任务, jobs_running 执行中的后台任务, delete 待删除的对话, limiter 等待全局并发槽位的请求
+    queues: Dict[str, int]
+    # 事件循环延迟(秒): 最近一次、滑动均值与当前已阻塞的时长
+    loop_lag: float
+    loop_lag_ewma: float
+    loop_stalled: float
+
+
+class ReadyResponse(BaseModel):
+    # ok / overloaded / starting / draining
+    status: str
+    ready: bool
+
+
+class OpenAIModel(BaseModel):
+    id: str
+    object: str = "model"
+    created: int = 0
+    owned_by: str = "doubao"
+
+
+class OpenAIModelList(BaseModel):
+    object: str = "list"
+    data: List[OpenAIModel]
\ No newline at end of file
@@ -1,7 +1,8 @@
-from .session_pool import DoubaoSession, SessionPool, session_pool
+from .session_pool import DoubaoSession, SessionPool, SessionBusyError, session_pool
 
 __all__ = [
     "DoubaoSession",
     "SessionPool",
+    "SessionBusyError",
     "session_pool"
 ] 
\ No newline at end of file
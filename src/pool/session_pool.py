@@ -1,10 +1,18 @@
 import os
 import json
 import random
-from typing import Optional, List, Dict
+import asyncio
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import cached_property
+from typing import Optional, List, Dict, Set
 from pydantic import BaseModel
 from loguru import logger
+from src.config import settings
 from .fetcher import DoubaoAutomator
+from .store import SessionStore, create_store
 
 class DoubaoSession(BaseModel):
     """豆包API会话配置"""
@@ -29,16 +37,35 @@ class DoubaoSession(BaseModel):
     @classmethod
     def from_dict(cls, data: Dict[str, str]) -> 'DoubaoSession':
         return cls(**data)
+    
+    @cached_property
+    def key(self) -> str:
+        """会话唯一标识，用于在多个 worker 之间共享会话状态"""
+        raw = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()[:16]
+
+
+class SessionBusyError(Exception):
+    """等待会话并发槽位超时"""
+    pass
 
 
 class SessionPool:
     """豆包API会话池，管理多个账号配置"""
-    def __init__(self, config_file: str = "session.json"):
-        # conversation_id -> DoubaoSession
+    def __init__(self, config_file: str = "session.json", store: Optional[SessionStore] = None):
+        # conversation_id -> DoubaoSession，本进程缓存，权威数据在 store 中
         self.session_map: Dict[str, DoubaoSession] = {}
         self.auth_sessions: List[DoubaoSession] = []
         self.guest_sessions: List[DoubaoSession] = [] 
+        # session.key -> (连续失败次数, 暂停使用截止时间)，本进程统计
+        self.health: Dict[str, tuple[int, float]] = {}
         self.config_file = config_file
+        # session.key -> 本进程的并发槽位信号量
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        # 会话配置文件由单个线程按提交顺序写入，最近一次写入的任务
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-file")
+        self.saving: Optional[asyncio.Future] = None
+        self.store = store or create_store(settings.store_url)
         self.load_from_file()
     
     def create_session(
@@ -65,34 +92,150 @@ class SessionPool:
         else:
             self.auth_sessions.append(session)
     
-    def get_session(self, conversation_id: Optional[str] = None, guest: bool = False) -> DoubaoSession:
+    async def get_session(self, conversation_id: Optional[str] = None, guest: bool = False) -> DoubaoSession:
         """获取会话配置，如果不存在则随机"""
         if conversation_id is None:
-            if guest:
-                return random.choice(self.guest_sessions) if self.guest_sessions else None
-            else:
-                return random.choice(self.auth_sessions) if self.auth_sessions else None
+            return await self.pick_session(self.guest_sessions if guest else self.auth_sessions)
         else:
-            return self.session_map.get(conversation_id)
+            if session := self.session_map.get(conversation_id):
+                return session
+            # 对话可能由其他 worker 创建，从共享存储中查找
+            if (key := await self.store.get_affinity(conversation_id)) and (session := self.find_session(key)):
+                self.session_map[conversation_id] = session
+            return session
+    
+    async def pick_session(self, sessions: List[DoubaoSession]) -> Optional[DoubaoSession]:
+        """新对话在占用槽位最少的会话中随机挑选，避免请求集中到已满的会话上排队"""
+        if not sessions:
+            return None
+        # 优先使用健康的会话，全部暂停时退回全部会话，避免直接拒绝请求
+        sessions = [s for s in sessions if self.is_healthy(s)] or sessions
+        loads = await self.store.inflight([s.key for s in sessions])
+        least = min(loads.values())
+        return random.choice([s for s in sessions if loads[s.key] == least])
+    
+    async def failover_session(self, guest: bool, exclude: Set[str]) -> Optional[DoubaoSession]:
+        """挑选一个未尝试过的健康会话用于重试，没有时返回 None"""
+        sessions = self.guest_sessions if guest else self.auth_sessions
+        candidates = [s for s in sessions if s.key not in exclude and self.is_healthy(s)]
+        return await self.pick_session(candidates) if candidates else None
+    
+    def is_healthy(self, session: DoubaoSession) -> bool:
+        """会话是否可用(未处于暂停期)"""
+        return self.health.get(session.key, (0, 0))[1] <= time.time()
+    
+    def circuit_state(self, session: DoubaoSession) -> str:
+        """closed: 正常; open: 暂停使用中; half_open: 暂停期已过，下一次请求成功后恢复"""
+        open_until = self.health.get(session.key, (0, 0))[1]
+        if not open_until:
+            return "closed"
+        return "open" if open_until > time.time() else "half_open"
+    
+    def report_success(self, session: DoubaoSession):
+        """请求成功，清零连续失败次数"""
+        self.health.pop(session.key, None)
+    
+    def report_failure(self, session: DoubaoSession, kind: str):
+        """请求失败，连续失败达到阈值或上游限流时暂停使用该会话"""
+        failures = self.health.get(session.key, (0, 0))[0] + 1
+        open_until = 0
+        if kind == "rate_limited" or failures >= settings.session_failure_threshold:
+            open_until = time.time() + settings.session_cooldown
+            logger.warning(f"会话 {session.key} 连续失败 {failures} 次({kind})，暂停使用 {settings.session_cooldown}s")
+        self.health[session.key] = (failures, open_until)
     
-    def set_session(self, conversation_id: str, session: DoubaoSession):
+    def find_session(self, key: str) -> Optional[DoubaoSession]:
+        """根据会话 key 查找会话"""
+        return next((s for s in self.auth_sessions + self.guest_sessions if s.key == key), None)
+    
+    async def set_session(self, conversation_id: str, session: DoubaoSession):
         """将会话与conversation_id关联"""
         self.session_map[conversation_id] = session
+        await self.store.set_affinity(conversation_id, session.key)
+    
+    async def del_conversation(self, conversation_id: str):
+        """解除conversation_id与会话的关联"""
+        self.session_map.pop(conversation_id, None)
+        await self.store.del_affinity(conversation_id)
+    
+    @asynccontextmanager
+    async def acquire(self, session: DoubaoSession):
+        """
+        占用会话的一个并发槽位，槽位已满时等待，超时抛出 SessionBusyError
+        1. 先在本进程的信号量上排队，本进程释放槽位时直接唤醒等待者
+        2. 再向共享存储登记租约，只有槽位被其他 worker 进程占满时才轮询等待
+        3. 持有槽位期间定期续期租约，长时间的深度思考不会因租约过期被其他 worker 回收
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.session_acquire_timeout
+        key = session.key
+        semaphore = None
+        if settings.session_concurrency > 0:
+            if not (semaphore := self.semaphores.get(key)):
+                semaphore = self.semaphores[key] = asyncio.Semaphore(settings.session_concurrency)
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=settings.session_acquire_timeout)
+            except asyncio.TimeoutError:
+                raise SessionBusyError(f"会话并发已满: {key}")
+        try:
+            while not (lease_id := await self.store.try_acquire(key, settings.session_concurrency, settings.session_lease_ttl)):
+                if loop.time() >= deadline:
+                    raise SessionBusyError(f"会话并发已满: {key}")
+                await asyncio.sleep(0.05)
+            renewal = asyncio.create_task(self.renew_lease(lease_id))
+            try:
+                yield session
+            finally:
+                renewal.cancel()
+                await self.store.release(lease_id)
+        finally:
+            if semaphore:
+                semaphore.release()
+    
+    async def renew_lease(self, lease_id: str):
+        """每隔三分之一有效期续期一次租约，直到被取消"""
+        while True:
+            await asyncio.sleep(settings.session_lease_ttl / 3)
+            try:
+                await self.store.renew(lease_id, settings.session_lease_ttl)
+            except Exception as e:
+                logger.warning(f"会话槽位租约续期失败: {e}")
     
     def del_session(self, session: DoubaoSession):
         """删除会话"""
-        if session.is_logged:
-            self.auth_sessions.remove(session)
-        else:
-            self.guest_sessions.remove(session)
+        for sessions in (self.auth_sessions, self.guest_sessions):
+            if session in sessions:
+                sessions.remove(session)
+        self.health.pop(session.key, None)
         self.save_to_file()
     
     def save_to_file(self):
-        """保存会话配置到文件"""
+        """
+        保存会话配置到文件
+        1. 所有写入在同一个线程中按调用顺序执行，后保存的内容不会被先保存的覆盖
+        2. 在事件循环中调用时不等待写入完成
+        """
+        data = [session.to_dict() for session in (self.auth_sessions + self.guest_sessions)]
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.writer.submit(self.write_file, data).result()
+        self.saving = loop.run_in_executor(self.writer, self.write_file, data)
+
+    async def flush(self):
+        """等待已提交的会话配置文件写入全部完成(写入按顺序执行，等待最后一次即可)"""
+        if self.saving:
+            await self.saving
+    
+    def write_file(self, data: List[dict]):
+        """先写入临时文件再替换，写入中途退出不会留下不完整的配置文件"""
+        temp_file = f"{self.config_file}.{os.getpid()}.tmp"
         try:
-            data = [session.to_dict() for session in (self.auth_sessions + self.guest_sessions)]
-            with open(self.config_file, 'w', encoding='utf-8') as f:
+            with open(temp_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.config_file)
             logger.debug(f"会话配置已保存到文件: {self.config_file}")
         except Exception as e:
             logger.error(f"保存会话配置到文件失败: {str(e)}")
@@ -127,5 +270,6 @@ session_pool = SessionPool()
 __all__ = [
     "DoubaoSession",
     "SessionPool",
+    "SessionBusyError",
     "session_pool"
 ] 
\ No newline at end of file
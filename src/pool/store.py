@@ -0,0 +1,327 @@
+import os
+import math
+import time
+import uuid
+import sqlite3
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Callable
+from loguru import logger
+
+
+class SessionStore(ABC):
+    """
+    会话状态存储接口，保存 conversation_id 与会话的对应关系以及会话并发槽位
+    所有操作都是协程，会阻塞的实现(SQLite)在独立线程中执行，不占用事件循环
+    """
+
+    @abstractmethod
+    async def get_affinity(self, conversation_id: str) -> Optional[str]:
+        """获取 conversation_id 对应的会话 key"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_affinity(self, conversation_id: str, session_key: str):
+        """将 conversation_id 与会话 key 关联"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def del_affinity(self, conversation_id: str):
+        """删除 conversation_id 的关联"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def try_acquire(self, session_key: str, limit: int, ttl: float) -> Optional[str]:
+        """尝试占用会话的一个并发槽位，成功返回租约ID，槽位已满返回 None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def renew(self, lease_id: str, ttl: float):
+        """延长租约有效期，从当前时间起算 ttl 秒"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, lease_id: str):
+        """释放租约"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def inflight(self, session_keys: List[str]) -> Dict[str, int]:
+        """各会话当前占用的槽位数"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def put_value(self, key: str, value: str, ttl: Optional[float]):
+        """保存带过期时间的键值(ttl 为 None 时不过期)，用于后台任务状态等需要跨 worker 可见的数据"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_value(self, key: str) -> Optional[str]:
+        """读取未过期的键值"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def enqueue(self, queue: str, value: str, delay: float = 0):
+        """向队列追加一项，delay 秒后才可被领取"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim(self, queue: str, limit: int, ttl: float) -> List[tuple[int, str]]:
+        """领取最多 limit 项 (item_id, value)，ttl 秒内未确认的项会重新可被领取"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def ack(self, item_id: int):
+        """确认处理完成并移出队列"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def queue_size(self, queue: str) -> int:
+        """队列中的项数，包括已领取未确认的项"""
+        raise NotImplementedError
+
+
+class MemoryStore(SessionStore):
+    """进程内存储，仅适用于单 worker 部署"""
+
+    def __init__(self):
+        self.affinity: Dict[str, str] = {}
+        # lease_id -> (session_key, 过期时间)
+        self.leases: Dict[str, tuple[str, float]] = {}
+        # key -> (value, 过期时间)
+        self.values: Dict[str, tuple[str, float]] = {}
+        # item_id -> (队列名, value, 可领取时间)
+        self.items: Dict[int, tuple[str, str, float]] = {}
+        self.next_item_id = 1
+
+    async def get_affinity(self, conversation_id: str) -> Optional[str]:
+        return self.affinity.get(conversation_id)
+
+    async def set_affinity(self, conversation_id: str, session_key: str):
+        self.affinity[conversation_id] = session_key
+
+    async def del_affinity(self, conversation_id: str):
+        self.affinity.pop(conversation_id, None)
+
+    async def try_acquire(self, session_key: str, limit: int, ttl: float) -> Optional[str]:
+        now = time.time()
+        if limit > 0 and (await self.inflight([session_key]))[session_key] >= limit:
+            return None
+        lease_id = uuid.uuid4().hex
+        self.leases[lease_id] = (session_key, now + ttl)
+        return lease_id
+
+    async def renew(self, lease_id: str, ttl: float):
+        if lease := self.leases.get(lease_id):
+            self.leases[lease_id] = (lease[0], time.time() + ttl)
+
+    async def release(self, lease_id: str):
+        self.leases.pop(lease_id, None)
+
+    async def inflight(self, session_keys: List[str]) -> Dict[str, int]:
+        now = time.time()
+        counts = dict.fromkeys(session_keys, 0)
+        for key, expire in self.leases.values():
+            if key in counts and expire > now:
+                counts[key] += 1
+        return counts
+
+    async def put_value(self, key: str, value: str, ttl: Optional[float]):
+        now = time.time()
+        # 写入时顺带清理过期数据
+        for expired in [k for k, (_, expire) in self.values.items() if expire <= now]:
+            del self.values[expired]
+        self.values[key] = (value, math.inf if ttl is None else now + ttl)
+
+    async def get_value(self, key: str) -> Optional[str]:
+        value, expire = self.values.get(key, (None, 0))
+        return value if expire > time.time() else None
+
+    async def enqueue(self, queue: str, value: str, delay: float = 0):
+        self.items[self.next_item_id] = (queue, value, time.time() + delay)
+        self.next_item_id += 1
+
+    async def claim(self, queue: str, limit: int, ttl: float) -> List[tuple[int, str]]:
+        now = time.time()
+        claimed = []
+        for item_id, (name, value, available_at) in self.items.items():
+            if len(claimed) >= limit:
+                break
+            if name == queue and available_at <= now:
+                claimed.append((item_id, value))
+        for item_id, value in claimed:
+            self.items[item_id] = (queue, value, now + ttl)
+        return claimed
+
+    async def ack(self, item_id: int):
+        self.items.pop(item_id, None)
+
+    async def queue_size(self, queue: str) -> int:
+        return sum(1 for name, _, _ in self.items.values() if name == queue)
+
+
+class SQLiteStore(SessionStore):
+    """
+    基于 SQLite WAL 的存储，同一台机器上的多个 worker 进程共享同一个数据库文件
+    1. 所有语句在单个专用线程中按提交顺序执行，等待其他进程释放写锁(最长 5 秒)时不阻塞事件循环
+    2. 槽位占用与队列领取使用 BEGIN IMMEDIATE 事务保证跨进程原子性
+    """
+
+    def __init__(self, path: str, label: str = "会话状态存储"):
+        if directory := os.path.dirname(path):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+        # 手动管理事务，isolation_level=None 时每条语句单独提交
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS affinity ("
+            "conversation_id TEXT PRIMARY KEY, session_key TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "lease_id TEXT PRIMARY KEY, session_key TEXT NOT NULL, expire_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_leases_key ON leases(session_key)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            "item_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, value TEXT NOT NULL, available_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_name ON queue(name, available_at)")
+        logger.info(f"{label}使用 SQLite: {path}")
+
+    async def run(self, func: Callable, *args):
+        """在存储线程中执行"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        return self.conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: tuple = ()) -> List[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+    def execute(self, *statements: tuple):
+        for sql, params in statements:
+            self.conn.execute(sql, params)
+
+    def transaction(self, func: Callable, *args):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(*args)
+            self.conn.execute("COMMIT")
+            return result
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    async def get_affinity(self, conversation_id: str) -> Optional[str]:
+        row = await self.run(self.fetchone, "SELECT session_key FROM affinity WHERE conversation_id = ?", (conversation_id,))
+        return row[0] if row else None
+
+    async def set_affinity(self, conversation_id: str, session_key: str):
+        await self.run(self.execute, (
+            "INSERT OR REPLACE INTO affinity (conversation_id, session_key, updated_at) VALUES (?, ?, ?)",
+            (conversation_id, session_key, time.time())
+        ))
+
+    async def del_affinity(self, conversation_id: str):
+        await self.run(self.execute, ("DELETE FROM affinity WHERE conversation_id = ?", (conversation_id,)))
+
+    async def try_acquire(self, session_key: str, limit: int, ttl: float) -> Optional[str]:
+        now = time.time()
+        lease_id = uuid.uuid4().hex
+
+        def acquire() -> Optional[str]:
+            self.conn.execute("DELETE FROM leases WHERE session_key = ? AND expire_at <= ?", (session_key, now))
+            if limit > 0:
+                count = self.fetchone("SELECT COUNT(*) FROM leases WHERE session_key = ?", (session_key,))[0]
+                if count >= limit:
+                    return None
+            self.conn.execute(
+                "INSERT INTO leases (lease_id, session_key, expire_at) VALUES (?, ?, ?)",
+                (lease_id, session_key, now + ttl)
+            )
+            return lease_id
+
+        return await self.run(self.transaction, acquire)
+
+    async def renew(self, lease_id: str, ttl: float):
+        await self.run(self.execute, ("UPDATE leases SET expire_at = ? WHERE lease_id = ?", (time.time() + ttl, lease_id)))
+
+    async def release(self, lease_id: str):
+        await self.run(self.execute, ("DELETE FROM leases WHERE lease_id = ?", (lease_id,)))
+
+    async def inflight(self, session_keys: List[str]) -> Dict[str, int]:
+        counts = dict.fromkeys(session_keys, 0)
+        if session_keys:
+            rows = await self.run(
+                self.fetchall,
+                f"SELECT session_key, COUNT(*) FROM leases WHERE expire_at > ? "
+                f"AND session_key IN ({','.join('?' * len(session_keys))}) GROUP BY session_key",
+                (time.time(), *session_keys)
+            )
+            counts.update(dict(rows))
+        return counts
+
+    async def put_value(self, key: str, value: str, ttl: Optional[float]):
+        now = time.time()
+        expire_at = math.inf if ttl is None else now + ttl
+        await self.run(
+            self.execute,
+            ("DELETE FROM kv WHERE expire_at <= ?", (now,)),
+            ("INSERT OR REPLACE INTO kv (key, value, expire_at) VALUES (?, ?, ?)", (key, value, expire_at))
+        )
+
+    async def get_value(self, key: str) -> Optional[str]:
+        row = await self.run(self.fetchone, "SELECT value FROM kv WHERE key = ? AND expire_at > ?", (key, time.time()))
+        return row[0] if row else None
+
+    async def enqueue(self, queue: str, value: str, delay: float = 0):
+        await self.run(self.execute, (
+            "INSERT INTO queue (name, value, available_at) VALUES (?, ?, ?)", (queue, value, time.time() + delay)
+        ))
+
+    async def claim(self, queue: str, limit: int, ttl: float) -> List[tuple[int, str]]:
+        now = time.time()
+
+        # 领取与延后可见时间在同一事务中完成，多个 worker 不会领取到同一项
+        def claim() -> List[tuple[int, str]]:
+            rows = self.fetchall(
+                "SELECT item_id, value FROM queue WHERE name = ? AND available_at <= ? ORDER BY item_id LIMIT ?",
+                (queue, now, limit)
+            )
+            self.conn.executemany(
+                "UPDATE queue SET available_at = ? WHERE item_id = ?", [(now + ttl, row[0]) for row in rows]
+            )
+            return [(row[0], row[1]) for row in rows]
+
+        return await self.run(self.transaction, claim)
+
+    async def ack(self, item_id: int):
+        await self.run(self.execute, ("DELETE FROM queue WHERE item_id = ?", (item_id,)))
+
+    async def queue_size(self, queue: str) -> int:
+        return (await self.run(self.fetchone, "SELECT COUNT(*) FROM queue WHERE name = ?", (queue,)))[0]
+
+
+def create_store(url: str, label: str = "会话状态存储") -> SessionStore:
+    """根据 URL 创建存储: memory:// 或 sqlite:///path/to/file.db，label 用于日志中说明存储的用途"""
+    if url.startswith("memory://"):
+        return MemoryStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):], label)
+    raise ValueError(f"不支持的会话存储: {url}")
+
+
+__all__ = [
+    "SessionStore",
+    "MemoryStore",
+    "SQLiteStore",
+    "create_store"
+]
@@ -1 +1,11 @@
-from .doubao_service import *
\ No newline at end of file
+from .doubao_service import *
+from .limiter import *
+from .loop_monitor import *
+from .lifecycle import *
+from .profiling import *
+from .deletion import *
+from .url_upload import *
+from .image_cache import *
+from .completion import *
+from .jobs import *
+from .openai_compat import *
\ No newline at end of file
@@ -0,0 +1,165 @@
+import base64
+import asyncio
+import binascii
+from typing import List, AsyncIterator, Awaitable, Optional
+from fastapi import HTTPException
+from pydantic import BaseModel
+from src.config import settings
+from src.cluster import cluster_router
+from src.model.request import CompletionRequest, InlineFile
+from src.pool import DoubaoSession
+from src.model.response import CompletionResponse, BatchCompletionResponse
+from .doubao_service import chat_completion, chat_completion_stream, upload_file
+from .url_upload import upload_from_url
+from .image_cache import image_cache
+from .deletion import delete_queue
+
+# 批量补全的全局并发上限，所有批量请求共享
+batch_semaphore: Optional[asyncio.Semaphore] = None
+
+
+async def upload_attachments(uploads: List[Awaitable[BaseModel]]) -> List[dict]:
+    """并发执行上传，全部完成后返回附件信息，任一失败时取消其余上传"""
+    tasks = [asyncio.ensure_future(upload) for upload in uploads]
+    try:
+        return [result.model_dump() for result in await asyncio.gather(*tasks)]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def upload_inline(file: InlineFile) -> BaseModel:
+    """上传单个内联文件"""
+    if file.url:
+        return await upload_from_url(file.file_type, file.url, file.file_name)
+    try:
+        data = base64.b64decode(file.data or "", validate=True)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail=f"文件内容不是有效的 base64: {file.file_name}")
+    return await upload_file(file.file_type, file.file_name, data)
+
+
+async def attach_files(completion: CompletionRequest) -> CompletionRequest:
+    """上传请求中的内联文件，返回附件已就绪的请求"""
+    if not completion.files:
+        return completion
+    attachments = await upload_attachments([upload_inline(file) for file in completion.files])
+    return completion.model_copy(update={"attachments": completion.attachments + attachments, "files": []})
+
+
+async def complete(completion: CompletionRequest) -> CompletionResponse:
+    """执行补全请求，返回的 conversation_id 带上集群节点标识"""
+    completion = await attach_files(completion)
+    text, imgs, conv_id, msg_id, sec_id = await chat_completion(
+        prompt=completion.prompt,
+        guest=completion.guest,
+        conversation_id=cluster_router.decode(completion.conversation_id)[1],
+        section_id=completion.section_id,
+        attachments=completion.attachments,
+        use_auto_cot=completion.use_auto_cot,
+        use_deep_think=completion.use_deep_think,
+        hedge=completion.hedge
+    )
+    if completion.ephemeral and conv_id:
+        await delete_queue.enqueue(conv_id)
+    return CompletionResponse(
+        text=text,
+        img_urls=imgs,
+        img_ids=[cluster_router.encode(image_cache.id_of(url)) for url in imgs],
+        conversation_id=cluster_router.encode(conv_id),
+        messageg_id=msg_id,
+        section_id=sec_id
+    )
+
+
+async def stream_complete(completion: CompletionRequest, session: Optional[DoubaoSession] = None) -> AsyncIterator[dict]:
+    """流式执行补全请求，最后返回 {"type": "end", ...CompletionResponse} 汇总事件"""
+    completion = await attach_files(completion)
+    texts = []
+    image_urls = []
+    meta = {"conversation_id": "", "message_id": "", "section_id": ""}
+    try:
+        async for delta in chat_completion_stream(
+            prompt=completion.prompt,
+            guest=completion.guest,
+            conversation_id=cluster_router.decode(completion.conversation_id)[1],
+            section_id=completion.section_id,
+            attachments=completion.attachments,
+            use_auto_cot=completion.use_auto_cot,
+            use_deep_think=completion.use_deep_think,
+            hedge=completion.hedge,
+            session=session
+        ):
+            if delta["type"] == "meta":
+                meta = {**delta, "conversation_id": cluster_router.encode(delta["conversation_id"])}
+                delta = meta
+            elif delta["type"] == "text":
+                texts.append(delta["text"])
+            elif delta["type"] == "image":
+                image_urls.append(delta["url"])
+                # 图片缓存在下载它的节点上，图片 ID 与对话一样带上节点标识
+                delta = {**delta, "id": cluster_router.encode(delta["id"])}
+            yield delta
+    finally:
+        # 客户端中途断开或上游出错时，已创建的临时对话同样需要删除
+        if completion.ephemeral and meta["conversation_id"]:
+            await delete_queue.enqueue(cluster_router.decode(meta["conversation_id"])[1])
+    response = CompletionResponse(
+        text="".join(texts).lstrip('\n').rstrip("\n"),
+        img_urls=image_urls,
+        img_ids=[cluster_router.encode(image_cache.id_of(url)) for url in image_urls],
+        conversation_id=meta["conversation_id"],
+        messageg_id=meta["message_id"],
+        section_id=meta["section_id"]
+    )
+    yield {"type": "end", **response.model_dump()}
+
+
+async def complete_anywhere(completion: CompletionRequest) -> CompletionResponse:
+    """对话属于其他节点时转发，否则本地执行"""
+    if not (owner := cluster_router.owner_of(completion.conversation_id)):
+        return await complete(completion)
+    status, body, _ = await cluster_router.forward(owner, "POST", "/api/chat/completions", json=completion.model_dump())
+    if status != 200:
+        raise HTTPException(status_code=status, detail=body.decode('utf-8', errors='replace'))
+    return CompletionResponse.model_validate_json(body)
+
+
+async def batch_completion(completions: List[CompletionRequest]) -> AsyncIterator[BatchCompletionResponse]:
+    """
+    批量补全，按完成顺序逐条返回结果
+    1. 全局并发受 batch_concurrency 限制，单个会话的并发仍受会话槽位限制
+    2. 调用方停止读取(如断开连接)时取消尚未完成的请求
+    """
+    global batch_semaphore
+    if batch_semaphore is None:
+        batch_semaphore = asyncio.Semaphore(settings.batch_concurrency)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run(index: int, completion: CompletionRequest):
+        async with batch_semaphore:
+            try:
+                item = BatchCompletionResponse(index=index, ok=True, result=await complete_anywhere(completion))
+            except HTTPException as e:
+                item = BatchCompletionResponse(index=index, ok=False, status=e.status_code, error=str(e.detail))
+            except Exception as e:
+                item = BatchCompletionResponse(index=index, ok=False, status=500, error=str(e))
+        await results.put(item)
+
+    tasks = [asyncio.create_task(run(index, completion)) for index, completion in enumerate(completions)]
+    try:
+        for _ in range(len(tasks)):
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+__all__ = [
+    "upload_attachments",
+    "attach_files",
+    "complete",
+    "stream_complete",
+    "complete_anywhere",
+    "batch_completion"
+]
@@ -0,0 +1,124 @@
+import json
+import asyncio
+from typing import Optional, List
+from loguru import logger
+from src.config import settings
+from src.metrics import metrics
+from src.pool.session_pool import session_pool
+from src.pool.store import SessionStore, create_store
+from .doubao_service import delete_conversation
+
+QUEUE_NAME = "delete"
+
+
+class DeleteQueue:
+    """
+    后台删除对话
+    1. 入队时记录对话所属的会话并立即解除关联，调用方无需等待上游删除完成
+    2. 后台协程按批领取，限制并发与速率，失败按指数退避重试
+    3. 队列保存在 SQLite 中，服务重启后继续删除未完成的对话；存储在启动或首次使用时才创建，导入模块时不创建数据库文件
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.store: Optional[SessionStore] = None
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.closing = False
+
+    def open(self) -> SessionStore:
+        """获取队列存储，首次调用时创建"""
+        if self.store is None:
+            self.store = create_store(self.url, label="后台删除队列")
+        return self.store
+
+    def start(self):
+        self.open()
+        if self.task is None:
+            self.closing = False
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.drain())
+
+    async def stop(self, timeout: float = 0):
+        """停止领取新的对话，正在删除的对话最多再等待 timeout 秒，超时中断的对话在领取可见期过后重新删除"""
+        if self.task:
+            self.closing = True
+            self.wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self.task), timeout)
+            except asyncio.TimeoutError:
+                self.task.cancel()
+                await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def enqueue(self, conversation_id: str) -> bool:
+        """加入删除队列，对话不存在时返回 False"""
+        if not (session := await session_pool.get_session(conversation_id)):
+            return False
+        item = {"conversation_id": conversation_id, "session_key": session.key, "attempts": 0}
+        await self.open().enqueue(QUEUE_NAME, json.dumps(item))
+        await session_pool.del_conversation(conversation_id)
+        metrics.inc("delete_queue_total", result="queued")
+        if self.wakeup:
+            self.wakeup.set()
+        return True
+
+    async def size(self) -> int:
+        return await self.open().queue_size(QUEUE_NAME)
+
+    async def drain(self):
+        semaphore = asyncio.Semaphore(settings.delete_concurrency)
+        while not self.closing:
+            # 领取后超过可见期未确认(如进程退出)的项会被重新领取
+            items = await self.store.claim(QUEUE_NAME, settings.delete_batch_size, ttl=settings.delete_claim_ttl)
+            metrics.set("delete_queue_depth", await self.size())
+            if not items:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=settings.delete_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            tasks: List[asyncio.Task] = []
+            for item_id, value in items:
+                if self.closing:
+                    # 停止时尚未开始的项放回队列，重启后立即可以领取
+                    await self.store.ack(item_id)
+                    await self.store.enqueue(QUEUE_NAME, value)
+                    continue
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(self.process(item_id, json.loads(value), semaphore)))
+                # 控制删除速率，避免集中请求触发上游限流
+                await asyncio.sleep(1 / settings.delete_rate)
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def process(self, item_id: int, item: dict, semaphore: asyncio.Semaphore):
+        try:
+            conversation_id = item["conversation_id"]
+            if not (session := session_pool.find_session(item["session_key"])):
+                logger.warning(f"对话 {conversation_id} 所属会话已不存在，放弃删除")
+                metrics.inc("delete_queue_total", result="dropped")
+                return await self.store.ack(item_id)
+            try:
+                ok, msg = await delete_conversation(conversation_id, session)
+            except Exception as e:
+                ok, msg = False, str(e)
+            await self.store.ack(item_id)
+            if ok:
+                metrics.inc("delete_queue_total", result="deleted")
+            elif (attempts := item["attempts"] + 1) < settings.delete_max_attempts:
+                await self.store.enqueue(QUEUE_NAME, json.dumps({**item, "attempts": attempts}), delay=2 ** attempts)
+                metrics.inc("delete_queue_total", result="retried")
+            else:
+                logger.error(f"删除对话 {conversation_id} 失败 {attempts} 次，放弃: {msg}")
+                metrics.inc("delete_queue_total", result="failed")
+        finally:
+            semaphore.release()
+
+
+delete_queue = DeleteQueue(settings.delete_queue_url)
+
+__all__ = [
+    "DeleteQueue",
+    "delete_queue"
+]
@@ -1,16 +1,32 @@
-from typing import Optional, List, Dict
-from src.pool.session_pool import session_pool
+from typing import Optional, List, Dict, Set, AsyncIterator, Awaitable, Callable, NamedTuple, TypeVar
+from src.pool.session_pool import session_pool, DoubaoSession, SessionBusyError
+from src.config import settings
+from src.metrics import metrics
+from src.tracing import tracing
+from .errors import *
+from .limiter import adaptive_limiter, LimiterRejected
+from .imaging import prepare_image
+from .image_cache import image_cache
+from .request_builder import get_builder, IMAGEX_HEADERS, TOS_HEADERS
 from requests_aws4auth import AWS4Auth
 from fastapi import HTTPException
 from loguru import logger
+import asyncio
+from collections import deque
+from contextlib import aclosing, AsyncExitStack
 import aiohttp
 import httpx
 import json
-import uuid
+import math
 import hashlib
 import binascii
 import os
 
+T = TypeVar("T")
+
+# 超过该大小的文件在线程中计算校验值
+DIGEST_THREAD_SIZE = 1024 * 1024
+
 async def chat_completion(
     prompt: str, 
     guest: bool,
@@ -18,102 +34,392 @@ async def chat_completion(
     conversation_id: str = None, 
     attachments: List[dict] = [], 
     use_auto_cot: bool = False, 
-    use_deep_think: bool = False
+    use_deep_think: bool = False,
+    hedge: bool = False
 ):
+    """对话补全，汇总流式事件后返回 (文本, 图片列表, conversation_id, message_id, section_id)"""
+    texts = []
+    image_urls = []
+    message_id = ""
+    async for delta in chat_completion_stream(
+        prompt=prompt,
+        guest=guest,
+        section_id=section_id,
+        conversation_id=conversation_id,
+        attachments=attachments,
+        use_auto_cot=use_auto_cot,
+        use_deep_think=use_deep_think,
+        hedge=hedge
+    ):
+        if delta["type"] == "meta":
+            conversation_id = delta["conversation_id"]
+            message_id = delta["message_id"]
+            section_id = delta["section_id"]
+        elif delta["type"] == "text":
+            texts.append(delta["text"])
+        elif delta["type"] == "image":
+            image_urls.append(delta["url"])
+    text = "".join(texts).lstrip('\n').rstrip("\n")
+    return text, image_urls, conversation_id, message_id, section_id
+
+
+async def chat_completion_stream(
+    prompt: str, 
+    guest: bool,
+    section_id: str = None, 
+    conversation_id: str = None, 
+    attachments: List[dict] = [], 
+    use_auto_cot: bool = False, 
+    use_deep_think: bool = False,
+    hedge: bool = False,
+    session: Optional[DoubaoSession] = None
+) -> AsyncIterator[dict]:
+    """
+    流式对话补全，按到达顺序返回解析出的事件
+    1. {"type": "meta", "conversation_id", "message_id", "section_id"} 流开始
+    2. {"type": "text", "text"} 文字增量
+    3. {"type": "image", "url", "id"} 生成的图片，id 用于 /api/image/{id}
+    hedge 仅对新对话生效: 首个事件迟迟未到时在另一个会话上同时发起请求，使用先开始返回的一个
+    session 为调用方已持有的对话所属会话(如 WebSocket 连接)，省去按对话查找
+    """
     # 获取会话配置
-    session = session_pool.get_session(conversation_id, guest)
+    with tracing.span("session.select", **{"doubao.guest": guest, "doubao.new_conversation": conversation_id is None}):
+        session = session or await session_pool.get_session(conversation_id, guest)
     if not session:
         raise HTTPException(status_code=404, detail=f"会话配置不存在,请检查 session.config 文件")
     
-    # ------ PARAMS -------
-    params = "&".join([
-        "aid=497858",
-        f"device_id={session.device_id}",
-        "device_platform=web",
-        "language=zh",
-        "pc_version=3.3.5",  # 更新到最新版本
-        "pkg_type=release_version",
-        "real_aid=497858",
-        "region=CN",
-        "samantha_web=1",
-        "sys_region=CN",
-        f"tea_uuid={session.tea_uuid}",
-        "use-olympus-account=1",
-        "version_code=20800",
-        f"web_id={session.web_id}"
-    ])
-    
-    # ------ URL -------
-    url = "https://www.doubao.com/samantha/chat/completion?" + params
-    
-    # ------ BODY -------
-    body = {
-        "completion_option": {
-            "is_regen": False,
-            "with_suggest": False,
-            "need_create_conversation": conversation_id is None,
-            "launch_stage": 1,
-            "use_auto_cot": use_auto_cot,
-            "use_deep_think": use_deep_think
-        },
-        "conversation_id": "0" if conversation_id is None else conversation_id,
-        "messages": [
-            {
-                "content": json.dumps({"text": prompt}),
-                "content_type": 2001,
-                "attachments": attachments,
-                "references": []
-            }
-        ]
-    }
-    
-    if section_id is not None:
-        body["section_id"] = section_id
-    
-    # 如果是未登录账户，则不需要 local 字段
-    if not guest:
-        body["local_conversation_id"] = f"local_{int(uuid.uuid4().int % 10000000000000000)}" 
-        body["local_message_id"] = str(uuid.uuid4())
-    
-    # ------ HEADERS -------
-    headers = {
-        'content-type': 'application/json',
-        'accept': 'text/event-stream',
-        'agw-js-conv': 'str',
-        'cookie': session.cookie,
-        'origin': "https://www.doubao.com",
-        'referer': f"https://www.doubao.com/chat/{session.room_id}",
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36',
-        "x-flow-trace": session.x_flow_trace
-    }
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    tried = {session.key}
+    while True:
+        # 流开始事件暂缓返回，收到首个内容前失败时调用方还没有收到任何数据
+        meta = None
+        emitted = False
+        try:
+            if hedge and conversation_id is None:
+                stream = hedged_completion_stream(
+                    session, tried, prompt, guest, attachments, use_auto_cot, use_deep_think
+                )
+            else:
+                stream = session_completion_stream(
+                    session, prompt, guest, section_id, conversation_id, attachments, use_auto_cot, use_deep_think
+                )
+            # 调用方提前关闭时立即关闭上游流，不等待垃圾回收
+            async with aclosing(stream):
+                async for delta in stream:
+                    if delta["type"] == "meta":
+                        meta = delta
+                        continue
+                    emitted = True
+                    if meta:
+                        yield meta
+                        meta = None
+                    yield delta
+            if meta:
+                yield meta
+            return
+        except UpstreamError as e:
+            if meta and conversation_id is None:
+                # 新对话已创建但调用方尚未收到，无论是否重试都不会再被使用，解除关联并在后台删除
+                # deletion 模块依赖本模块，在此处导入避免循环导入
+                from .deletion import delete_queue
+                await delete_queue.enqueue(meta["conversation_id"])
+            # 只有新对话且尚未返回任何内容时才能安全地换会话重试
+            if (
+                emitted or conversation_id is not None or not retryable(e)
+                or len(tried) > settings.upstream_retries
+                or loop.time() - started_at > settings.upstream_retry_budget
+                or not (retry_session := await session_pool.failover_session(guest, tried))
+            ):
+                raise
+            metrics.inc("upstream_retry_total", kind=e.kind)
+            logger.warning(f"会话 {session.key} 请求失败({e.kind})，换用会话 {retry_session.key} 重试")
+            session = retry_session
+            tried.add(session.key)
+
+
+class HedgeBudget:
+    """
+    对冲请求预算，限制对冲请求占全部请求的比例
+    每个可对冲的请求积累 hedge_max_rate 个令牌，发起一次对冲消耗 1 个
+    """
+
+    def __init__(self, burst: float = 10.0):
+        self.burst = burst
+        self.tokens = 0.0
+
+    def record(self):
+        self.tokens = min(self.burst, self.tokens + settings.hedge_max_rate)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+hedge_budget = HedgeBudget()
+# 被放弃的对冲请求创建的对话，在后台删除
+discard_tasks = set()
+# 是否深度思考 -> 最近的首个事件耗时(秒，从开始连接上游算起，不含排队等待)
+ttfb_samples: Dict[bool, deque] = {
+    False: deque(maxlen=settings.hedge_window),
+    True: deque(maxlen=settings.hedge_window)
+}
+
+
+def hedge_delay(use_deep_think: bool) -> float:
+    """
+    发起对冲前等待首个事件的时间，取同一模式最近首个事件耗时的 p95，样本不足时使用默认值
+    深度思考与普通对话分开统计，使用原始样本而不是直方图分桶的上界
+    """
+    samples = ttfb_samples[use_deep_think]
+    if len(samples) < settings.hedge_min_samples:
+        return settings.hedge_delay
+    ordered = sorted(samples)
+    return max(settings.hedge_min_delay, ordered[math.ceil(len(ordered) * 0.95) - 1])
+
+
+async def hedged_completion_stream(
+    session: DoubaoSession,
+    tried: Set[str],
+    prompt: str,
+    guest: bool,
+    attachments: List[dict],
+    use_auto_cot: bool,
+    use_deep_think: bool
+) -> AsyncIterator[dict]:
+    """
+    对冲的新对话补全
+    1. 首个事件超过 hedge_delay 未到达时，在另一个健康会话上再发起一次相同的请求
+    2. 先返回首个事件的请求胜出，另一个请求被取消，已创建的对话在后台删除
+    3. 对冲占比受 hedge_max_rate 限制，全部请求失败时抛出最后一个错误
+    """
+    attempts: Dict[asyncio.Task, AsyncIterator[dict]] = {}
+
+    def start(attempt_session: DoubaoSession):
+        stream = session_completion_stream(
+            attempt_session, prompt, guest, None, None, attachments, use_auto_cot, use_deep_think
+        )
+        attempts[asyncio.ensure_future(stream.__anext__())] = stream
+
+    hedge_budget.record()
+    start(session)
+    pending = set(attempts)
+    hedged = False
+    winner = None
+    error = None
     try:
-        # 禁用代理，直连豆包服务器
-        connector = aiohttp.TCPConnector(force_close=True)
-        async with aiohttp.ClientSession(connector=connector) as aio_session:
-            async with aio_session.post(url=url, headers=headers, json=body, proxy=None) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"豆包API对话补全失败: {response.status}, 详情: {error_text}")
-                try:
-                    # 下一次会话需要同一个session
-                    text, image_urls, conversation_id, message_id, section_id = await handle_sse(response)
-                    session_pool.set_session(conversation_id, session)
-                    return text, image_urls, conversation_id, message_id, section_id
-                except LimitedException:
-                    session_pool.del_session(session)
-                    raise HTTPException(status_code=500, detail=f"游客限制5次会话已用完，请重使用新Session")
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, timeout=None if hedged else hedge_delay(use_deep_think), return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+                error = task.exception()
+            if not done and not hedged:
+                hedged = True
+                if hedge_budget.try_spend() and (hedge_session := await session_pool.failover_session(guest, tried)):
+                    tried.add(hedge_session.key)
+                    metrics.inc("upstream_hedge_total")
+                    logger.debug(f"会话 {session.key} 首个事件超时，对冲到会话 {hedge_session.key}")
+                    start(hedge_session)
+                    pending = {task for task in attempts if not task.done()}
+    finally:
+        for task, stream in attempts.items():
+            if task is not winner:
+                await discard_attempt(task, stream)
+    if winner is None:
+        # 上游流未返回任何事件就结束，异步生成器中不能直接抛出 StopAsyncIteration
+        if isinstance(error, StopAsyncIteration):
+            raise UpstreamError(PROTOCOL, "豆包API响应流未返回任何事件")
+        raise error
+    if hedged and len(attempts) > 1:
+        metrics.inc("upstream_hedge_won_total", attempt="hedge" if winner is list(attempts)[1] else "primary")
+    stream = attempts[winner]
+    async with aclosing(stream):
+        yield winner.result()
+        async for delta in stream:
+            yield delta
+
+
+async def discard_attempt(task: asyncio.Task, stream: AsyncIterator[dict]):
+    """取消落败的对冲请求，已经创建的对话在后台删除"""
+    task.cancel()
+    result, = await asyncio.gather(task, return_exceptions=True)
+    await stream.aclose()
+    if isinstance(result, dict) and result["type"] == "meta":
+        cleanup = asyncio.create_task(delete_conversation(result["conversation_id"]))
+        discard_tasks.add(cleanup)
+        cleanup.add_done_callback(discard_tasks.discard)
+
+
+def retryable(e: UpstreamError) -> bool:
+    """连接错误、上游 5xx、网关错误等发生在流开始前的失败可以换会话重试"""
+    if e.kind == HTTP_STATUS:
+        return e.status is not None and e.status >= 500
+    return e.kind in (CONNECT, GATEWAY, PROTOCOL, TIMEOUT_FIRST_EVENT, RATE_LIMITED, LIMITED)
+
+
+async def session_completion_stream(
+    session: DoubaoSession,
+    prompt: str,
+    guest: bool,
+    section_id: Optional[str],
+    conversation_id: Optional[str],
+    attachments: List[dict],
+    use_auto_cot: bool,
+    use_deep_think: bool
+) -> AsyncIterator[dict]:
+    """使用指定会话请求一次对话补全，返回的事件同 chat_completion_stream"""
+    # 查询参数与请求头按会话预先构造，请求体只序列化本次变化的字段
+    builder = get_builder(session)
+    body = builder.completion_body(
+        prompt=prompt,
+        guest=guest,
+        conversation_id=conversation_id,
+        section_id=section_id,
+        attachments=attachments,
+        use_auto_cot=use_auto_cot,
+        use_deep_think=use_deep_think
+    )
+    profile = timeout_profile(use_deep_think)
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    deadline = started_at + profile.total
+    started = False
+    # 跨越 yield 的 span 不能设为当前 span，显式指定父级并在结束时关闭
+    upstream_span = tracing.start_span("upstream.completion", **{"doubao.session": session.key, "doubao.deep_think": use_deep_think})
+    first_event_span = None
+    try:
+        async with AsyncExitStack() as slots:
+            # 先占用会话并发槽位再占用全局自适应并发槽位，等待会话空闲时不占用全局槽位；
+            # 多 worker 部署时会话槽位计数在共享存储中
+            with tracing.span("upstream.queue_wait", parent=upstream_span):
+                await slots.enter_async_context(session_pool.acquire(session))
+                await slots.enter_async_context(adaptive_limiter.acquire())
+            # 首个事件耗时从占到槽位后开始计算，排队等待不计入，否则限制器会因自身排队误判上游变慢
+            connect_at = loop.time()
+            # 禁用代理，直连豆包服务器
+            connector = aiohttp.TCPConnector(force_close=True)
+            timeout = aiohttp.ClientTimeout(total=None, connect=profile.connect, sock_connect=profile.connect)
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as aio_session:
+                with tracing.span("upstream.connect", parent=upstream_span):
+                    response = await wait_upstream(
+                        aio_session.post(url=builder.completion_url, headers=builder.completion_headers, data=body, proxy=None),
+                        started, deadline, profile
+                    )
+                first_event_span = tracing.start_span("upstream.first_event", parent=upstream_span)
+                async with response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        raise UpstreamError(HTTP_STATUS, f"豆包API对话补全失败: {response.status}, 详情: {error_text}", response.status)
+                    events = handle_sse(response)
+                    try:
+                        while True:
+                            try:
+                                delta = await wait_upstream(events.__anext__(), started, deadline, profile)
+                            except StopAsyncIteration:
+                                break
+                            if delta["type"] == "meta":
+                                started = True
+                                tracing.end_span(first_event_span)
+                                ttfb = loop.time() - connect_at
+                                metrics.observe("upstream_ttfb_seconds", ttfb)
+                                ttfb_samples[use_deep_think].append(ttfb)
+                                # 深度思考的首个事件耗时不参与过载判断
+                                adaptive_limiter.on_success(None if use_deep_think else ttfb)
+                                # 下一次会话需要同一个session
+                                await session_pool.set_session(delta["conversation_id"], session)
+                            yield delta
+                    except LimitedException:
+                        session_pool.del_session(session)
+                        raise UpstreamError(LIMITED, "游客限制5次会话已用完，请重使用新Session")
+                    finally:
+                        await events.aclose()
+        session_pool.report_success(session)
+    except (asyncio.CancelledError, GeneratorExit):
+        # 调用方已放弃(客户端断开、任务取消)，上游连接随上下文退出立即关闭
+        metrics.inc("upstream_cancelled_total")
+        upstream_span.set_attribute("doubao.cancelled", True)
+        raise
+    except SessionBusyError as e:
+        tracing.end_span(upstream_span, e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except LimiterRejected as e:
+        tracing.end_span(upstream_span, e)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        raise Exception(f"豆包API请求失败: {str(e)}")
+        kind = e.kind if isinstance(e, UpstreamError) else classify_error(e)
+        session_pool.report_failure(session, kind)
+        adaptive_limiter.on_failure(kind, getattr(e, "status", None))
+        metrics.inc("upstream_failures_total", kind=kind)
+        tracing.end_span(upstream_span, e)
+        raise UpstreamError(kind, f"豆包API请求失败: {str(e)}", getattr(e, "status", None)) from e
+    finally:
+        if first_event_span is not None:
+            tracing.end_span(first_event_span)
+        tracing.end_span(upstream_span)
+
+
+class TimeoutProfile(NamedTuple):
+    """上游请求的分级超时(秒)"""
+    connect: float
+    first_event: float
+    idle: float
+    total: float
+
+
+def timeout_profile(use_deep_think: bool) -> TimeoutProfile:
+    """深度思考首个事件与事件间隔都明显更长，使用单独的超时配置"""
+    if use_deep_think:
+        return TimeoutProfile(
+            settings.upstream_connect_timeout,
+            settings.deep_think_first_event_timeout,
+            settings.deep_think_idle_timeout,
+            settings.deep_think_total_timeout
+        )
+    return TimeoutProfile(
+        settings.upstream_connect_timeout,
+        settings.upstream_first_event_timeout,
+        settings.upstream_idle_timeout,
+        settings.upstream_total_timeout
+    )
+
+
+async def wait_upstream(awaitable: Awaitable[T], started: bool, deadline: float, profile: TimeoutProfile) -> T:
+    """
+    等待上游的下一步结果，超时时中断并按阶段分类
+    流开始前使用首个事件超时，流开始后使用事件间隔超时，二者都不超过剩余总时长
+    """
+    remaining = deadline - asyncio.get_running_loop().time()
+    step = profile.idle if started else profile.first_event
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(0, min(step, remaining)))
+    except aiohttp.ServerTimeoutError as e:
+        raise UpstreamError(CONNECT, f"连接上游超时: {str(e)}")
+    except asyncio.TimeoutError:
+        if remaining <= step:
+            raise UpstreamError(TIMEOUT_TOTAL, f"上游请求超过总时长 {profile.total}s")
+        if started:
+            raise UpstreamError(TIMEOUT_IDLE, f"上游流 {step}s 内没有新事件")
+        raise UpstreamError(TIMEOUT_FIRST_EVENT, f"上游 {step}s 内没有开始响应")
+
+
+def classify_error(e: Exception) -> str:
+    """对未分类的异常归类"""
+    if isinstance(e, (aiohttp.ClientConnectionError, OSError)):
+        return CONNECT
+    return PROTOCOL
 
 
-async def handle_sse(response: aiohttp.ClientResponse):
-    """处理SSE流响应"""
+async def handle_sse(response: aiohttp.ClientResponse) -> AsyncIterator[dict]:
+    """处理SSE流响应，逐个返回解析出的事件，流结束(2003)时返回"""
     buffer = ""
-    conversation_id = ""
-    message_id = ""
-    section_id = ""
-    texts = []
-    image_urls = []
+    # 图片生成过程中同一张图片会重复推送
+    image_urls = set()
     
     async for chunk in response.content.iter_chunked(1024):
         buffer += chunk.decode('utf-8', errors='replace')
@@ -127,15 +433,14 @@ async def handle_sse(response: aiohttp.ClientResponse):
             if error_match != -1:
                 try:
                     error_data = json.loads(buffer[error_match + 6:].split('\n')[0])
-                    raise Exception(f"服务器返回网关错误: {error_data.get('code')} - {error_data.get('message')}")
                 except Exception as e:
-                    raise Exception(f"服务器返回网关错误: {buffer}")
+                    raise UpstreamError(GATEWAY, f"服务器返回网关错误: {buffer}")
+                raise UpstreamError(GATEWAY, f"服务器返回网关错误: {error_data.get('code')} - {error_data.get('message')}")
         
         events = buffer.split('\n\n')
         buffer = events.pop()
         
         for evt in events:
-            print(evt)
             lines = evt.strip().split('\n')
             data_line = next((l for l in lines if l.startswith('data: ')), None)
             if not data_line:
@@ -145,64 +450,115 @@ async def handle_sse(response: aiohttp.ClientResponse):
                 evt_obj = json.loads(data_line[6:])
                 event_type = evt_obj.get('event_type')
                 event_data = json.loads(evt_obj.get('event_data', '{}'))
-                if event_type == 2001:
-                    # 流消息                      
-                    if not (msg := event_data.get('message')): continue
-                    
-                    content_type = msg.get('content_type')
-                    if content_type in [10000, 2001, 2008]:
-                        # 文字消息
-                        text = json.loads(msg.get('content', '{}')).get('text', )
-                        if text:
-                            texts.append(text)
-                    elif content_type == 2030:
-                        # 新的消息类型（包含图片识别结果）
-                        content = json.loads(msg.get('content', '{}'))
-                        text = content.get('text', '')
-                        if text:
-                            texts.append(text)
-                    elif content_type == 2074:
-                        # 图片消息
-                        creations = json.loads(msg.get('content', '{}')).get('creations', [])
-                        for creation in creations:
-                            image_info = creation.get('image', {})
-                            # 只处理status为2的完成图片
-                            if image_info.get('status') == 2:
-                                url = (image_info.get('image_raw', {}).get('url') or 
-                                        image_info.get('image_thumb', {}).get('url') or
-                                        image_info.get('image_ori', {}).get('url'))
-                                
-                                if url and url not in image_urls:
-                                    image_urls.append(url)
-                    else:
-                        logger.warning(f"未知的消息类型 {content_type}")
-                elif event_type == 2002:
-                    # 流开始
-                    conversation_id = event_data.get("conversation_id")
-                    message_id = event_data.get("message_id")
-                    section_id = event_data.get("section_id")
-                    logger.debug(f"SSE流开始: 会话ID={conversation_id}, 消息ID={message_id}")
-                elif event_type == 2003:
-                    # 流结束
-                    text = "".join(texts)
-                    text = text.lstrip('\n').rstrip("\n")
-                    logger.debug(f"SSE流结束: 获取到文本长度={len(text)}, 图片数量={len(image_urls)}")
-                    return text, image_urls, conversation_id, message_id, section_id
-                elif event_type == 2005:
-                    # 错误事件
-                    error_code = event_data.get("code")
-                    error_message = event_data.get("message", "未知错误")
-                    logger.error(f"豆包API返回错误: code={error_code}, message={error_message}")
-                    raise Exception(f"豆包API错误 [{error_code}]: {error_message}")
-                else:
-                    logger.warning(f"未知的流类型 {event_type}")
             except Exception as e:
-                raise Exception(f"解析SSE失败: {str(e)}")
+                raise UpstreamError(PROTOCOL, f"解析SSE失败: {str(e)}")
+            
+            if event_type == 2003:
+                # 流结束
+                logger.debug("SSE流结束")
+                return
+            for delta in parse_event(event_type, event_data):
+                if delta["type"] == "image":
+                    if delta["url"] in image_urls:
+                        continue
+                    image_urls.add(delta["url"])
+                    # 后台缓存生成的图片，可通过 /api/image/{id} 访问
+                    delta["id"] = image_cache.schedule(delta["url"])
+                yield delta
+    
+    raise UpstreamError(PROTOCOL, "解析SSE失败: 上游连接在流结束前关闭")
+
+
+def parse_event(event_type: int, event_data: dict) -> List[dict]:
+    """将单个SSE事件转换为流式事件"""
+    try:
+        if event_type == 2001:
+            # 流消息                      
+            if not (msg := event_data.get('message')):
+                return []
+            
+            content_type = msg.get('content_type')
+            if content_type in [10000, 2001, 2008]:
+                # 文字消息
+                text = json.loads(msg.get('content', '{}')).get('text', )
+                return [{"type": "text", "text": text}] if text else []
+            elif content_type == 2030:
+                # 新的消息类型（包含图片识别结果）
+                content = json.loads(msg.get('content', '{}'))
+                text = content.get('text', '')
+                return [{"type": "text", "text": text}] if text else []
+            elif content_type == 2074:
+                # 图片消息
+                deltas = []
+                creations = json.loads(msg.get('content', '{}')).get('creations', [])
+                for creation in creations:
+                    image_info = creation.get('image', {})
+                    # 只处理status为2的完成图片
+                    if image_info.get('status') == 2:
+                        url = (image_info.get('image_raw', {}).get('url') or 
+                                image_info.get('image_thumb', {}).get('url') or
+                                image_info.get('image_ori', {}).get('url'))
+                        if url:
+                            deltas.append({"type": "image", "url": url})
+                return deltas
+            else:
+                logger.warning(f"未知的消息类型 {content_type}")
+        elif event_type == 2002:
+            # 流开始
+            conversation_id = event_data.get("conversation_id")
+            message_id = event_data.get("message_id")
+            logger.debug(f"SSE流开始: 会话ID={conversation_id}, 消息ID={message_id}")
+            return [{
+                "type": "meta",
+                "conversation_id": conversation_id,
+                "message_id": message_id,
+                "section_id": event_data.get("section_id")
+            }]
+        elif event_type == 2005:
+            # 错误事件
+            error_code = event_data.get("code")
+            error_message = event_data.get("message", "未知错误")
+            logger.error(f"豆包API返回错误: code={error_code}, message={error_message}")
+            kind = RATE_LIMITED if error_code in RATE_LIMIT_CODES else UPSTREAM
+            raise UpstreamError(kind, f"豆包API错误 [{error_code}]: {error_message}")
+        else:
+            logger.warning(f"未知的流类型 {event_type}")
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise UpstreamError(PROTOCOL, f"解析SSE失败: {str(e)}")
+    return []
 
 
 async def upload_file(file_type: int, file_name: str, file_data: bytes):
+    """上传文件到豆包服务器，返回附件信息"""
+    # 图片先缩放、重新编码，减少上传字节数
+    if file_type == 2:
+        with tracing.span("upload.preprocess_image", **{"upload.size": len(file_data)}):
+            file_name, file_data = await prepare_image(file_name, file_data)
+
+    async def chunks():
+        yield file_data
+
+    def digest():
+        crc32 = format(binascii.crc32(file_data) & 0xFFFFFFFF, '08x')
+        return crc32, hashlib.md5(file_data).hexdigest() if file_type == 1 else None
+
+    # 大文件的校验值计算放到线程中，避免阻塞事件循环
+    crc32, md5 = await asyncio.to_thread(digest) if len(file_data) > DIGEST_THREAD_SIZE else digest()
+    return await upload_stream(file_type, file_name, len(file_data), crc32, md5, chunks)
+
+
+async def upload_stream(
+    file_type: int,
+    file_name: str,
+    file_size: int,
+    crc32: str,
+    md5: Optional[str],
+    chunks: Callable[[], AsyncIterator[bytes]]
+):
     """
-    上传文件到豆包服务器，返回附件信息
+    以流的形式上传文件，大小与校验值需预先计算，chunks 每次调用返回一个新的数据迭代器
     总体流程为：
     1. 通过 prepare-upload 拿到 AWS 凭证
     2. 通过 apply-upload 提交文件元信息
@@ -210,42 +566,19 @@ async def upload_file(file_type: int, file_name: str, file_data: bytes):
     4. 通过 commit-upload 确认上传
     """
     # 生成文件与用户无关，随机挑一个session
-    session = session_pool.get_session()
-    logger.debug(f"开始上传文件: {file_name}, 类型: {file_type}, 大小: {len(file_data)} 字节")
-    # ------ HEADERS -------
-    DEFAULT_HEADERS = {
-        'content-type': 'application/json',
-        'cookie': session.cookie,
-        'origin': "www.doubao.com",
-        'referer': "https://www.doubao.com/chat/",
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36'
-    }
-    # ------ PARAMS -------
-    params = "&".join([
-        "aid=497858",
-        f"device_id={session.device_id}",
-        "device_platform=web",
-        "language=zh",
-        "pc_version=2.20.0",
-        "pkg_type=release_version",
-        "real_aid=497858",
-        "region=CN",
-        "samantha_web=1",
-        "sys_region=CN",
-        f"tea_uuid={session.tea_uuid}",
-        "use-olympus-account=1",
-        "version_code=20800",
-    ])
+    session = await session_pool.get_session()
+    logger.debug(f"开始上传文件: {file_name}, 类型: {file_type}, 大小: {file_size} 字节")
+    builder = get_builder(session)
     # 由于 AWS4Auth 不支持 Aiohttp, 所以采用异步库 HTTPX
     async with httpx.AsyncClient() as client:
         # PREPARE UPLOAD
-        prepare_url = "https://www.doubao.com/alice/resource/prepare_upload?" + params
         prepare_payload = {
             "resource_type": file_type,  # 文档类型 1;图片类型 2; 
             "scene_id": "5",
             "tenant_id": "5"
         }
-        resp = await client.post(url=prepare_url, headers=DEFAULT_HEADERS, json=prepare_payload)
+        with tracing.span("upload.prepare_upload"):
+            resp = await client.post(url=builder.prepare_upload_url, headers=builder.upload_headers, json=prepare_payload)
         prepare_data = resp.json()
         upload_info = prepare_data.get("data", {})
         
@@ -254,7 +587,6 @@ async def upload_file(file_type: int, file_name: str, file_data: bytes):
         session_token = upload_info.get("upload_auth_token", {}).get("session_token")
         access_key = upload_info.get("upload_auth_token", {}).get("access_key")
         secret_key = upload_info.get("upload_auth_token", {}).get("secret_key")
-        file_size = len(file_data)
         if not '.' in file_name:
             raise HTTPException(status_code=500, detail="文件名格式错误，注意附带后缀名")
         file_ext = os.path.splitext(file_name)[1]
@@ -262,17 +594,10 @@ async def upload_file(file_type: int, file_name: str, file_data: bytes):
         
         # 构建 AWS4Auth
         auth = AWS4Auth(access_key, secret_key, 'cn-north-1', "imagex", session_token=session_token)
-        applu_request = client.build_request(
-            method="GET",
-            url=apply_url,
-            headers={
-                "origin": "https://www.doubao.com",
-                "reference": "https://www.doubao.com",
-                "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-                }
-            )
+        applu_request = client.build_request(method="GET", url=apply_url, headers=IMAGEX_HEADERS)
         auth.__call__(applu_request) 
-        resp = await client.send(applu_request)
+        with tracing.span("upload.apply_image_upload"):
+            resp = await client.send(applu_request)
         data = resp.json()
         upload_address = data.get("Result", {}).get("UploadAddress", {})
         if not (infos := upload_address.get("StoreInfos", [])):
@@ -284,17 +609,14 @@ async def upload_file(file_type: int, file_name: str, file_data: bytes):
         
         # UPLOAD
         upload_url = f"https://tos-d-x-hl.snssdk.com/upload/v1/{store_url}"
-        crc32 = format(binascii.crc32(file_data) & 0xFFFFFFFF, '08x')
         upload_headers = {
+            **TOS_HEADERS,
             "authorization": store_auth,
-            "origin": "https://www.doubao.com",
-            "reference": "https://www.doubao.com",
-            "host": "tos-d-x-hl.snssdk.com",
-            "content-type": "application/octet-stream",
-            "content-disposition": 'attachment; filename="undefined"',
-            "content-crc32": crc32
+            "content-crc32": crc32,
+            "content-length": str(file_size)
         }
-        resp = await client.post(upload_url, content=file_data, headers=upload_headers)
+        with tracing.span("upload.tos_upload", **{"upload.size": file_size}):
+            resp = await client.post(upload_url, content=chunks(), headers=upload_headers)
         data = resp.json()
         if not (msg := data.get("message")) == "Success":
             raise HTTPException(status_code=500, detail=f"上传消息失败 {msg}")
@@ -302,21 +624,17 @@ async def upload_file(file_type: int, file_name: str, file_data: bytes):
         # COMMIT UPLOAD
         commit_url = f"https://imagex.bytedanceapi.com/?Action=CommitImageUpload&Version=2018-08-01&ServiceId={service_id}"
         commit_payload = {"SessionKey": session_key}
-        commit_headers = {
-            "origin": "https://www.doubao.com",
-            "referer": "https://www.doubao.com/",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-        }
         
         # AWS4AUTH
         commit_request = client.build_request(
             method="POST",
             url=commit_url,
-            headers=commit_headers,
+            headers=IMAGEX_HEADERS,
             json=commit_payload
         )
         auth.__call__(commit_request)
-        resp = await client.send(commit_request)
+        with tracing.span("upload.commit_image_upload"):
+            resp = await client.send(commit_request)
         data = resp.json()
         if not (results := data.get("Result", {}).get("PluginResult", [])):
             raise HTTPException(status_code=500, detail="Commit Upload 返回 PluginResult 为空")
@@ -328,7 +646,7 @@ async def upload_file(file_type: int, file_name: str, file_data: bytes):
             return FileResponse(
                 key=result.get("ImageUri"),
                 name=file_name,
-                md5=result.get("ImageMd5") or hashlib.md5(file_data).hexdigest(),
+                md5=result.get("ImageMd5") or md5,
                 size=result.get("ImageSize")
             )
         elif file_type == 2:
@@ -342,47 +660,22 @@ async def upload_file(file_type: int, file_name: str, file_data: bytes):
             )
 
 
-async def delete_conversation(conversation_id: str) -> tuple[bool, str]:
+async def delete_conversation(conversation_id: str, session: Optional[DoubaoSession] = None) -> tuple[bool, str]:
+    """删除对话，成功后解除对话与会话的关联；session 为空时按 conversation_id 查找"""
     # 获取会话配置
-    session = session_pool.get_session(conversation_id)
+    session = session or await session_pool.get_session(conversation_id)
     if not session:
         raise HTTPException(status_code=404, detail=f"会话配置不存在:, 会话ID: {conversation_id}")
     
-    # ------ URL -------
-    params = "&".join([
-        "aid=497858",
-        f"device_id={session.device_id}",
-        "device_platform=web",
-        "language=zh",
-        "pc_version=2.20.0",
-        "pkg_type=release_version",
-        "real_aid=497858",
-        "region=CN",
-        "samantha_web=1",
-        "sys_region=CN",
-        f"tea_uuid={session.tea_uuid}",
-        "use-olympus-account=1",
-        "version_code=20800",
-        f"web_id={session.web_id}",
-    ])
-    url = "https://www.doubao.com/samantha/thread/delete?" + params
-    
-    # ------ BODY -------
-    body = {"conversation_id": conversation_id}
-    
-    # ------ HEADERS -------
-    headers = {
-        "cookie": session.cookie,
-        "origin": "https://www.doubao.com",
-        "referer": "https://www.doubao.com/chat/" + conversation_id,
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0"
-    }
+    builder = get_builder(session)
+    headers, body = builder.delete_request(conversation_id)
     
     try:
         async with aiohttp.ClientSession() as aio_session:
-            async with aio_session.post(url, headers=headers, json=body) as response:
+            async with aio_session.post(builder.delete_url, headers=headers, data=body) as response:
                 if response.status != 200:
                     return False, f"请求状态错误: {response.status}"
+        await session_pool.del_conversation(conversation_id)
         return True, ""
     except Exception as e:
         return False, f"请求失败: {str(e)}"
@@ -394,6 +687,8 @@ class LimitedException(Exception):
 
 __all__ = [
     "chat_completion",
+    "chat_completion_stream",
     "upload_file",
+    "upload_stream",
     "delete_conversation"
 ] 
\ No newline at end of file
@@ -0,0 +1,41 @@
+from typing import Optional
+
+# 上游失败分类
+CONNECT = "connect"                          # 建立连接失败或连接被重置
+TIMEOUT_FIRST_EVENT = "timeout_first_event"  # 超时未收到流开始事件(2002)
+TIMEOUT_IDLE = "timeout_idle"                # 流开始后事件间隔超时
+TIMEOUT_TOTAL = "timeout_total"              # 超过请求总时长
+HTTP_STATUS = "http_status"                  # 上游返回非 200 状态码
+GATEWAY = "gateway"                          # 上游返回 gateway-error
+RATE_LIMITED = "rate_limited"                # 上游限流
+UPSTREAM = "upstream"                        # 上游返回的其他错误事件(2005)
+LIMITED = "limited"                          # 游客会话次数用完
+PROTOCOL = "protocol"                        # SSE 无法解析或提前结束
+
+# 上游限流的错误码
+RATE_LIMIT_CODES = {710022004}
+
+
+class UpstreamError(Exception):
+    """豆包上游请求失败，kind 为失败分类，供会话健康检查与重试逻辑使用"""
+
+    def __init__(self, kind: str, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+
+
+__all__ = [
+    "UpstreamError",
+    "CONNECT",
+    "TIMEOUT_FIRST_EVENT",
+    "TIMEOUT_IDLE",
+    "TIMEOUT_TOTAL",
+    "HTTP_STATUS",
+    "GATEWAY",
+    "RATE_LIMITED",
+    "UPSTREAM",
+    "LIMITED",
+    "PROTOCOL",
+    "RATE_LIMIT_CODES"
+]
@@ -0,0 +1,193 @@
+import os
+import glob
+import time
+import uuid
+import asyncio
+import hashlib
+import mimetypes
+from collections import OrderedDict
+from typing import Optional, Dict, List
+from urllib.parse import urlparse
+import aiohttp
+from loguru import logger
+from src.config import settings
+from src.metrics import metrics
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageCache:
+    """
+    生成图片的磁盘缓存
+    1. 收到完成的图片事件后立即在后台下载，签名 URL 过期后仍可通过图片 ID 访问
+    2. 图片 ID 由 URL 路径计算，与签名参数无关，同一张图片只下载一次
+    3. 按最近访问顺序淘汰，总大小不超过 image_cache_max_bytes
+    4. 单张图片不超过 upload_max_size，边下载边写入磁盘
+    5. 磁盘读写、扫描与删除都在线程中执行；多 worker 部署时各进程的索引只记录自己见过的图片，未命中时再到目录中查找
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # image_id -> (文件路径, 大小)，按最近访问排序
+        self.entries: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self.total_bytes = 0
+        # image_id -> 原始 URL，用于缓存被淘汰或下载失败后重新下载
+        self.urls: Dict[str, str] = {}
+        self.fetching: Dict[str, asyncio.Task] = {}
+        self.loaded = False
+        self.loading = asyncio.Lock()
+
+    @staticmethod
+    def id_of(url: str) -> str:
+        parsed = urlparse(url)
+        return hashlib.sha1(f"{parsed.netloc}{parsed.path}".encode('utf-8')).hexdigest()[:24]
+
+    async def ensure_loaded(self):
+        """首次使用时扫描缓存目录，每个 worker 进程各自建立索引"""
+        async with self.loading:
+            if self.loaded:
+                return
+            for _, image_id, path, size in sorted(await asyncio.to_thread(self.scan)):
+                await self.add(image_id, path, size)
+            self.loaded = True
+
+    def scan(self) -> List[tuple[float, str, str, int]]:
+        """列出缓存文件 (修改时间, 图片 ID, 路径, 大小)，清理残留的临时文件"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.endswith(".part"):
+                # 其他 worker 可能正在下载，只清理超过下载超时仍未完成的临时文件
+                if now - stat.st_mtime > settings.upload_url_timeout:
+                    self.remove_files([entry.path])
+                continue
+            files.append((stat.st_mtime, os.path.splitext(entry.name)[0], entry.path, stat.st_size))
+        return files
+
+    def find_file(self, image_id: str) -> Optional[tuple[str, int]]:
+        """在缓存目录中查找图片文件 (路径, 大小)，用于发现其他 worker 下载的图片"""
+        for path in glob.glob(os.path.join(glob.escape(self.directory), glob.escape(image_id) + ".*")):
+            if not path.endswith(".part") and os.path.isfile(path):
+                return path, os.path.getsize(path)
+        return None
+
+    @staticmethod
+    def remove_files(paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def add(self, image_id: str, path: str, size: int):
+        if old := self.entries.pop(image_id, None):
+            self.total_bytes -= old[1]
+        self.entries[image_id] = (path, size)
+        self.total_bytes += size
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (evicted_path, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            evicted.append(evicted_path)
+            metrics.inc("image_cache_evicted_total")
+        metrics.set("image_cache_bytes", self.total_bytes)
+        if evicted:
+            await asyncio.to_thread(self.remove_files, evicted)
+
+    def schedule(self, url: str) -> str:
+        """记录图片并在后台下载，返回图片 ID"""
+        image_id = self.id_of(url)
+        if not settings.image_cache_enabled:
+            return image_id
+        self.urls[image_id] = url
+        if len(self.urls) > settings.image_cache_max_urls:
+            self.urls.pop(next(iter(self.urls)))
+        if image_id not in self.entries and image_id not in self.fetching:
+            task = asyncio.create_task(self.fetch(image_id, url))
+            self.fetching[image_id] = task
+            task.add_done_callback(lambda _: self.fetching.pop(image_id, None))
+        return image_id
+
+    async def fetch(self, image_id: str, url: str) -> Optional[str]:
+        await self.ensure_loaded()
+        if entry := self.entries.get(image_id):
+            return entry[0]
+        part = os.path.join(self.directory, f"{image_id}.{uuid.uuid4().hex[:8]}.part")
+        try:
+            timeout = aiohttp.ClientTimeout(total=settings.upload_url_timeout)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(url) as response:
+                    if response.status != 200:
+                        raise Exception(f"状态码 {response.status}")
+                    if (response.content_length or 0) > settings.upload_max_size:
+                        raise Exception(f"图片超过大小限制 {settings.upload_max_size} 字节")
+                    content_type = response.headers.get("content-type", "").split(";")[0]
+                    ext = mimetypes.guess_extension(content_type) or ".img"
+                    # 边下载边在线程中写入临时文件，累计大小超过 upload_max_size 时中止
+                    size = 0
+                    file = await asyncio.to_thread(open, part, 'wb')
+                    try:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            size += len(chunk)
+                            if size > settings.upload_max_size:
+                                raise Exception(f"图片超过大小限制 {settings.upload_max_size} 字节")
+                            await asyncio.to_thread(file.write, chunk)
+                    finally:
+                        await asyncio.to_thread(file.close)
+            path = os.path.join(self.directory, image_id + ext)
+            await asyncio.to_thread(os.replace, part, path)
+            await self.add(image_id, path, size)
+            metrics.inc("image_cache_fetch_total", result="ok")
+            return path
+        except Exception as e:
+            logger.warning(f"缓存图片失败 {image_id}: {e}")
+            metrics.inc("image_cache_fetch_total", result="failed")
+            await asyncio.to_thread(self.remove_files, [part])
+            return None
+
+    async def flush(self, timeout: float = 0):
+        """等待后台下载完成，超时未完成的下载被取消，残留的临时文件在之后扫描目录时清理"""
+        if tasks := list(self.fetching.values()):
+            pending = tasks
+            if timeout > 0:
+                _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def get(self, image_id: str) -> Optional[str]:
+        """
+        获取缓存的图片路径
+        1. 索引中没有时到缓存目录查找，多 worker 部署时图片可能由其他 worker 下载
+        2. 正在下载时等待完成，已淘汰但 URL 已知时重新下载
+        """
+        await self.ensure_loaded()
+        if entry := self.entries.get(image_id):
+            if await asyncio.to_thread(os.path.exists, entry[0]):
+                self.entries.move_to_end(image_id)
+                metrics.inc("image_cache_requests_total", result="hit")
+                return entry[0]
+            self.total_bytes -= self.entries.pop(image_id)[1]
+        if image_id not in self.fetching and (found := await asyncio.to_thread(self.find_file, image_id)):
+            await self.add(image_id, *found)
+            metrics.inc("image_cache_requests_total", result="hit")
+            return found[0]
+        metrics.inc("image_cache_requests_total", result="miss")
+        if image_id not in self.fetching and (url := self.urls.get(image_id)):
+            self.schedule(url)
+        if task := self.fetching.get(image_id):
+            return await asyncio.shield(task)
+        return None
+
+
+image_cache = ImageCache(settings.image_cache_dir, settings.image_cache_max_bytes)
+
+__all__ = [
+    "ImageCache",
+    "image_cache"
+]
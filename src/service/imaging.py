@@ -0,0 +1,81 @@
+import io
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from loguru import logger
+from src.config import settings
+from src.metrics import metrics
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# 图片编码在线程池中执行，Pillow 编解码时会释放 GIL
+executor: Optional[ThreadPoolExecutor] = None
+
+FORMAT_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp"}
+
+
+def has_alpha(image) -> bool:
+    """图片是否带透明通道(包括调色板图片的透明色)"""
+    return "A" in image.getbands() or (image.mode == "P" and "transparency" in image.info)
+
+
+def preprocess_image(file_name: str, data: bytes) -> tuple[str, bytes]:
+    """
+    上传前压缩图片
+    1. 按 EXIF 方向旋转后缩放到最长边不超过 image_max_dimension
+    2. 以 image_format / image_quality 重新编码，不保留 EXIF 等元数据，编码为 JPEG 时透明区域填充白色
+    3. 结果没有变小时返回原图(如色块简单、PNG 已经压缩得很好的截图)
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        resized = max(image.size) > settings.image_max_dimension
+        if resized:
+            image.thumbnail((settings.image_max_dimension, settings.image_max_dimension), Image.LANCZOS)
+        fmt = settings.image_format.lower()
+        if fmt == "jpeg" and has_alpha(image):
+            # JPEG 不支持透明，直接转换会使透明区域变黑，先合成到白色背景上
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif fmt == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif fmt == "webp" and image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt.upper(), quality=settings.image_quality, optimize=fmt == "jpeg")
+    output = buffer.getvalue()
+    if len(output) >= len(data):
+        return file_name, data
+    return os.path.splitext(file_name)[0] + FORMAT_EXTENSIONS[fmt], output
+
+
+async def prepare_image(file_name: str, data: bytes) -> tuple[str, bytes]:
+    """未启用或未安装 Pillow 时原样返回，处理失败时记录日志并上传原图"""
+    global executor
+    if not settings.image_preprocess or Image is None:
+        return file_name, data
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=settings.image_workers, thread_name_prefix="imaging")
+    started = time.perf_counter()
+    try:
+        new_name, output = await asyncio.get_running_loop().run_in_executor(executor, preprocess_image, file_name, data)
+    except Exception as e:
+        logger.warning(f"图片预处理失败，上传原图: {file_name}, {e}")
+        return file_name, data
+    metrics.observe("image_preprocess_seconds", time.perf_counter() - started)
+    metrics.inc("image_bytes_total", len(data), stage="before")
+    metrics.inc("image_bytes_total", len(output), stage="after")
+    logger.debug(f"图片预处理: {file_name} {len(data)} -> {len(output)} 字节")
+    return new_name, output
+
+
+__all__ = [
+    "preprocess_image",
+    "prepare_image"
+]
@@ -0,0 +1,174 @@
+import time
+import uuid
+import asyncio
+from typing import Optional, Dict, List
+from fastapi import HTTPException
+from loguru import logger
+from src.config import settings
+from src.pool.session_pool import session_pool
+from src.pool.store import SessionStore
+from src.model.request import CompletionRequest
+from src.model.response import CompletionResponse, JobResponse
+from .completion import complete
+
+FINISHED_STATUS = ("succeeded", "failed", "cancelled")
+
+
+class JobManager:
+    """
+    后台补全任务
+    1. 提交后立即返回 job_id，由固定数量的 worker 协程执行，避免长时间的深度思考占用客户端连接
+    2. 任务状态与结果保存在会话存储中，多 worker 部署时任意进程都能查询；排队与执行中的任务不过期，结束后保留 job_result_ttl 秒
+    3. 取消任务会中断正在读取的上游流，并释放会话槽位
+    """
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        # 本进程正在执行的任务 job_id -> Task
+        self.running: Dict[str, asyncio.Task] = {}
+        # 本进程提交的任务状态变化通知
+        self.events: Dict[str, asyncio.Event] = {}
+
+    def start(self):
+        """启动 worker 协程"""
+        if self.workers:
+            return
+        self.queue = asyncio.Queue(maxsize=settings.job_queue_size)
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(settings.job_workers)]
+        self.workers.append(asyncio.create_task(self.watch_cancel()))
+
+    async def stop(self, timeout: float = 0):
+        """
+        停止 worker
+        1. 排队中的任务标记为失败，由客户端重新提交
+        2. 执行中的任务最多再等待 timeout 秒，超时后中断并标记为取消
+        """
+        while self.queue and not self.queue.empty():
+            job_id, _ = self.queue.get_nowait()
+            self.queue.task_done()
+            if (job := await self.get(job_id)) and job.status == "queued":
+                await self.finish(job, status="failed", error="服务重启，任务未执行")
+        if self.running and timeout > 0:
+            await asyncio.wait(list(self.running.values()), timeout=timeout)
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def save(self, job: JobResponse):
+        # 深度思考可能比结果保留时间更长，只有结束的任务才开始计算过期时间
+        ttl = settings.job_result_ttl if job.status in FINISHED_STATUS else None
+        await self.store.put_value(f"job:{job.job_id}", job.model_dump_json(), ttl)
+        if event := self.events.pop(job.job_id, None):
+            event.set()
+            if job.status not in FINISHED_STATUS:
+                self.events[job.job_id] = asyncio.Event()
+
+    async def get(self, job_id: str) -> Optional[JobResponse]:
+        if value := await self.store.get_value(f"job:{job_id}"):
+            return JobResponse.model_validate_json(value)
+        return None
+
+    async def submit(self, completion: CompletionRequest) -> JobResponse:
+        """提交任务，队列已满时抛出 429"""
+        self.start()
+        job = JobResponse(job_id=uuid.uuid4().hex, status="queued", created_at=time.time())
+        try:
+            self.queue.put_nowait((job.job_id, completion))
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=429, detail="任务队列已满，请稍后重试")
+        await self.save(job)
+        self.events[job.job_id] = asyncio.Event()
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[JobResponse]:
+        """取消任务，排队中的任务直接标记取消，执行中的任务中断上游请求"""
+        if not (job := await self.get(job_id)):
+            return None
+        if job.status in FINISHED_STATUS:
+            return job
+        if task := self.running.get(job_id):
+            task.cancel()
+        elif job.status == "queued":
+            await self.finish(job, status="cancelled")
+        else:
+            # 任务在其他 worker 进程中执行，由其 watch_cancel 负责中断
+            await self.store.put_value(f"job:{job_id}:cancel", "1", settings.job_result_ttl)
+        return await self.get(job_id)
+
+    async def finish(self, job: JobResponse, status: str, result: Optional[CompletionResponse] = None, error: Optional[str] = None):
+        job = job.model_copy(update={"status": status, "result": result, "error": error, "finished_at": time.time()})
+        await self.save(job)
+
+    async def wait(self, job_id: str, timeout: float, until_finished: bool = True) -> Optional[JobResponse]:
+        """等待任务结束(until_finished=False 时为状态变化)或超时，返回最新状态"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        status = None
+        while (job := await self.get(job_id)) and job.status not in FINISHED_STATUS:
+            if not until_finished and status not in (None, job.status):
+                break
+            status = job.status
+            if (remaining := deadline - loop.time()) <= 0:
+                break
+            if event := self.events.get(job_id):
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(remaining, 0.5))
+        return job
+
+    async def run(self, job_id: str, completion: CompletionRequest):
+        if not (job := await self.get(job_id)) or job.status != "queued":
+            return
+        job = job.model_copy(update={"status": "running"})
+        await self.save(job)
+        task = asyncio.create_task(complete(completion))
+        self.running[job_id] = task
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            # worker 自身被取消(服务关闭)时一并中断任务，等待其释放会话槽位后标记为取消
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await self.finish(job, status="cancelled", error="服务关闭，任务被中断")
+            raise
+        finally:
+            self.running.pop(job_id, None)
+        if task.cancelled():
+            await self.finish(job, status="cancelled")
+        elif (e := task.exception()) is not None:
+            await self.finish(job, status="failed", error=e.detail if isinstance(e, HTTPException) else str(e))
+        else:
+            await self.finish(job, status="succeeded", result=task.result())
+
+    async def worker(self):
+        while True:
+            job_id, completion = await self.queue.get()
+            try:
+                await self.run(job_id, completion)
+            except Exception as e:
+                logger.error(f"后台任务 {job_id} 执行失败: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def watch_cancel(self):
+        """检查其他进程提交的取消请求"""
+        while True:
+            await asyncio.sleep(1)
+            for job_id, task in list(self.running.items()):
+                if await self.store.get_value(f"job:{job_id}:cancel"):
+                    task.cancel()
+
+
+job_manager = JobManager(session_pool.store)
+
+__all__ = [
+    "JobManager",
+    "FINISHED_STATUS",
+    "job_manager"
+]
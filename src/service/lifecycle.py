@@ -0,0 +1,80 @@
+import time
+import signal
+import asyncio
+import threading
+from typing import Optional, Callable
+from loguru import logger
+from src.config import settings
+from src.metrics import metrics
+
+
+class Lifecycle:
+    """
+    服务就绪状态与优雅退出
+    1. 启动完成后 ready 为真；收到 SIGTERM 后进入排空状态，ready 变为假，新的请求直接返回 503，进行中的请求继续
+    2. 排空状态保持 drain_delay 秒(供负载均衡发现未就绪)后交给 uvicorn 停止监听，
+       已开始的响应(包括 SSE 流)最多再执行 drain_timeout 秒，之后各组件在剩余时间内完成后台任务并写入待保存的数据
+    3. 排空期间再次收到 SIGTERM 时跳过 drain_delay 立即停止监听；SIGINT(Ctrl+C) 仍由 uvicorn 处理
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        # 排空截止时间(time.monotonic)
+        self.deadline = 0.0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # uvicorn 的信号处理函数，调用后开始关闭服务
+        self.server_exit: Optional[Callable] = None
+        self.exit_timer: Optional[asyncio.TimerHandle] = None
+
+    def install(self):
+        """接管 SIGTERM，需在 uvicorn 安装信号处理之后(应用启动事件中)调用"""
+        # 只有主线程可以设置信号处理(测试客户端等在其他线程中运行应用)
+        if threading.current_thread() is not threading.main_thread():
+            return
+        handler = signal.getsignal(signal.SIGTERM)
+        if not callable(handler):
+            return
+        self.server_exit = handler
+        self.loop = asyncio.get_running_loop()
+        signal.signal(signal.SIGTERM, self.handle_term)
+
+    def handle_term(self, sig: int, frame):
+        if self.draining:
+            self.loop.call_soon_threadsafe(self.exit, sig)
+        else:
+            self.loop.call_soon_threadsafe(self.drain, sig)
+
+    def drain(self, sig: int = signal.SIGTERM):
+        """进入排空状态，drain_delay 秒后停止监听"""
+        if self.draining:
+            return
+        self.ready = False
+        self.draining = True
+        self.deadline = time.monotonic() + settings.drain_delay + settings.drain_timeout
+        metrics.set("server_draining", 1)
+        logger.info(f"收到退出信号，停止接收新请求，{settings.drain_delay}s 后停止监听，进行中的请求最多等待 {settings.drain_timeout}s")
+        if self.server_exit:
+            self.exit_timer = self.loop.call_later(settings.drain_delay, self.exit, sig)
+
+    def exit(self, sig: int):
+        if self.exit_timer:
+            self.exit_timer.cancel()
+            self.exit_timer = None
+        if self.server_exit:
+            server_exit, self.server_exit = self.server_exit, None
+            server_exit(sig, None)
+
+    def remaining(self) -> float:
+        """距排空截止时间的剩余秒数，未经过排空直接关闭(如 Ctrl+C)时为 0"""
+        if not self.draining:
+            return 0.0
+        return max(0.0, self.deadline - time.monotonic())
+
+
+lifecycle = Lifecycle()
+
+__all__ = [
+    "Lifecycle",
+    "lifecycle"
+]
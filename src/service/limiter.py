@@ -0,0 +1,135 @@
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+from loguru import logger
+from src.config import settings
+from src.metrics import metrics
+from .errors import RATE_LIMITED, TIMEOUT_FIRST_EVENT, HTTP_STATUS
+
+
+class LimiterRejected(Exception):
+    """全局并发已满且排队超时"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"上游并发已满，请 {retry_after}s 后重试")
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """
+    上游全局并发的自适应限制(AIMD)
+    1. 请求成功且首个事件耗时没有明显超过长期均值时，限制缓慢加性增长(每轮约 +1)
+    2. 上游限流、首个事件超时或首个事件耗时超过长期均值的 limiter_latency_tolerance 倍时，限制乘性减小
+    3. 超出限制的请求短暂排队，排队已满或超时抛出 LimiterRejected
+    """
+
+    def __init__(self):
+        self.limit = float(settings.limiter_initial)
+        self.inflight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        # 首个事件耗时的长期均值(EWMA)
+        self.ttfb_ewma: Optional[float] = None
+        self.last_decrease = 0.0
+        self.update_metrics()
+
+    @property
+    def current(self) -> int:
+        return max(1, int(self.limit))
+
+    @asynccontextmanager
+    async def acquire(self):
+        """占用一个全局并发槽位"""
+        if not settings.limiter_enabled:
+            yield
+            return
+        await self.wait_slot()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self.wake()
+            self.update_metrics()
+
+    async def wait_slot(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.limiter_queue_timeout
+        if self.inflight >= self.current and len(self.waiters) >= settings.limiter_queue_size:
+            raise self.reject()
+        while self.inflight >= self.current:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise self.reject()
+            future = loop.create_future()
+            self.waiters.append(future)
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                raise self.reject()
+            except BaseException:
+                # 已被唤醒但没有占用槽位，转交给下一个等待者
+                if future.done() and not future.cancelled():
+                    self.wake()
+                raise
+            finally:
+                if future in self.waiters:
+                    self.waiters.remove(future)
+        self.inflight += 1
+        self.update_metrics()
+
+    def wake(self):
+        """唤醒一个等待者重新检查槽位"""
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+
+    def reject(self) -> LimiterRejected:
+        metrics.inc("limiter_rejected_total")
+        return LimiterRejected(max(1, math.ceil(self.ttfb_ewma or 1)))
+
+    def on_success(self, ttfb: Optional[float] = None):
+        """请求成功开始返回，ttfb 为首个事件耗时，为 None 时不参与延迟判断(如深度思考)"""
+        if ttfb is not None:
+            baseline = ttfb if self.ttfb_ewma is None else self.ttfb_ewma
+            # 慢样本同样计入均值，延迟持续升高后均值随之跟上，不会一直判定为过载
+            self.ttfb_ewma = baseline * 0.95 + ttfb * 0.05
+            if ttfb > baseline * settings.limiter_latency_tolerance:
+                self.decrease("latency")
+                return
+        self.limit = min(settings.limiter_max, self.limit + 1 / self.limit)
+        self.wake()
+        self.update_metrics()
+
+    def on_failure(self, kind: str, status: Optional[int] = None):
+        """上游请求失败，限流与首个事件超时视为过载信号"""
+        if kind in (RATE_LIMITED, TIMEOUT_FIRST_EVENT) or (kind == HTTP_STATUS and status == 429):
+            self.decrease(kind)
+
+    def decrease(self, reason: str):
+        now = time.monotonic()
+        # 同一批并发请求集中失败时只减小一次
+        if now - self.last_decrease < settings.limiter_decrease_interval:
+            return
+        self.last_decrease = now
+        self.limit = max(settings.limiter_min, self.limit * settings.limiter_backoff)
+        metrics.inc("limiter_decrease_total", reason=reason)
+        logger.warning(f"上游过载({reason})，全局并发限制降为 {self.current}")
+        self.update_metrics()
+
+    def update_metrics(self):
+        metrics.set("limiter_limit", self.current)
+        metrics.set("limiter_inflight", self.inflight)
+        metrics.set("limiter_waiting", len(self.waiters))
+
+
+adaptive_limiter = AdaptiveLimiter()
+
+__all__ = [
+    "AdaptiveLimiter",
+    "LimiterRejected",
+    "adaptive_limiter"
+]
@@ -0,0 +1,98 @@
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from typing import Optional
+from loguru import logger
+from src.config import settings
+from src.metrics import metrics
+
+# 事件循环延迟直方图的分桶(秒)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class LoopMonitor:
+    """
+    事件循环延迟监控
+    1. 循环内的采样任务每 loop_monitor_interval 秒醒来一次，实际醒来时间与预期的差值即为循环延迟
+    2. 后台线程发现采样任务超过 loop_slow_callback 秒没有醒来时，记录此刻事件循环线程的堆栈，即阻塞循环的代码
+    3. 延迟的滑动均值超过 loop_shed_lag 时 overloaded 为真，由中间件对新请求返回 503
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        self.loop_thread_id: Optional[int] = None
+        # 最近一次采样任务醒来的时间(time.monotonic)
+        self.last_tick = 0.0
+        self.lag = 0.0
+        self.lag_ewma = 0.0
+
+    @property
+    def stalled(self) -> float:
+        """采样任务已经晚醒的时长(秒)，循环正常时为 0"""
+        if not self.last_tick:
+            return 0.0
+        return max(0.0, time.monotonic() - self.last_tick - settings.loop_monitor_interval)
+
+    @property
+    def overloaded(self) -> bool:
+        return settings.loop_shed_lag > 0 and max(self.lag_ewma, self.stalled) > settings.loop_shed_lag
+
+    def start(self):
+        if self.task is None:
+            self.loop_thread_id = threading.get_ident()
+            self.last_tick = time.monotonic()
+            self.stopped.clear()
+            self.task = asyncio.create_task(self.sample())
+            self.watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+            self.watchdog.start()
+
+    async def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.watchdog = None
+
+    async def sample(self):
+        interval = settings.loop_monitor_interval
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            self.last_tick = time.monotonic()
+            self.lag = max(0.0, self.last_tick - expected)
+            self.lag_ewma = 0.8 * self.lag_ewma + 0.2 * self.lag
+            metrics.observe("event_loop_lag_seconds", self.lag, buckets=LAG_BUCKETS)
+            metrics.set("event_loop_lag_ewma_seconds", self.lag_ewma)
+
+    def watch(self):
+        """在独立线程中运行，循环被阻塞时也能执行"""
+        threshold = settings.loop_slow_callback
+        reported_tick = 0.0
+        while not self.stopped.wait(threshold / 2):
+            stalled = self.stalled
+            tick = self.last_tick
+            if stalled < threshold:
+                if reported_tick and tick != reported_tick:
+                    reported_tick = 0.0
+                continue
+            if reported_tick == tick:
+                # 同一次阻塞只记录一次
+                continue
+            reported_tick = tick
+            metrics.inc("event_loop_stalls_total")
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(无法获取堆栈)"
+            logger.warning(f"事件循环已阻塞超过 {stalled:.3f}s，当前执行的代码:\n{stack}")
+
+
+loop_monitor = LoopMonitor()
+
+__all__ = [
+    "LoopMonitor",
+    "loop_monitor"
+]
@@ -0,0 +1,169 @@
+import json
+import time
+import uuid
+import hashlib
+from typing import List, Optional, AsyncIterator
+from fastapi import HTTPException
+from src.config import settings
+from src.pool.session_pool import session_pool
+from src.model.request import CompletionRequest, OpenAIChatRequest, OpenAIMessage
+from src.model.response import CompletionResponse
+from .completion import complete, stream_complete
+
+# 模型名 -> 补全选项
+MODELS = {
+    "doubao": {},
+    "doubao-thinking": {"use_deep_think": True},
+    "doubao-auto": {"use_auto_cot": True},
+}
+
+
+def message_text(message: OpenAIMessage) -> str:
+    """提取消息文本，目前仅支持文本内容"""
+    if message.content is None:
+        return ""
+    if isinstance(message.content, str):
+        return message.content
+    texts = []
+    for part in message.content:
+        if part.get("type") != "text":
+            raise HTTPException(status_code=400, detail=f"不支持的消息内容类型: {part.get('type')}")
+        texts.append(part.get("text", ""))
+    return "".join(texts)
+
+
+def history_key(history: List[tuple[str, str]]) -> str:
+    """对话历史的摘要，用于把无状态的 OpenAI 请求映射回豆包对话"""
+    raw = json.dumps(history, ensure_ascii=False)
+    return "openai:" + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def openai_route_key(request: OpenAIChatRequest) -> Optional[str]:
+    """
+    多节点部署时决定由哪个节点处理请求
+    1. 显式传入 conversation_id 时按其节点标识转发到创建对话的节点
+    2. 否则按首条消息的摘要在一致性哈希环上选择节点，同一段对话的每一轮都落到同一节点，
+       历史与对话的映射只保存在该节点上也能找到
+    """
+    if request.conversation_id or not request.messages:
+        return request.conversation_id
+    first = request.messages[0]
+    raw = json.dumps([first.role, message_text(first)], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+async def to_completion(request: OpenAIChatRequest) -> tuple[CompletionRequest, List[tuple[str, str]]]:
+    """
+    将 OpenAI 请求转换为补全请求，同时返回对话历史
+    1. 显式传入 conversation_id 时沿用该对话，只发送最后一条消息
+    2. 历史消息与之前某次请求及其回复完全一致时，沿用那次请求创建的对话
+    3. 否则把全部消息拼接为一条提示词，创建新对话
+    """
+    if (options := MODELS.get(request.model)) is None:
+        raise HTTPException(status_code=404, detail=f"模型不存在: {request.model}")
+    if not request.messages or request.messages[-1].role != "user":
+        raise HTTPException(status_code=400, detail="最后一条消息必须是 user 消息")
+    history = [(m.role, message_text(m)) for m in request.messages]
+    conversation_id, section_id = request.conversation_id, request.section_id
+    if conversation_id is None and len(history) > 1:
+        if value := await session_pool.store.get_value(history_key(history[:-1])):
+            conversation_id, section_id = json.loads(value)
+    if conversation_id is not None or len(history) == 1:
+        prompt = history[-1][1]
+    else:
+        prompt = "\n\n".join(f"{role}: {text}" for role, text in history)
+    completion = CompletionRequest(
+        prompt=prompt,
+        guest=False,
+        conversation_id=conversation_id,
+        section_id=section_id,
+        **options
+    )
+    return completion, history
+
+
+async def remember(history: List[tuple[str, str]], reply: str, conversation_id: str, section_id: str):
+    """记录 历史 + 本次回复 对应的豆包对话，客户端带着完整历史继续提问时沿用"""
+    if conversation_id:
+        await session_pool.store.put_value(
+            history_key(history + [("assistant", reply)]),
+            json.dumps([conversation_id, section_id]),
+            settings.openai_conversation_ttl
+        )
+
+
+def reply_content(text: str, img_urls: List[str]) -> str:
+    """生成的图片以 Markdown 图片附在文本之后"""
+    return "".join([text] + [f"\n\n![image]({url})" for url in img_urls])
+
+
+async def openai_completion(request: OpenAIChatRequest) -> dict:
+    """非流式 OpenAI 补全"""
+    completion, history = await to_completion(request)
+    response: CompletionResponse = await complete(completion)
+    content = reply_content(response.text, response.img_urls)
+    await remember(history, content, response.conversation_id, response.section_id)
+    return {
+        "id": f"chatcmpl-{response.messageg_id or uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        "conversation_id": response.conversation_id,
+        "section_id": response.section_id
+    }
+
+
+async def openai_completion_stream(request: OpenAIChatRequest) -> AsyncIterator[str]:
+    """流式 OpenAI 补全，返回 SSE 文本"""
+    completion, history = await to_completion(request)
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def chunk(delta: dict, finish_reason: str = None, **extra) -> str:
+        data = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": request.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            **extra
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    started = False
+    # 已发送的回复内容，客户端下次提问时历史中的回复与之完全一致
+    emitted = []
+    try:
+        async for delta in stream_complete(completion):
+            if delta["type"] == "text":
+                # 与非流式一致，去掉回复开头的换行
+                text = delta["text"] if started else delta["text"].lstrip("\n")
+                if text:
+                    started = True
+                    emitted.append(text)
+                    yield chunk({"content": text})
+            elif delta["type"] == "image":
+                emitted.append(f"\n\n![image]({delta['url']})")
+                yield chunk({"content": emitted[-1]})
+            elif delta["type"] == "end":
+                await remember(history, "".join(emitted), delta["conversation_id"], delta["section_id"])
+                yield chunk({}, "stop", conversation_id=delta["conversation_id"], section_id=delta["section_id"])
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        yield f"data: {json.dumps({'error': {'message': detail, 'type': 'server_error'}}, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+__all__ = [
+    "MODELS",
+    "openai_completion",
+    "openai_completion_stream",
+    "openai_route_key"
+]
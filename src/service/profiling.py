@@ -0,0 +1,167 @@
+import sys
+import time
+import html
+import zlib
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from src.config import settings
+from src.model.response import MemoryStat, MemorySnapshotResponse
+
+# tracemalloc 统计中排除的内部分配
+TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+
+class CpuProfiler:
+    """
+    统计采样 CPU 分析
+    1. 分析期间由独立线程按 profile_interval 读取目标线程的当前堆栈，不修改被分析的代码，未触发时没有任何开销
+    2. 结果为 collapsed 格式("函数;函数;函数 次数")，可直接交给 flamegraph.pl / speedscope，也可渲染为 SVG 火焰图
+    3. 同一时间只允许一个分析任务
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def run(self, seconds: float, thread_ids: Optional[List[int]] = None) -> Counter:
+        """采样 seconds 秒，thread_ids 为空时采样除自身外的全部线程"""
+        if not self.lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="已有正在进行的 CPU 分析")
+        try:
+            return self.sample(min(seconds, settings.profile_max_seconds), thread_ids)
+        finally:
+            self.lock.release()
+
+    @staticmethod
+    def sample(seconds: float, thread_ids: Optional[List[int]]) -> Counter:
+        stacks: Counter = Counter()
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (thread_ids and thread_id not in thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(settings.profile_interval)
+        return stacks
+
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def flamegraph(stacks: Counter, title: str = "CPU") -> str:
+    """将采样结果渲染为自包含的 SVG 火焰图，宽度按采样次数分配，鼠标悬停显示完整帧与占比"""
+    width, row = 1200, 16
+    # 前缀树: 帧 -> (次数, 子节点)
+    root: Dict[str, list] = {}
+    total = sum(stacks.values()) or 1
+    depth = 0
+    for stack, count in stacks.items():
+        node = root
+        frames = stack.split(";")
+        depth = max(depth, len(frames))
+        for frame in frames:
+            entry = node.setdefault(frame, [0, {}])
+            entry[0] += count
+            node = entry[1]
+    height = (depth + 2) * row
+    rects: List[str] = []
+
+    def draw(node: Dict[str, list], x: float, level: int):
+        for frame, (count, children) in sorted(node.items()):
+            w = count / total * width
+            if w >= 0.5:
+                y = height - (level + 2) * row
+                # 按帧名取固定的暖色，同一个函数在各处颜色相同
+                hue = 10 + zlib.crc32(frame.encode('utf-8')) % 40
+                label = html.escape(frame)
+                # 按等宽字体估算可显示的字符数，放不下时截断
+                chars = int(w / 7)
+                text = label if len(frame) <= chars else html.escape(frame[:chars - 2]) + ".." if chars > 3 else ""
+                rects.append(
+                    f'<g><title>{label} ({count} 次, {count / total:.2%})</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="hsl({hue},90%,60%)"/>'
+                    f'<text x="{x + 3:.1f}" y="{y + row - 4}">{text}</text></g>'
+                )
+                draw(children, x, level + 1)
+            x += w
+
+    draw(root, 0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">'
+        f'<text x="{width / 2}" y="{row}" text-anchor="middle" font-size="14">{html.escape(title)}，共 {total} 个样本</text>'
+        + "".join(rects) + "</svg>"
+    )
+
+
+class MemoryProfiler:
+    """
+    tracemalloc 内存快照
+    1. 默认不开启，开启后每次分配都会记录调用栈，有明显开销，排查完成后应关闭
+    2. 每次快照与上一次快照比较，增长最多的位置通常就是泄漏点
+    """
+
+    def __init__(self):
+        self.previous: Optional[tracemalloc.Snapshot] = None
+
+    def start(self, frames: int):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def snapshot(self, key: str, limit: int) -> MemorySnapshotResponse:
+        """获取快照，返回占用最多的位置以及相对上一次快照增长最多的位置"""
+        if not tracemalloc.is_tracing():
+            raise HTTPException(status_code=409, detail="tracemalloc 未开启")
+        snapshot = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        top = [self.stat(s.traceback, s.size, s.count) for s in snapshot.statistics(key)[:limit]]
+        diff = []
+        if self.previous is not None:
+            diff = [
+                self.stat(s.traceback, s.size, s.count, s.size_diff, s.count_diff)
+                for s in snapshot.compare_to(self.previous, key)[:limit]
+            ]
+        self.previous = snapshot
+        return MemorySnapshotResponse(traced=current, peak=peak, top=top, diff=diff)
+
+    @staticmethod
+    def stat(traceback: tracemalloc.Traceback, size: int, count: int, size_diff: int = 0, count_diff: int = 0) -> MemoryStat:
+        return MemoryStat(
+            location=[f"{frame.filename}:{frame.lineno}" for frame in traceback],
+            size=size,
+            count=count,
+            size_diff=size_diff,
+            count_diff=count_diff
+        )
+
+
+cpu_profiler = CpuProfiler()
+memory_profiler = MemoryProfiler()
+
+__all__ = [
+    "CpuProfiler",
+    "MemoryProfiler",
+    "cpu_profiler",
+    "memory_profiler",
+    "collapsed",
+    "flamegraph"
+]
@@ -0,0 +1,161 @@
+import json
+import uuid
+from types import MappingProxyType
+from typing import Optional, List, Dict, Mapping
+from src.pool.session_pool import DoubaoSession
+
+# 所有上游请求统一使用的网页版本与浏览器标识(与当前网页版一致)
+PC_VERSION = "3.3.5"
+VERSION_CODE = "20800"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36"
+
+COMPLETION_URL = "https://www.doubao.com/samantha/chat/completion"
+DELETE_URL = "https://www.doubao.com/samantha/thread/delete"
+PREPARE_UPLOAD_URL = "https://www.doubao.com/alice/resource/prepare_upload"
+
+# imagex / TOS 请求与会话无关的请求头
+IMAGEX_HEADERS: Mapping[str, str] = MappingProxyType({
+    "origin": "https://www.doubao.com",
+    "referer": "https://www.doubao.com/",
+    "user-agent": USER_AGENT,
+})
+TOS_HEADERS: Mapping[str, str] = MappingProxyType({
+    "origin": "https://www.doubao.com",
+    "referer": "https://www.doubao.com/",
+    "host": "tos-d-x-hl.snssdk.com",
+    "content-type": "application/octet-stream",
+    "content-disposition": 'attachment; filename="undefined"',
+})
+
+
+def _encode_options() -> Dict[tuple, bytes]:
+    """completion_option 只有三个可变的布尔值，预先序列化全部组合"""
+    options = {}
+    for need_create in (False, True):
+        for use_auto_cot in (False, True):
+            for use_deep_think in (False, True):
+                options[(need_create, use_auto_cot, use_deep_think)] = json.dumps({
+                    "is_regen": False,
+                    "with_suggest": False,
+                    "need_create_conversation": need_create,
+                    "launch_stage": 1,
+                    "use_auto_cot": use_auto_cot,
+                    "use_deep_think": use_deep_think
+                }, separators=(',', ':')).encode('utf-8')
+    return options
+
+
+COMPLETION_OPTIONS = _encode_options()
+
+
+class SessionRequestBuilder:
+    """
+    单个 DoubaoSession 的上游请求构造器
+    1. 查询参数与请求头在会话加载时计算一次，之后只读复用
+    2. 对话补全请求体由预先序列化的片段拼接，每次只序列化提示词、对话字段与 local id
+    """
+
+    def __init__(self, session: DoubaoSession):
+        self.params = "&".join([
+            "aid=497858",
+            f"device_id={session.device_id}",
+            "device_platform=web",
+            "language=zh",
+            f"pc_version={PC_VERSION}",
+            "pkg_type=release_version",
+            "real_aid=497858",
+            "region=CN",
+            "samantha_web=1",
+            "sys_region=CN",
+            f"tea_uuid={session.tea_uuid}",
+            "use-olympus-account=1",
+            f"version_code={VERSION_CODE}",
+            f"web_id={session.web_id}"
+        ])
+        self.completion_url = f"{COMPLETION_URL}?{self.params}"
+        self.delete_url = f"{DELETE_URL}?{self.params}"
+        self.prepare_upload_url = f"{PREPARE_UPLOAD_URL}?{self.params}"
+        self.completion_headers: Mapping[str, str] = MappingProxyType({
+            'content-type': 'application/json',
+            'accept': 'text/event-stream',
+            'agw-js-conv': 'str',
+            'cookie': session.cookie,
+            'origin': "https://www.doubao.com",
+            'referer': f"https://www.doubao.com/chat/{session.room_id}",
+            'user-agent': USER_AGENT,
+            "x-flow-trace": session.x_flow_trace
+        })
+        self.upload_headers: Mapping[str, str] = MappingProxyType({
+            'content-type': 'application/json',
+            'cookie': session.cookie,
+            'origin': "https://www.doubao.com",
+            'referer': "https://www.doubao.com/chat/",
+            'user-agent': USER_AGENT
+        })
+        self.delete_headers: Mapping[str, str] = MappingProxyType({
+            'content-type': 'application/json',
+            'cookie': session.cookie,
+            'origin': "https://www.doubao.com",
+            'user-agent': USER_AGENT
+        })
+
+    def completion_body(
+        self,
+        prompt: str,
+        guest: bool,
+        conversation_id: Optional[str] = None,
+        section_id: Optional[str] = None,
+        attachments: List[dict] = [],
+        use_auto_cot: bool = False,
+        use_deep_think: bool = False
+    ) -> bytes:
+        """序列化对话补全请求体"""
+        parts = [
+            b'{"completion_option":',
+            COMPLETION_OPTIONS[(conversation_id is None, use_auto_cot, use_deep_think)],
+            b',"conversation_id":',
+            json.dumps("0" if conversation_id is None else conversation_id).encode('utf-8'),
+            b',"messages":[{"content":',
+            json.dumps(json.dumps({"text": prompt})).encode('utf-8'),
+            b',"content_type":2001,"attachments":',
+            json.dumps(attachments, separators=(',', ':')).encode('utf-8') if attachments else b'[]',
+            b',"references":[]}]'
+        ]
+        if section_id is not None:
+            parts += [b',"section_id":', json.dumps(section_id).encode('utf-8')]
+        # 如果是未登录账户，则不需要 local 字段
+        if not guest:
+            parts += [
+                b',"local_conversation_id":"local_',
+                str(uuid.uuid4().int % 10000000000000000).encode('ascii'),
+                b'","local_message_id":"',
+                str(uuid.uuid4()).encode('ascii'),
+                b'"'
+            ]
+        parts.append(b'}')
+        return b"".join(parts)
+
+    def delete_request(self, conversation_id: str) -> tuple[Dict[str, str], bytes]:
+        """删除对话的请求头与请求体"""
+        headers = {**self.delete_headers, "referer": "https://www.doubao.com/chat/" + conversation_id}
+        return headers, b'{"conversation_id":' + json.dumps(conversation_id).encode('utf-8') + b'}'
+
+
+# session.key -> SessionRequestBuilder
+builders: Dict[str, SessionRequestBuilder] = {}
+
+
+def get_builder(session: DoubaoSession) -> SessionRequestBuilder:
+    """获取会话的请求构造器，首次使用时构造并缓存"""
+    if (builder := builders.get(session.key)) is None:
+        builder = builders[session.key] = SessionRequestBuilder(session)
+    return builder
+
+
+__all__ = [
+    "SessionRequestBuilder",
+    "IMAGEX_HEADERS",
+    "TOS_HEADERS",
+    "USER_AGENT",
+    "get_builder"
+]
@@ -0,0 +1,192 @@
+import os
+import socket
+import asyncio
+import hashlib
+import binascii
+import ipaddress
+import tempfile
+from typing import Optional, AsyncIterator, BinaryIO
+from urllib.parse import urlparse, urljoin, unquote
+import aiohttp
+from aiohttp.resolver import ThreadedResolver
+from fastapi import HTTPException
+from src.config import settings
+from .doubao_service import upload_file, upload_stream
+
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+
+class UploadDigest:
+    """边读取边累计文件大小与校验值，超过 upload_max_size 时中止"""
+
+    def __init__(self):
+        self.size = 0
+        self.crc32 = 0
+        self.md5 = hashlib.md5()
+
+    def update(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > settings.upload_max_size:
+            raise HTTPException(status_code=413, detail=f"文件超过大小限制 {settings.upload_max_size} 字节")
+        self.crc32 = binascii.crc32(chunk, self.crc32)
+        self.md5.update(chunk)
+
+    @property
+    def crc32_hex(self) -> str:
+        return format(self.crc32 & 0xFFFFFFFF, '08x')
+
+
+async def read_chunks(file: BinaryIO) -> AsyncIterator[bytes]:
+    """在线程中分块读取文件，避免磁盘读取阻塞事件循环"""
+    while chunk := await asyncio.to_thread(file.read, CHUNK_SIZE):
+        yield chunk
+
+
+def resolve_local_path(path: str) -> str:
+    """本地文件必须位于 upload_local_dirs 列出的目录之下，会访问文件系统，需在线程中调用"""
+    roots = [os.path.realpath(root) for root in filter(None, (d.strip() for d in settings.upload_local_dirs.split(",")))]
+    real = os.path.realpath(path)
+    if not any(os.path.commonpath([real, root]) == root for root in roots):
+        raise HTTPException(status_code=403, detail=f"不允许读取该路径: {path}")
+    if not os.path.isfile(real):
+        raise HTTPException(status_code=404, detail=f"文件不存在: {path}")
+    if os.path.getsize(real) > settings.upload_max_size:
+        raise HTTPException(status_code=413, detail=f"文件超过大小限制 {settings.upload_max_size} 字节")
+    return real
+
+
+async def upload_local(file_type: int, path: str, file_name: str):
+    # 解析符号链接、检查文件与打开文件都会访问磁盘，在线程中执行
+    real = await asyncio.to_thread(resolve_local_path, path)
+    with await asyncio.to_thread(open, real, 'rb') as file:
+        if file_type == 2:
+            # 图片需要解码后重新编码，整体读入后走 upload_file
+            return await upload_file(file_type, file_name, await asyncio.to_thread(file.read))
+        digest = UploadDigest()
+        async for chunk in read_chunks(file):
+            digest.update(chunk)
+
+        def chunks():
+            file.seek(0)
+            return read_chunks(file)
+
+        return await upload_stream(file_type, file_name, digest.size, digest.crc32_hex, digest.md5.hexdigest(), chunks)
+
+
+def is_public_address(host: str) -> bool:
+    """是否为公网地址，私有、回环、链路本地、保留与组播地址都不是"""
+    try:
+        address = ipaddress.ip_address(host.split("%", 1)[0])
+    except ValueError:
+        return False
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+def check_remote_url(url: str):
+    """下载地址只能是 http(s)，直接写 IP 的地址必须是公网地址"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise HTTPException(status_code=400, detail=f"不支持的地址: {url}")
+    if settings.upload_url_allow_private:
+        return
+    try:
+        ipaddress.ip_address(parsed.hostname.split("%", 1)[0])
+    except ValueError:
+        # 域名在连接时由 PublicResolver 检查解析结果
+        return
+    if not is_public_address(parsed.hostname):
+        raise HTTPException(status_code=403, detail=f"不允许访问内网地址: {parsed.hostname}")
+
+
+class PublicResolver(ThreadedResolver):
+    """只返回公网地址的 DNS 解析，连接使用的就是检查过的地址，不受 DNS 重绑定影响"""
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET):
+        hosts = await super().resolve(host, port, family)
+        if settings.upload_url_allow_private:
+            return hosts
+        if not (public := [h for h in hosts if is_public_address(h["host"])]):
+            raise HTTPException(status_code=403, detail=f"不允许访问内网地址: {host}")
+        return public
+
+
+async def open_remote(session: aiohttp.ClientSession, url: str) -> aiohttp.ClientResponse:
+    """请求远程文件，逐跳检查重定向地址"""
+    for _ in range(MAX_REDIRECTS + 1):
+        check_remote_url(url)
+        response = await session.get(url, allow_redirects=False)
+        if response.status not in REDIRECT_STATUS:
+            return response
+        location = response.headers.get("Location")
+        response.release()
+        if not location:
+            raise HTTPException(status_code=502, detail=f"下载文件失败: {response.status} 缺少重定向地址")
+        url = urljoin(url, location)
+    raise HTTPException(status_code=502, detail=f"下载文件失败: 重定向超过 {MAX_REDIRECTS} 次")
+
+
+async def upload_remote(file_type: int, url: str, file_name: str):
+    """
+    下载远程文件并转存
+    1. 只允许访问公网地址(upload_url_allow_private 关闭时)，重定向的每一跳都重新检查
+    2. 内容超过 upload_spool_size 的部分写入临时文件而不是保存在内存中，写入磁盘在线程中执行
+    """
+    timeout = aiohttp.ClientTimeout(total=settings.upload_url_timeout, connect=settings.upstream_connect_timeout)
+    digest = UploadDigest()
+    with tempfile.SpooledTemporaryFile(max_size=settings.upload_spool_size) as spool:
+        try:
+            connector = aiohttp.TCPConnector(resolver=PublicResolver())
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                async with await open_remote(session, url) as response:
+                    if response.status != 200:
+                        raise HTTPException(status_code=502, detail=f"下载文件失败: {response.status}")
+                    if (response.content_length or 0) > settings.upload_max_size:
+                        raise HTTPException(status_code=413, detail=f"文件超过大小限制 {settings.upload_max_size} 字节")
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        digest.update(chunk)
+                        # 未超过内存阈值时只是写入内存缓冲，超过后(包括转为临时文件的那一次)写入磁盘
+                        if digest.size > settings.upload_spool_size:
+                            await asyncio.to_thread(spool.write, chunk)
+                        else:
+                            spool.write(chunk)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"下载文件超时: {url}")
+        except aiohttp.ClientError as e:
+            raise HTTPException(status_code=502, detail=f"下载文件失败: {str(e)}")
+        spool.seek(0)
+        if file_type == 2:
+            return await upload_file(file_type, file_name, await asyncio.to_thread(spool.read))
+
+        def chunks():
+            spool.seek(0)
+            return read_chunks(spool)
+
+        return await upload_stream(file_type, file_name, digest.size, digest.crc32_hex, digest.md5.hexdigest(), chunks)
+
+
+async def upload_from_url(file_type: int, url: str, file_name: Optional[str] = None):
+    """
+    从 URL 或服务器本地路径转存文件到豆包服务器
+    1. http(s) 地址边下载边计算校验值，本地路径(或 file://)需位于 upload_local_dirs 之下
+    2. 文件名未指定时取 URL 路径的最后一段
+    """
+    parsed = urlparse(url)
+    file_name = file_name or os.path.basename(unquote(parsed.path))
+    if not file_name:
+        raise HTTPException(status_code=400, detail="无法从地址中获取文件名，请指定 file_name")
+    if parsed.scheme in ("http", "https"):
+        return await upload_remote(file_type, url, file_name)
+    if parsed.scheme == "file":
+        return await upload_local(file_type, unquote(parsed.path), file_name)
+    if not parsed.scheme and os.path.isabs(url):
+        return await upload_local(file_type, url, file_name)
+    raise HTTPException(status_code=400, detail=f"不支持的地址: {url}")
+
+
+__all__ = [
+    "upload_from_url"
+]
@@ -0,0 +1,138 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from loguru import logger
+from src.config import settings
+
+try:
+    from opentelemetry import trace, propagate
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+
+
+class NoopSpan:
+    """未安装 opentelemetry 时使用的空 span"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_exception(self, exception: BaseException):
+        pass
+
+    def set_status(self, *args, **kwargs):
+        pass
+
+    def update_name(self, name: str):
+        pass
+
+    def is_recording(self) -> bool:
+        return False
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracing:
+    """
+    OpenTelemetry 链路追踪(可选依赖)
+    1. 未配置 tracing_exporter 或未安装 opentelemetry-sdk 时所有 span 都是空操作，几乎没有开销
+    2. span 由 BatchSpanProcessor 在后台线程中批量导出，不阻塞事件循环
+    3. 请求入口的 span 由 TracingMiddleware 通过 server_span() 创建，继承请求头 traceparent 中调用方(包括转发请求的其他节点)的链路
+    4. span() 会设为当前 span，只能包住不跨越 yield 的代码；异步生成器中跨越 yield 的 span 使用 start_span() 并显式结束
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.tracer = trace.get_tracer("doubao") if trace else None
+
+    def setup(self):
+        exporter_name = settings.tracing_exporter
+        if not exporter_name or trace is None:
+            return
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        except ImportError:
+            return logger.warning("未安装 opentelemetry-sdk，链路追踪未开启")
+        if exporter_name == "otlp":
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            except ImportError:
+                return logger.warning("未安装 opentelemetry-exporter-otlp-proto-http，链路追踪未开启")
+            exporter = OTLPSpanExporter(endpoint=settings.tracing_otlp_endpoint)
+        elif exporter_name.startswith("file:"):
+            exporter = ConsoleSpanExporter(out=open(exporter_name[5:], 'a', encoding='utf-8'))
+        else:
+            exporter = ConsoleSpanExporter()
+        provider = TracerProvider(resource=Resource.create({"service.name": settings.tracing_service_name}))
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        self.tracer = trace.get_tracer("doubao")
+        self.enabled = True
+        logger.info(f"链路追踪已开启，导出方式: {exporter_name}")
+
+    def shutdown(self):
+        """导出剩余的 span"""
+        if self.enabled:
+            trace.get_tracer_provider().shutdown()
+
+    @contextmanager
+    def span(self, name: str, parent=None, **attributes) -> Iterator[Any]:
+        """创建并设为当前 span，parent 为空时以当前 span 为父级，异常会记录到 span 上"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        with self.tracer.start_as_current_span(name, context=context, attributes=attributes) as span:
+            yield span
+
+    @contextmanager
+    def server_span(self, name: str, headers: Dict[str, str], **attributes) -> Iterator[Any]:
+        """请求入口的 span，从请求头中恢复调用方的链路作为父级"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        context = propagate.extract(headers)
+        with self.tracer.start_as_current_span(name, context=context, kind=SpanKind.SERVER, attributes=attributes) as span:
+            yield span
+
+    def start_span(self, name: str, parent=None, **attributes):
+        """创建不设为当前的 span，需调用 end_span 结束"""
+        if not self.enabled:
+            return NOOP_SPAN
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        return self.tracer.start_span(name, context=context, attributes=attributes)
+
+    @staticmethod
+    def end_span(span, error: Optional[BaseException] = None):
+        """结束 span，已结束的 span 不重复结束"""
+        if not span.is_recording():
+            return
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, str(error)))
+        span.end()
+
+    @staticmethod
+    def mark_error(span, description: str):
+        """将 span 标记为错误(没有对应异常时，如返回 5xx 响应)"""
+        if span.is_recording():
+            span.set_status(Status(StatusCode.ERROR, description))
+
+    def inject(self, headers: Dict[str, str]) -> Dict[str, str]:
+        """将当前链路写入发往其他节点的请求头"""
+        if self.enabled:
+            propagate.inject(headers)
+        return headers
+
+
+tracing = Tracing()
+
+__all__ = [
+    "Tracing",
+    "tracing"
+]